@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк fetch_vacancies против локальной замены hh.ru.
+
+N пользователей одновременно делают по несколько поисков; в конце
+печатаются пропускная способность, перцентили задержки и счётчики
+клиента hh.ru. Примеры:
+
+    python bench_hh_fetch.py --users 50 --requests 5 --latency 0.05
+    python bench_hh_fetch.py --queries 1000 --throttle-rate 0.05
+    HH_API_BASE=http://127.0.0.1:8001 python bench_hh_fetch.py --http
+"""
+import argparse
+import asyncio
+import time
+from typing import Any, Dict, List
+
+from fake_hh_server import FakeHH
+from services import hh_service
+from services.rate_limiter import TokenBucket
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Перцентиль методом ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[int(rank) - 1]
+
+
+async def run_benchmark(
+    fake: FakeHH,
+    users: int,
+    requests: int,
+    queries: int,
+    max_results: int,
+    http: bool = False,
+) -> Dict[str, Any]:
+    """
+    Запускает users корутин, каждая делает requests поисков по кругу
+    из queries разных запросов. Повторы одного запроса попадают в кэш
+    и объединяются с уже идущей загрузкой — как в боте.
+    """
+    hh_service.vacancies_cache.clear()
+    hh_service.set_persistent_store(None)
+    hh_service.set_http_client(hh_service.create_http_client() if http else fake.client())
+    metrics_before = dict(hh_service.hh_metrics)
+    latencies: List[float] = []
+    failures = 0
+
+    async def user(user_index: int) -> None:
+        nonlocal failures
+        for request_index in range(requests):
+            query = (user_index * requests + request_index) % queries
+            filters = {"position": f"Python {query}", "city": "Москва"}
+            started = time.perf_counter()
+            vacancies = await hh_service.fetch_vacancies(filters, max_results=max_results)
+            latencies.append(time.perf_counter() - started)
+            if not vacancies:
+                failures += 1
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(user(i) for i in range(users)))
+    finally:
+        await hh_service.close_http_client()
+    elapsed = time.perf_counter() - started
+
+    report = {
+        "searches": len(latencies),
+        "failures": failures,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_ms": round(max(latencies, default=0.0) * 1000, 1),
+        "hh_metrics": {key: hh_service.hh_metrics[key] - metrics_before.get(key, 0) for key in hh_service.hh_metrics},
+        "rate_limiter": hh_service.hh_rate_limiter.stats(),
+    }
+    if not http:
+        report["upstream"] = fake.stats()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк загрузки вакансий hh.ru")
+    parser.add_argument("--users", type=int, default=20, help="одновременных пользователей")
+    parser.add_argument("--requests", type=int, default=5, help="поисков на пользователя")
+    parser.add_argument("--queries", type=int, default=20, help="разных поисковых запросов")
+    parser.add_argument("--max-results", type=int, default=hh_service.HH_MAX_RESULTS)
+    parser.add_argument("--found", type=int, default=250, help="вакансий в выдаче")
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка ответа hh.ru, с")
+    parser.add_argument("--jitter", type=float, default=0.02, help="случайная добавка к задержке, с")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--retry-after", type=int, default=0)
+    parser.add_argument("--rate", type=float, default=hh_service.HH_RATE_LIMIT, help="лимит запросов в секунду")
+    parser.add_argument("--burst", type=float, default=hh_service.HH_RATE_BURST)
+    parser.add_argument("--http", action="store_true", help="ходить по сети на HH_API_BASE (fake_hh_server.py)")
+    args = parser.parse_args()
+
+    hh_service.hh_rate_limiter = TokenBucket(rate=args.rate, capacity=args.burst)
+    fake = FakeHH(
+        found=args.found,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+    )
+    report = asyncio.run(run_benchmark(
+        fake,
+        users=args.users,
+        requests=args.requests,
+        queries=args.queries,
+        max_results=args.max_results,
+        http=args.http,
+    ))
+    for key, value in report.items():
+        print(f"{key:>16}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,6 @@
+import asyncio
 import os
+from contextlib import asynccontextmanager
 
 import asyncpg
 from dotenv import load_dotenv
@@ -17,14 +19,64 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if DATABASE_URL:
     pass
 
+# Пул соединений: новое соединение к Neon (TCP + TLS + аутентификация)
+# стоит десятки–сотни миллисекунд, поэтому соединения переиспользуются.
+# DB_STATEMENT_CACHE_SIZE — кэш подготовленных запросов на соединение;
+# 0, если подключение идёт через pgbouncer в режиме transaction.
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+# Сколько секунд простаивающее соединение живёт в пуле
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+
+_pool: asyncpg.Pool | None = None
+_pool_lock = asyncio.Lock()
+
+
+async def create_pool() -> asyncpg.Pool:
+    """Создаёт пул соединений (при старте приложения); повторный вызов вернёт тот же пул"""
+    global _pool
+    async with _pool_lock:
+        if _pool is None:
+            if not DATABASE_URL:
+                raise RuntimeError("❌ DATABASE_URL не задан в .env")
+            _pool = await asyncpg.create_pool(
+                DATABASE_URL,
+                min_size=DB_POOL_MIN_SIZE,
+                max_size=DB_POOL_MAX_SIZE,
+                statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+                max_inactive_connection_lifetime=DB_POOL_MAX_IDLE,
+            )
+    return _pool
+
+
+async def get_pool() -> asyncpg.Pool:
+    """Пул соединений; скрипты без lifespan получают его при первом запросе"""
+    return _pool if _pool is not None else await create_pool()
+
+
+@asynccontextmanager
+async def acquire():
+    """Соединение из пула на время блока"""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        yield conn
+
+
+async def close_pool() -> None:
+    global _pool
+    if _pool is not None:
+        pool, _pool = _pool, None
+        await pool.close()
+
+
 async def init_db():
     if not DATABASE_URL:
         print(f"{RED}{ERROR} DATABASE_URL не задан в .env{RESET}")
         return False
 
     try:
-        conn = await asyncpg.connect(DATABASE_URL)
-        async with conn:
+        async with acquire() as conn:
             await conn.execute('''
                 CREATE TABLE IF NOT EXISTS users (
                     id SERIAL PRIMARY KEY,
@@ -60,7 +112,144 @@ async def init_db():
                     model TEXT DEFAULT 'gpt-4o-mini'
                 )
             ''')
-        print(f"{GREEN}{SUCCESS} Таблицы users, search_filters и llm_settings готовы{RESET}")
+            # Слот ежедневной рассылки: минута местного дня и часовой пояс;
+            # NULL — слот выбирается по хэшу в окне рассылки
+            await conn.execute('''
+                ALTER TABLE users
+                    ADD COLUMN IF NOT EXISTS digest_minute SMALLINT CHECK (digest_minute BETWEEN 0 AND 1439),
+                    ADD COLUMN IF NOT EXISTS timezone TEXT
+            ''')
+            # Прогоны рассылки по слотам и статус каждого пользователя в них:
+            # после рестарта прогон продолжается с необслуженных (pending)
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS digest_runs (
+                    id SERIAL PRIMARY KEY,
+                    run_date DATE NOT NULL,
+                    slot SMALLINT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'new',
+                    started_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    finished_at TIMESTAMPTZ,
+                    report JSONB,
+                    UNIQUE (run_date, slot)
+                )
+            ''')
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS digest_run_users (
+                    run_id INTEGER NOT NULL REFERENCES digest_runs(id) ON DELETE CASCADE,
+                    telegram_id BIGINT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    PRIMARY KEY (run_id, telegram_id)
+                )
+            ''')
+            # Очередь заданий рассылки: группа пользователей прогона, которую
+            # воркер забирает через FOR UPDATE SKIP LOCKED и арендует до locked_until
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS digest_jobs (
+                    id BIGSERIAL PRIMARY KEY,
+                    run_id INTEGER NOT NULL REFERENCES digest_runs(id) ON DELETE CASCADE,
+                    fingerprint TEXT,
+                    user_ids BIGINT[] NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    locked_by TEXT,
+                    locked_until TIMESTAMPTZ,
+                    last_error TEXT,
+                    report JSONB,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+            ''')
+            await conn.execute('''
+                CREATE INDEX IF NOT EXISTS digest_jobs_claim_idx ON digest_jobs (status, locked_until)
+            ''')
+            # Подборки, подготовленные заранее (загрузка, отсев повторов, текст);
+            # в слот рассылки они только читаются и отправляются
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS prepared_digests (
+                    run_id INTEGER NOT NULL REFERENCES digest_runs(id) ON DELETE CASCADE,
+                    telegram_id BIGINT NOT NULL,
+                    text TEXT NOT NULL,
+                    vacancy_ids TEXT[] NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'ready',
+                    locked_until TIMESTAMPTZ,
+                    prepared_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    delivered_at TIMESTAMPTZ,
+                    PRIMARY KEY (run_id, telegram_id)
+                )
+            ''')
+            await conn.execute('''
+                CREATE INDEX IF NOT EXISTS prepared_digests_status_idx ON prepared_digests (status)
+            ''')
+            # Какие вакансии уже отправлялись пользователю в рассылке
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS user_vacancies (
+                    telegram_id BIGINT NOT NULL,
+                    vacancy_id TEXT NOT NULL,
+                    sent_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    PRIMARY KEY (telegram_id, vacancy_id)
+                )
+            ''')
+            await conn.execute('''
+                CREATE INDEX IF NOT EXISTS user_vacancies_sent_at_idx ON user_vacancies (sent_at)
+            ''')
+            # sent — отправлена в рассылке, skipped — пользователь нажал «Неинтересно»;
+            # в рассылку не попадает ни то, ни другое
+            await conn.execute('''
+                ALTER TABLE user_vacancies ADD COLUMN IF NOT EXISTS status TEXT NOT NULL DEFAULT 'sent'
+            ''')
+            # Вакансии hh.ru: каждая загруженная страница выдачи и карточка
+            # сохраняются одним запросом, повторная загрузка обновляет запись
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS vacancies (
+                    id TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    employer_name TEXT,
+                    area_name TEXT,
+                    alternate_url TEXT,
+                    salary_from INTEGER,
+                    salary_to INTEGER,
+                    salary_currency TEXT,
+                    published_at TIMESTAMPTZ,
+                    description TEXT NOT NULL DEFAULT '',
+                    experience TEXT,
+                    employment TEXT,
+                    fetched_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+            ''')
+            await conn.execute('''
+                CREATE INDEX IF NOT EXISTS vacancies_published_at_idx ON vacancies (published_at DESC)
+            ''')
+            # Сгенерированные резюме и письма: при тех же данных (input_hash —
+            # хэш модели и промпта) текст берётся отсюда, а не из LLM
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS generated_documents (
+                    id BIGSERIAL PRIMARY KEY,
+                    telegram_id BIGINT NOT NULL REFERENCES users(telegram_id) ON DELETE CASCADE,
+                    vacancy_id TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    input_hash TEXT NOT NULL,
+                    model TEXT,
+                    content TEXT NOT NULL,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    UNIQUE (telegram_id, vacancy_id, kind, input_hash)
+                )
+            ''')
+            # Второй уровень кэша ответов hh.ru (services/persistent_cache.py)
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS hh_cache (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    payload BYTEA NOT NULL,
+                    stored_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    expires_at TIMESTAMPTZ NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )
+            ''')
+            await conn.execute('''
+                CREATE INDEX IF NOT EXISTS hh_cache_hot_idx ON hh_cache (namespace, stored_at DESC)
+            ''')
+        print(f"{GREEN}{SUCCESS} Таблицы базы данных готовы{RESET}")
         return True
     except Exception as e:
         print(f"{RED}{ERROR} Ошибка подключения к БД: {e}{RESET}")
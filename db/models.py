@@ -1,21 +1,56 @@
+import json
 import os
 
-import asyncpg
 from dotenv import load_dotenv
 
+from db.database import acquire
+from services.cache import TTLCache
+
 load_dotenv()
 
 # Используем чистый URL: postgresql://...
+# Без DATABASE_URL модуль импортируется (бенчмарк, тесты без БД),
+# а ошибку даёт первый запрос — пул соединений (db/database.py)
 DATABASE_URL = os.getenv("DATABASE_URL")
-if not DATABASE_URL:
-    raise RuntimeError("❌ DATABASE_URL не задан в .env")
 
 # Убираем любую подмену URL — asyncpg работает с postgresql:// напрямую
 
+# Кэш строк пользователя (профиль, фильтры, настройки LLM): они почти
+# не меняются, а читаются на каждый апдейт. Запись через функции ниже
+# сбрасывает кэш сразу; изменения из других процессов видны через TTL.
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+# (таблица, telegram_id) -> строка; None — строки нет
+user_rows_cache = TTLCache(ttl=USER_CACHE_TTL, max_entries=USER_CACHE_MAX_ENTRIES)
+# Счётчик сбросов: чтение, во время которого была запись, не кладёт строку в кэш
+_user_cache_version = 0
+_MISSING = object()
+
+
+async def _get_user_row(table: str, telegram_id: int):
+    """Строка таблицы пользователя: из кэша или из БД (read-through)"""
+    key = (table, telegram_id)
+    row = user_rows_cache.get(key, _MISSING)
+    if row is _MISSING:
+        version = _user_cache_version
+        async with acquire() as conn:
+            record = await conn.fetchrow(f"SELECT * FROM {table} WHERE telegram_id = $1", telegram_id)
+        row = dict(record) if record else None
+        if _user_cache_version == version:
+            user_rows_cache.set(key, row)
+    # Копия: вызывающий код может менять словарь
+    return dict(row) if row is not None else None
+
+
+def invalidate_user_cache(telegram_id: int, *tables: str) -> None:
+    global _user_cache_version
+    _user_cache_version += 1
+    for table in tables or ("users", "search_filters", "llm_settings"):
+        user_rows_cache.pop((table, telegram_id))
+
 
 async def create_or_update_user(data):
-    conn = await asyncpg.connect(DATABASE_URL)
-    try:
+    async with acquire() as conn:
         await conn.execute("""
             INSERT INTO users (telegram_id, full_name, city, desired_position, skills, resume)
             VALUES ($1, $2, $3, $4, $5, $6)
@@ -27,22 +62,15 @@ async def create_or_update_user(data):
                 resume = EXCLUDED.resume
         """, data["telegram_id"], data.get("full_name"), data.get("city"),
            data.get("desired_position"), data.get("skills"), data.get("resume"))
-    finally:
-        await conn.close()
+    invalidate_user_cache(data["telegram_id"], "users")
 
 
 async def get_user(tid):
-    conn = await asyncpg.connect(DATABASE_URL)
-    try:
-        row = await conn.fetchrow("SELECT * FROM users WHERE telegram_id = $1", tid)
-        return dict(row) if row else None
-    finally:
-        await conn.close()
+    return await _get_user_row("users", tid)
 
 
 async def upsert_search_filter(tid, data):
-    conn = await asyncpg.connect(DATABASE_URL)
-    try:
+    async with acquire() as conn:
         await conn.execute("""
             INSERT INTO search_filters (
                 telegram_id, position, city, salary_from, remote, metro,
@@ -61,22 +89,15 @@ async def upsert_search_filter(tid, data):
         """, tid, data.get("position"), data.get("city"), data.get("salary_from"),
            data.get("remote"), data.get("metro"), data.get("freshness_days"),
            data.get("employment"), data.get("experience"), data.get("only_direct_employers"))
-    finally:
-        await conn.close()
+    invalidate_user_cache(tid, "search_filters")
 
 
 async def get_search_filters(tid):
-    conn = await asyncpg.connect(DATABASE_URL)
-    try:
-        row = await conn.fetchrow("SELECT * FROM search_filters WHERE telegram_id = $1", tid)
-        return dict(row) if row else None
-    finally:
-        await conn.close()
+    return await _get_user_row("search_filters", tid)
 
 
 async def upsert_llm_settings(telegram_id: int, data: dict):
-    conn = await asyncpg.connect(DATABASE_URL)
-    try:
+    async with acquire() as conn:
         await conn.execute("""
             INSERT INTO llm_settings (telegram_id, base_url, api_key, model)
             VALUES ($1, $2, $3, $4)
@@ -86,14 +107,484 @@ async def upsert_llm_settings(telegram_id: int, data: dict):
                 api_key = EXCLUDED.api_key,
                 model = EXCLUDED.model
         """, telegram_id, data.get("base_url"), data.get("api_key", ""), data.get("model"))
-    finally:
-        await conn.close()
+    invalidate_user_cache(telegram_id, "llm_settings")
 
 
 async def get_llm_settings(telegram_id: int):
-    conn = await asyncpg.connect(DATABASE_URL)
-    try:
-        row = await conn.fetchrow("SELECT * FROM llm_settings WHERE telegram_id = $1", telegram_id)
-        return dict(row) if row else None
-    finally:
-        await conn.close()
\ No newline at end of file
+    return await _get_user_row("llm_settings", telegram_id)
+
+
+_CONTEXT_TABLES = {"user": "users", "filters": "search_filters", "llm_settings": "llm_settings"}
+
+
+async def get_user_contexts(telegram_ids):
+    """
+    Профиль, фильтры поиска и настройки LLM для многих пользователей:
+    {telegram_id: {"user": ..., "filters": ..., "llm_settings": ...}},
+    отсутствующая строка — None. Что есть в кэше, берётся из него,
+    остальное — одним запросом с LEFT JOIN на всех.
+    """
+    contexts = {}
+    missing = []
+    for telegram_id in dict.fromkeys(telegram_ids):
+        context = {name: user_rows_cache.get((table, telegram_id), _MISSING) for name, table in _CONTEXT_TABLES.items()}
+        if _MISSING in context.values():
+            missing.append(telegram_id)
+        else:
+            contexts[telegram_id] = {name: dict(row) if row is not None else None for name, row in context.items()}
+    if not missing:
+        return contexts
+
+    version = _user_cache_version
+    async with acquire() as conn:
+        records = await conn.fetch("""
+            SELECT k.telegram_id, to_jsonb(u) AS "user", to_jsonb(sf) AS filters, to_jsonb(ls) AS llm_settings
+            FROM unnest($1::bigint[]) AS k(telegram_id)
+            LEFT JOIN users u ON u.telegram_id = k.telegram_id
+            LEFT JOIN search_filters sf ON sf.telegram_id = k.telegram_id
+            LEFT JOIN llm_settings ls ON ls.telegram_id = k.telegram_id
+        """, missing)
+    for record in records:
+        context = {name: json.loads(record[name]) if record[name] is not None else None for name in _CONTEXT_TABLES}
+        if _user_cache_version == version:
+            for name, table in _CONTEXT_TABLES.items():
+                user_rows_cache.set((table, record["telegram_id"]), context[name])
+        contexts[record["telegram_id"]] = {name: dict(row) if row is not None else None for name, row in context.items()}
+    return contexts
+
+
+async def get_user_context(telegram_id: int):
+    """Профиль, фильтры и настройки LLM пользователя за один запрос (или из кэша)"""
+    return (await get_user_contexts([telegram_id]))[telegram_id]
+
+
+async def set_digest_time(telegram_id: int, digest_minute, timezone):
+    """Время рассылки пользователя (минута местного дня); None — автоматический слот"""
+    async with acquire() as conn:
+        await conn.execute("""
+            UPDATE users SET digest_minute = $2, timezone = $3 WHERE telegram_id = $1
+        """, telegram_id, digest_minute, timezone)
+    invalidate_user_cache(telegram_id, "users")
+
+
+# Подписчики рассылки (пользователи с заданным городом), чей слот попадает
+# в [$1, $1 + $2) минут UTC. Слот — выбранное пользователем местное время,
+# переведённое в UTC, а если время не выбрано — один из $5 интервалов окна
+# рассылки, начинающегося в минуту $3 по часовому поясу $4, по хэшу telegram_id.
+_SLOT_SUBSCRIBERS_SQL = """
+    WITH subscribers AS (
+        SELECT sf.telegram_id, CASE
+            WHEN u.digest_minute IS NOT NULL THEN
+                u.digest_minute - EXTRACT(EPOCH FROM
+                    (now() AT TIME ZONE coalesce(u.timezone, $4)) - (now() AT TIME ZONE 'UTC')
+                )::int / 60
+            ELSE
+                $3 - EXTRACT(EPOCH FROM
+                    (now() AT TIME ZONE $4) - (now() AT TIME ZONE 'UTC')
+                )::int / 60
+                + $2 * ((hashtext(sf.telegram_id::text)::bigint & 2147483647) % $5)
+        END AS delivery_minute
+        FROM search_filters sf
+        JOIN users u ON u.telegram_id = sf.telegram_id
+        WHERE sf.city IS NOT NULL
+    )
+    SELECT telegram_id FROM subscribers
+    WHERE mod(mod(delivery_minute - $1, 1440) + 1440, 1440) < $2
+"""
+
+
+async def start_digest_run(
+    run_date,
+    slot_start: int,
+    slot_minutes: int,
+    window_start: int,
+    default_timezone: str,
+    slots: int,
+):
+    """
+    Находит или создаёт прогон рассылки за день и слот. Новый прогон
+    (status = 'new') в той же транзакции запоминает список своих
+    пользователей (pending), чтобы после рестарта досылать именно им.
+    Возвращает (id, status).
+    """
+    async with acquire() as conn:
+        async with conn.transaction():
+            run_id = await conn.fetchval("""
+                INSERT INTO digest_runs (run_date, slot) VALUES ($1, $2)
+                ON CONFLICT (run_date, slot) DO NOTHING
+                RETURNING id
+            """, run_date, slot_start)
+            if run_id is None:
+                row = await conn.fetchrow(
+                    "SELECT id, status FROM digest_runs WHERE run_date = $1 AND slot = $2",
+                    run_date, slot_start,
+                )
+                return row["id"], row["status"]
+            await conn.execute(f"""
+                INSERT INTO digest_run_users (run_id, telegram_id)
+                SELECT $6, telegram_id FROM ({_SLOT_SUBSCRIBERS_SQL}) AS slot_users
+            """, slot_start, slot_minutes, window_start, default_timezone, slots, run_id)
+            return run_id, "new"
+
+
+async def iter_digest_run_users(run_id: int, user_ids=None, batch_size: int = 500):
+    """
+    Ещё не обслуженные пользователи прогона (или только из user_ids)
+    и их фильтры. Строки читаются серверным курсором пачками по
+    batch_size, чтобы не держать в памяти всю таблицу.
+    """
+    async with acquire() as conn:
+        async with conn.transaction():
+            async for row in conn.cursor("""
+                SELECT sf.* FROM digest_run_users r
+                JOIN search_filters sf ON sf.telegram_id = r.telegram_id
+                WHERE r.run_id = $1 AND r.status = 'pending'
+                  AND ($2::bigint[] IS NULL OR r.telegram_id = ANY($2::bigint[]))
+                ORDER BY r.telegram_id
+            """, run_id, user_ids, prefetch=batch_size):
+                yield dict(row)
+
+
+async def save_prepared_digests(run_id: int, statuses: dict, digests: dict):
+    """
+    Сохраняет подготовленные подборки (digests: telegram_id → (текст,
+    id вакансий)) и итог подготовки по пользователям прогона — в одной
+    транзакции, чтобы пользователь не остался prepared без подборки.
+    Повторная подготовка заменяет только ещё не отправленную подборку:
+    отправляемая, доставленная или не доставленная остаётся как есть.
+    """
+    async with acquire() as conn:
+        async with conn.transaction():
+            if digests:
+                await conn.executemany("""
+                    INSERT INTO prepared_digests (run_id, telegram_id, text, vacancy_ids)
+                    VALUES ($1, $2, $3, $4)
+                    ON CONFLICT (run_id, telegram_id) DO UPDATE SET
+                        text = EXCLUDED.text,
+                        vacancy_ids = EXCLUDED.vacancy_ids,
+                        prepared_at = now()
+                    WHERE prepared_digests.status = 'ready'
+                """, [
+                    (run_id, telegram_id, text, list(vacancy_ids))
+                    for telegram_id, (text, vacancy_ids) in digests.items()
+                ])
+            await conn.execute("""
+                UPDATE digest_run_users r SET status = t.status, updated_at = now()
+                FROM unnest($2::bigint[], $3::text[]) AS t(telegram_id, status)
+                WHERE r.run_id = $1 AND r.telegram_id = t.telegram_id
+            """, run_id, list(statuses), list(statuses.values()))
+
+
+async def claim_due_digests(lease_seconds: float, limit: int):
+    """
+    Забирает до limit готовых подборок, чьё время доставки (день и слот
+    прогона, UTC) наступило, — не старше суток. Подборка, застрявшая
+    в sending дольше аренды (процесс упал), выдаётся снова.
+    """
+    async with acquire() as conn:
+        rows = await conn.fetch("""
+            UPDATE prepared_digests p SET
+                status = 'sending',
+                locked_until = now() + make_interval(secs => $1)
+            WHERE (p.run_id, p.telegram_id) IN (
+                SELECT d.run_id, d.telegram_id FROM prepared_digests d
+                JOIN digest_runs r ON r.id = d.run_id
+                WHERE (d.status = 'ready' OR (d.status = 'sending' AND d.locked_until < now()))
+                  AND (r.run_date + make_interval(mins => r.slot)) AT TIME ZONE 'UTC'
+                      BETWEEN now() - interval '1 day' AND now()
+                ORDER BY r.run_date, r.slot, d.telegram_id
+                LIMIT $2
+                FOR UPDATE OF d SKIP LOCKED
+            )
+            RETURNING p.run_id, p.telegram_id, p.text
+        """, lease_seconds, limit)
+        return [dict(row) for row in rows]
+
+
+async def save_delivery_statuses(deliveries):
+    """
+    deliveries — тройки (run_id, telegram_id, sent | failed). Вакансии
+    доставленных подборок в той же транзакции записываются в
+    user_vacancies: в следующие подборки попадут только новые, а
+    вакансии не доставленной подборки останутся доступными.
+    """
+    async with acquire() as conn:
+        async with conn.transaction():
+            await conn.execute("""
+                UPDATE prepared_digests p SET
+                    status = t.status,
+                    locked_until = NULL,
+                    delivered_at = CASE WHEN t.status = 'sent' THEN now() END
+                FROM unnest($1::int[], $2::bigint[], $3::text[]) AS t(run_id, telegram_id, status)
+                WHERE p.run_id = t.run_id AND p.telegram_id = t.telegram_id
+            """, *(list(column) for column in zip(*deliveries)))
+            sent = [(run_id, telegram_id) for run_id, telegram_id, status in deliveries if status == "sent"]
+            if sent:
+                await conn.execute("""
+                    INSERT INTO user_vacancies (telegram_id, vacancy_id)
+                    SELECT p.telegram_id, unnest(p.vacancy_ids)
+                    FROM prepared_digests p
+                    JOIN unnest($1::int[], $2::bigint[]) AS t(run_id, telegram_id)
+                      ON p.run_id = t.run_id AND p.telegram_id = t.telegram_id
+                    ON CONFLICT (telegram_id, vacancy_id) DO NOTHING
+                """, *(list(column) for column in zip(*sent)))
+
+
+async def enqueue_digest_jobs(run_id: int, jobs):
+    """
+    Ставит задания прогона в очередь digest_jobs: jobs — пары
+    (отпечаток поиска, список telegram_id). Прогон переходит в running
+    в той же транзакции, так что задания не создаются дважды.
+    """
+    async with acquire() as conn:
+        async with conn.transaction():
+            status = await conn.fetchval(
+                "SELECT status FROM digest_runs WHERE id = $1 FOR UPDATE", run_id
+            )
+            if status != "new":
+                return
+            await conn.executemany("""
+                INSERT INTO digest_jobs (run_id, fingerprint, user_ids) VALUES ($1, $2, $3)
+            """, [(run_id, fingerprint, user_ids) for fingerprint, user_ids in jobs])
+            await conn.execute("UPDATE digest_runs SET status = 'running' WHERE id = $1", run_id)
+
+
+async def claim_digest_jobs(worker_id: str, lease_seconds: float, max_attempts: int, limit: int = 1):
+    """
+    Забирает до limit заданий: ожидающих или с истёкшей арендой (воркер упал).
+    FOR UPDATE SKIP LOCKED позволяет любому числу воркеров разбирать
+    очередь одновременно, не мешая друг другу.
+    """
+    async with acquire() as conn:
+        # Задания, исчерпавшие попытки, больше не выдаются
+        await conn.execute("""
+            UPDATE digest_jobs SET status = 'failed', updated_at = now()
+            WHERE status = 'running' AND locked_until < now() AND attempts >= $1
+        """, max_attempts)
+        rows = await conn.fetch("""
+            UPDATE digest_jobs SET
+                status = 'running',
+                attempts = attempts + 1,
+                locked_by = $1,
+                locked_until = now() + make_interval(secs => $2),
+                updated_at = now()
+            WHERE id IN (
+                SELECT id FROM digest_jobs
+                WHERE status IN ('pending', 'running')
+                  AND coalesce(locked_until, '-infinity') < now()
+                  AND attempts < $3
+                ORDER BY id
+                LIMIT $4
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, run_id, user_ids, attempts
+        """, worker_id, lease_seconds, max_attempts, limit)
+        return [dict(row) for row in rows]
+
+
+async def extend_digest_job_lease(job_id: int, worker_id: str, lease_seconds: float) -> bool:
+    """
+    Продлевает аренду задания, пока воркер его выполняет. False — задание
+    уже не его (аренда истекла и его забрал другой воркер)
+    """
+    async with acquire() as conn:
+        result = await conn.execute("""
+            UPDATE digest_jobs SET locked_until = now() + make_interval(secs => $3), updated_at = now()
+            WHERE id = $1 AND locked_by = $2 AND status = 'running'
+        """, job_id, worker_id, lease_seconds)
+    return result != "UPDATE 0"
+
+
+async def complete_digest_job(job_id: int, worker_id: str, report: dict) -> bool:
+    """Завершает задание, если оно всё ещё за этим воркером"""
+    async with acquire() as conn:
+        result = await conn.execute("""
+            UPDATE digest_jobs SET status = 'done', report = $3::jsonb, locked_until = NULL, updated_at = now()
+            WHERE id = $1 AND locked_by = $2 AND status = 'running'
+        """, job_id, worker_id, json.dumps(report))
+    return result != "UPDATE 0"
+
+
+async def fail_digest_job(job_id: int, worker_id: str, error: str, retry_delay: float, max_attempts: int) -> bool:
+    """
+    Возвращает задание в очередь через retry_delay секунд или помечает failed;
+    задание, которое уже забрал другой воркер, не трогает
+    """
+    async with acquire() as conn:
+        result = await conn.execute("""
+            UPDATE digest_jobs SET
+                status = CASE WHEN attempts >= $5 THEN 'failed' ELSE 'pending' END,
+                last_error = $3,
+                locked_until = now() + make_interval(secs => $4),
+                updated_at = now()
+            WHERE id = $1 AND locked_by = $2 AND status = 'running'
+        """, job_id, worker_id, error, retry_delay, max_attempts)
+    return result != "UPDATE 0"
+
+
+async def finish_digest_run_if_complete(run_id: int):
+    """
+    Закрывает прогон, если у него не осталось незавершённых заданий.
+    Отчёт — сумма отчётов заданий плюс общее время. Возвращает отчёт
+    или None, если прогон ещё идёт (или уже закрыт другим воркером).
+    """
+    async with acquire() as conn:
+        report = await conn.fetchval("""
+            UPDATE digest_runs r SET
+                status = 'done',
+                finished_at = now(),
+                report = coalesce((
+                    SELECT jsonb_object_agg(key, total) FROM (
+                        SELECT key, sum(value::numeric) AS total
+                        FROM digest_jobs j, jsonb_each_text(j.report)
+                        WHERE j.run_id = r.id AND key <> 'duration_seconds'
+                        GROUP BY key
+                    ) AS totals
+                ), '{}'::jsonb) || jsonb_build_object(
+                    'run_id', r.id,
+                    'jobs', (SELECT count(*) FROM digest_jobs WHERE run_id = r.id),
+                    'failed_jobs', (SELECT count(*) FROM digest_jobs WHERE run_id = r.id AND status = 'failed'),
+                    'duration_seconds', round(EXTRACT(EPOCH FROM now() - r.started_at)::numeric, 3)
+                )
+            WHERE r.id = $1 AND r.status = 'running' AND NOT EXISTS (
+                SELECT 1 FROM digest_jobs WHERE run_id = $1 AND status IN ('pending', 'running')
+            )
+            RETURNING report
+        """, run_id)
+        return json.loads(report) if report is not None else None
+
+
+async def get_unfinished_digest_runs(max_age_hours: int = 24):
+    """Прогоны, созданные, но не поставленные в очередь (не старше max_age_hours)"""
+    async with acquire() as conn:
+        rows = await conn.fetch("""
+            SELECT id, run_date, slot FROM digest_runs
+            WHERE status = 'new' AND started_at > now() - make_interval(hours => $1)
+            ORDER BY started_at
+        """, max_age_hours)
+        return [dict(row) for row in rows]
+
+
+async def iter_sent_vacancies(retention_days: int, since=None, batch_size: int = 5000):
+    """
+    Вакансии, которые пользователям не нужно предлагать (для фильтров
+    Блума): отправленные за последние retention_days дней и все пропущенные
+    («Неинтересно»), или только записанные после since. Ничего не удаляет —
+    старые отправки чистит purge_sent_vacancies.
+    """
+    async with acquire() as conn:
+        async with conn.transaction():
+            async for row in conn.cursor("""
+                SELECT telegram_id, vacancy_id, sent_at FROM user_vacancies
+                WHERE (status <> 'sent' OR sent_at >= now() - make_interval(days => $1))
+                  AND ($2::timestamptz IS NULL OR sent_at > $2::timestamptz)
+            """, retention_days, since, prefetch=batch_size):
+                yield row["telegram_id"], row["vacancy_id"], row["sent_at"]
+
+
+async def purge_sent_vacancies(retention_days: int) -> int:
+    """
+    Удаляет отправки рассылки старше retention_days дней; пропущенные
+    пользователем вакансии (status = 'skipped') не трогает. Возвращает
+    число удалённых строк.
+    """
+    async with acquire() as conn:
+        result = await conn.execute("""
+            DELETE FROM user_vacancies
+            WHERE status = 'sent' AND sent_at < now() - make_interval(days => $1)
+        """, retention_days)
+    return int(result.split()[-1])
+
+
+async def find_sent_vacancies(telegram_ids, vacancy_ids):
+    """Какие из пар (пользователь, вакансия) действительно уже отправлялись"""
+    async with acquire() as conn:
+        rows = await conn.fetch("""
+            SELECT uv.telegram_id, uv.vacancy_id
+            FROM unnest($1::bigint[], $2::text[]) AS t(telegram_id, vacancy_id)
+            JOIN user_vacancies uv USING (telegram_id, vacancy_id)
+        """, list(telegram_ids), list(vacancy_ids))
+        return {(row["telegram_id"], row["vacancy_id"]) for row in rows}
+
+
+async def upsert_vacancies(vacancies):
+    """
+    Сохраняет пачку вакансий hh.ru (обычно целую страницу выдачи) одним
+    запросом. Повторная запись той же вакансии обновляет её; пустое
+    описание из выдачи поиска не затирает полное из карточки вакансии.
+    """
+    vacancies = list({vac.id: vac for vac in vacancies}.values())
+    if not vacancies:
+        return
+    async with acquire() as conn:
+        await conn.execute("""
+            INSERT INTO vacancies (
+                id, name, employer_name, area_name, alternate_url, salary_from, salary_to,
+                salary_currency, published_at, description, experience, employment
+            )
+            SELECT t.id, t.name, t.employer_name, t.area_name, t.alternate_url, t.salary_from, t.salary_to,
+                   t.salary_currency, t.published_at::timestamptz, t.description, t.experience, t.employment
+            FROM unnest(
+                $1::text[], $2::text[], $3::text[], $4::text[], $5::text[], $6::int[], $7::int[],
+                $8::text[], $9::text[], $10::text[], $11::text[], $12::text[]
+            ) AS t(
+                id, name, employer_name, area_name, alternate_url, salary_from, salary_to,
+                salary_currency, published_at, description, experience, employment
+            )
+            ON CONFLICT (id) DO UPDATE SET
+                name = EXCLUDED.name,
+                employer_name = EXCLUDED.employer_name,
+                area_name = EXCLUDED.area_name,
+                alternate_url = EXCLUDED.alternate_url,
+                salary_from = EXCLUDED.salary_from,
+                salary_to = EXCLUDED.salary_to,
+                salary_currency = EXCLUDED.salary_currency,
+                published_at = EXCLUDED.published_at,
+                description = coalesce(nullif(EXCLUDED.description, ''), vacancies.description),
+                experience = coalesce(nullif(EXCLUDED.experience, ''), vacancies.experience),
+                employment = coalesce(nullif(EXCLUDED.employment, ''), vacancies.employment),
+                fetched_at = now()
+        """,
+            [vac.id for vac in vacancies],
+            [vac.name for vac in vacancies],
+            [vac.employer_name for vac in vacancies],
+            [vac.area_name for vac in vacancies],
+            [vac.alternate_url for vac in vacancies],
+            [vac.salary_from for vac in vacancies],
+            [vac.salary_to for vac in vacancies],
+            [vac.salary_currency for vac in vacancies],
+            [vac.published_at for vac in vacancies],
+            [vac.description for vac in vacancies],
+            [vac.experience for vac in vacancies],
+            [vac.employment for vac in vacancies],
+        )
+
+
+async def mark_user_vacancy(telegram_id: int, vacancy_id: str, status: str):
+    """Связывает вакансию с пользователем (например, skipped — «Неинтересно»)"""
+    async with acquire() as conn:
+        await conn.execute("""
+            INSERT INTO user_vacancies (telegram_id, vacancy_id, status) VALUES ($1, $2, $3)
+            ON CONFLICT (telegram_id, vacancy_id) DO UPDATE SET status = EXCLUDED.status
+        """, telegram_id, vacancy_id, status)
+
+
+async def get_generated_document(telegram_id: int, vacancy_id: str, kind: str, input_hash: str):
+    """Текст, уже сгенерированный по тем же данным, или None"""
+    async with acquire() as conn:
+        return await conn.fetchval("""
+            SELECT content FROM generated_documents
+            WHERE telegram_id = $1 AND vacancy_id = $2 AND kind = $3 AND input_hash = $4
+        """, telegram_id, vacancy_id, kind, input_hash)
+
+
+async def save_generated_document(telegram_id: int, vacancy_id: str, kind: str, input_hash: str, model: str, content: str):
+    async with acquire() as conn:
+        await conn.execute("""
+            INSERT INTO generated_documents (telegram_id, vacancy_id, kind, input_hash, model, content)
+            VALUES ($1, $2, $3, $4, $5, $6)
+            ON CONFLICT (telegram_id, vacancy_id, kind, input_hash) DO UPDATE SET
+                model = EXCLUDED.model,
+                content = EXCLUDED.content,
+                created_at = now()
+        """, telegram_id, vacancy_id, kind, input_hash, model, content)
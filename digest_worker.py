@@ -0,0 +1,62 @@
+"""
+Отдельный процесс-воркер подготовки рассылки.
+
+Забирает задания из таблицы digest_jobs (их ставит в очередь планировщик
+бота), загружает вакансии и сохраняет готовые подборки в prepared_digests;
+отправляет их сам бот в слот пользователя. Таких процессов можно
+запустить сколько угодно — задания делятся между ними через
+FOR UPDATE SKIP LOCKED:
+
+    python digest_worker.py --workers 4
+"""
+import argparse
+import asyncio
+
+from dotenv import load_dotenv
+
+from db.database import DATABASE_URL, close_pool, create_pool, init_db
+from db.models import upsert_vacancies
+from services.digest_service import DIGEST_WORKERS, digest_worker_id, run_digest_worker
+from services.hh_service import (
+    close_http_client,
+    create_http_client,
+    init_persistent_cache,
+    set_http_client,
+    set_vacancy_sink,
+)
+from services.sent_vacancies import sent_vacancies
+
+
+async def run(workers: int) -> None:
+    await create_pool()
+    await init_db()
+    set_http_client(create_http_client())
+    init_persistent_cache(DATABASE_URL)
+    set_vacancy_sink(upsert_vacancies)
+    await sent_vacancies.ensure_loaded()
+
+    print(f"📧 Воркеры рассылки запущены: {workers}")
+    tasks = [asyncio.create_task(run_digest_worker(digest_worker_id(index))) for index in range(workers)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await close_http_client()
+        await close_pool()
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Воркер подготовки ежедневной рассылки")
+    parser.add_argument("--workers", type=int, default=DIGEST_WORKERS, help="воркеров в процессе")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(max(1, args.workers)))
+    except KeyboardInterrupt:
+        print("⏹️ Воркеры рассылки остановлены")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Локальная замена API hh.ru для тестов и бенчмарков.
+
+Отдаёт сгенерированные страницы поиска, подробности вакансий и
+справочники с настраиваемой задержкой, долей ошибок 5xx и ответов 429.
+Работает двумя способами:
+
+- внутри процесса через httpx.MockTransport (FakeHH.client());
+- как HTTP-сервер: python fake_hh_server.py --port 8001,
+  а в боте HH_API_BASE=http://127.0.0.1:8001
+"""
+import argparse
+import asyncio
+import random
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+# Как и настоящий hh.ru, не отдаём результаты глубже 2000-го
+MAX_DEPTH = 2000
+PUBLISHED_AT_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
+
+
+class FakeHH:
+    """
+    Генератор ответов hh.ru: found вакансий, вакансия i опубликована
+    на i минут раньше момента создания. Случайность детерминирована seed.
+    """
+
+    def __init__(
+        self,
+        found: int = 250,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        retry_after: int = 0,
+        seed: Optional[int] = 0,
+    ):
+        self.found = found
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._now = datetime.now(timezone.utc).replace(microsecond=0)
+        self.requests = 0
+        self.statuses: Counter = Counter()
+
+    def _published_at(self, index: int) -> datetime:
+        return self._now - timedelta(minutes=index)
+
+    def make_item(self, index: int, details: bool = False) -> Dict[str, Any]:
+        item = {
+            "id": str(index),
+            "name": f"Python-разработчик {index}",
+            "employer": {"name": f"Компания {index % 50}"},
+            "area": {"id": "1", "name": "Москва"},
+            "salary": {"from": 100000 + index % 20 * 10000, "to": None, "currency": "RUR"} if index % 3 else None,
+            "alternate_url": f"https://hh.ru/vacancy/{index}",
+            "published_at": self._published_at(index).strftime(PUBLISHED_AT_FORMAT),
+        }
+        if details:
+            item["description"] = f"<p>Вакансия {index}</p><ul><li>Python</li><li>PostgreSQL</li></ul>"
+            item["experience"] = {"id": "between1And3", "name": "От 1 года до 3 лет"}
+            item["employment"] = {"id": "full", "name": "Полная занятость"}
+        return item
+
+    def _search(self, params: Dict[str, str]) -> Tuple[int, Dict[str, Any]]:
+        page = int(params.get("page", 0))
+        per_page = int(params.get("per_page", 20))
+        if (page + 1) * per_page > MAX_DEPTH:
+            return 400, {"errors": [{"type": "bad_argument", "value": "page"}]}
+        found = self.found
+        if "date_from" in params:
+            date_from = datetime.strptime(params["date_from"], PUBLISHED_AT_FORMAT)
+            found = min(found, int((self._now - date_from).total_seconds() // 60) + 1)
+        start = page * per_page
+        items = [self.make_item(i) for i in range(start, min(start + per_page, found))]
+        pages = -(-min(found, MAX_DEPTH) // per_page)
+        return 200, {"items": items, "found": found, "pages": pages, "page": page, "per_page": per_page}
+
+    def respond(self, path: str, params: Dict[str, str]) -> Tuple[int, Dict[str, str], Any]:
+        """Статус, заголовки и тело ответа на запрос к path"""
+        self.requests += 1
+        roll = self._random.random()
+        if roll < self.throttle_rate:
+            return 429, {"Retry-After": str(self.retry_after)}, {"errors": [{"type": "too_many_requests"}]}
+        if roll < self.throttle_rate + self.error_rate:
+            return 503, {}, {"errors": [{"type": "service_unavailable"}]}
+
+        parts = path.strip("/").split("/")
+        if parts == ["vacancies"]:
+            status, body = self._search(params)
+            return status, {}, body
+        if parts[0] == "vacancies" and len(parts) == 2 and parts[1].isdigit():
+            if int(parts[1]) >= self.found:
+                return 404, {}, {"errors": [{"type": "not_found"}]}
+            return 200, {}, self.make_item(int(parts[1]), details=True)
+        if parts == ["areas"]:
+            return 200, {}, [{"id": "113", "name": "Россия", "areas": [{"id": "1", "name": "Москва", "areas": []}]}]
+        if parts[0] == "metro" and len(parts) == 2:
+            station = {"id": "1.1", "name": "Охотный Ряд"}
+            return 200, {}, {"id": parts[1], "name": "Москва", "lines": [{"id": "1", "stations": [station]}]}
+        return 404, {}, {"errors": [{"type": "not_found"}]}
+
+    async def _delay(self) -> None:
+        delay = self.latency + self._random.uniform(0, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        await self._delay()
+        status, headers, body = self.respond(request.url.path, dict(request.url.params))
+        self.statuses[status] += 1
+        return httpx.Response(status, headers=headers, json=body)
+
+    def client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.MockTransport(self.handle))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"requests": self.requests, "statuses": dict(self.statuses)}
+
+
+def create_app(fake: FakeHH):
+    """FastAPI-приложение, которое отдаёт ответы FakeHH по HTTP"""
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse
+
+    app = FastAPI()
+
+    @app.get("/{path:path}")
+    async def proxy(path: str, request: Request):
+        await fake._delay()
+        status, headers, body = fake.respond(path, dict(request.query_params))
+        fake.statuses[status] += 1
+        return JSONResponse(body, status_code=status, headers=headers)
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальная замена API hh.ru")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--found", type=int, default=250)
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка ответа, с")
+    parser.add_argument("--jitter", type=float, default=0.0, help="случайная добавка к задержке, с")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    fake = FakeHH(
+        found=args.found,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+    )
+    uvicorn.run(create_app(fake), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
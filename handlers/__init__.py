@@ -1,5 +1,6 @@
 from aiogram import Dispatcher
 
+from .digest_settings import router as digest_settings_router
 from .llm_settings import router as llm_settings_router
 from .profile import router as profile_router
 from .search_settings import router as search_router
@@ -15,4 +16,5 @@ def setup_handlers(dp: Dispatcher):
     dp.include_router(profile_router)
     dp.include_router(search_router)
     dp.include_router(vacancies_router)
-    dp.include_router(llm_settings_router)
\ No newline at end of file
+    dp.include_router(llm_settings_router)
+    dp.include_router(digest_settings_router)
\ No newline at end of file
@@ -0,0 +1,60 @@
+# handlers/digest_settings.py
+from aiogram import Router, types
+from aiogram.filters import Command, CommandObject
+
+from db.models import get_user, set_digest_time
+from services.digest_service import (
+    DIGEST_TIMEZONE,
+    DIGEST_WINDOW_MINUTES,
+    DIGEST_WINDOW_START,
+    format_clock,
+    is_valid_timezone,
+    parse_clock,
+)
+
+router = Router()
+
+USAGE = (
+    "Использование:\n"
+    "/digest_time 08:30 — время рассылки\n"
+    "/digest_time 08:30 Europe/Berlin — время и часовой пояс\n"
+    "/digest_time auto — любое время в окне рассылки"
+)
+
+
+@router.message(Command("digest_time"))
+async def cmd_digest_time(message: types.Message, command: CommandObject):
+    user_id = getattr(message.from_user, 'id', None)
+    if user_id is None:
+        await message.answer("❌ Не удалось получить ID пользователя")
+        return
+    user = await get_user(user_id)
+    if not user:
+        await message.answer("❌ Сначала зарегистрируйтесь через /start")
+        return
+
+    args = (command.args or "").split()
+    if not args:
+        if user.get("digest_minute") is None:
+            current = f"автоматически, с {DIGEST_WINDOW_START} в течение {DIGEST_WINDOW_MINUTES} мин ({DIGEST_TIMEZONE})"
+        else:
+            current = f"{format_clock(user['digest_minute'])} ({user.get('timezone') or DIGEST_TIMEZONE})"
+        await message.answer(f"🕘 Рассылка приходит: {current}\n\n{USAGE}")
+        return
+
+    if args[0].lower() == "auto":
+        await set_digest_time(user_id, None, None)
+        await message.answer(f"✅ Рассылка будет приходить с {DIGEST_WINDOW_START} в течение {DIGEST_WINDOW_MINUTES} мин")
+        return
+
+    minute = parse_clock(args[0])
+    if minute is None:
+        await message.answer(f"❌ Не удалось распознать время «{args[0]}»\n\n{USAGE}")
+        return
+    timezone = args[1] if len(args) > 1 else user.get("timezone") or DIGEST_TIMEZONE
+    if not is_valid_timezone(timezone):
+        await message.answer(f"❌ Неизвестный часовой пояс «{timezone}» (пример: Europe/Moscow)")
+        return
+
+    await set_digest_time(user_id, minute, timezone)
+    await message.answer(f"✅ Рассылка будет приходить в {format_clock(minute)} ({timezone})")
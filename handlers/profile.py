@@ -62,15 +62,20 @@ async def process_full_name(message: Message, state: FSMContext):
 
 @router.message(ProfileEdit.city)
 async def process_city(message: Message, state: FSMContext):
-    from services.hh_service import CITY_TO_AREA_ID  # Импортируем справочник городов
-    
-    city = message.text or ""
+    from services.hh_dictionaries import resolve_area, suggest_areas  # Справочник регионов hh.ru
+
+    city = (message.text or "").strip()
     # Проверяем, поддерживается ли город
-    if city and city not in CITY_TO_AREA_ID:
-        await message.answer(f"❌ Город '{city}' не поддерживается. Выберите один из поддерживаемых городов: {', '.join(CITY_TO_AREA_ID.keys())[:100]}...")
+    area = resolve_area(city) if city else None
+    if city and area is None:
+        suggestions = ', '.join(a.name for a in suggest_areas(city))
+        hint = f"Возможно, вы имели в виду: {suggestions}" if suggestions else "Проверьте написание названия."
+        await message.answer(f"❌ Город '{city}' не найден. {hint}")
         await state.set_state(ProfileEdit.city)  # Остаемся в том же состоянии
         return
-    
+    if area is not None:
+        city = area.name  # Сохраняем каноническое название
+
     await state.update_data(city=city)
     await message.answer("💼 Новая должность:")
     await state.set_state(ProfileEdit.desired_position)
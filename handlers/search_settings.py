@@ -65,23 +65,9 @@ def yes_no_kb():
     )
 
 def city_kb():
-    cities = [
-        "Москва",
-        "Санкт-Петербург",
-        "Новосибирск",
-        "Екатеринбург",
-        "Казань",
-        "Нижний Новгород",
-        "Челябинск",
-        "Самара",
-        "Омск",
-        "Ростов-на-Дону",
-        "Уфа",
-        "Красноярск",
-        "Воронеж",
-        "Пермь",
-        "Волгоград"
-    ]
+    from services.hh_dictionaries import CITY_TO_AREA_ID  # Популярные города для кнопок
+
+    cities = list(CITY_TO_AREA_ID)
     # Группируем по 2 кнопки в строке
     keyboard = [
         [KeyboardButton(text=cities[i]), KeyboardButton(text=cities[i+1]) if i+1 < len(cities) else KeyboardButton(text="")]
@@ -113,18 +99,21 @@ async def process_position(message: types.Message, state: FSMContext):
 
 @router.message(SearchSettings.city)
 async def process_city(message: types.Message, state: FSMContext):
-    from services.hh_service import CITY_TO_AREA_ID  # Импортируем справочник городов
-    
-    city = message.text or ""
+    from services.hh_dictionaries import resolve_area, suggest_areas  # Справочник регионов hh.ru
+
+    city = (message.text or "").strip()
     # Проверяем, поддерживается ли город
-    if city and city not in CITY_TO_AREA_ID:
-        # Показываем список поддерживаемых городов
-        supported_cities = list(CITY_TO_AREA_ID.keys())
-        cities_list = ', '.join(supported_cities)
-        await message.answer(f"❌ Город '{city}' не поддерживается. Выберите один из поддерживаемых городов:\n{cities_list}")
+    area = resolve_area(city) if city else None
+    if city and area is None:
+        # Показываем похожие города из справочника
+        suggestions = ', '.join(a.name for a in suggest_areas(city))
+        hint = f"Возможно, вы имели в виду: {suggestions}" if suggestions else "Проверьте написание названия."
+        await message.answer(f"❌ Город '{city}' не найден. {hint}", reply_markup=city_kb())
         await state.set_state(SearchSettings.city)  # Остаемся в том же состоянии
         return
-    
+    if area is not None:
+        city = area.name  # Сохраняем каноническое название
+
     await state.update_data(city=city)
     await message.answer("💰 Мин. зарплата (в рублях, число):", reply_markup=None)
     await state.set_state(SearchSettings.salary_from)
@@ -155,7 +144,29 @@ async def process_work_type(message: types.Message, state: FSMContext):
 
 @router.message(SearchSettings.metro)
 async def process_metro(message: types.Message, state: FSMContext):
-    await state.update_data(metro=message.text or "")
+    from services.hh_dictionaries import ensure_metro_index, resolve_area, split_metro_text
+
+    data = await state.get_data()
+    area = resolve_area(data.get("city"))
+    metro_index = await ensure_metro_index(area.id) if area else None
+    if metro_index is None:
+        # Справочник недоступен (нет метро или hh.ru не ответил) — сохраняем
+        # текст как есть, станции распознаются при поиске, когда справочник загрузится
+        await state.update_data(metro=(message.text or "").strip() or None)
+        await message.answer("ℹ️ Справочник метро для этого города сейчас недоступен: станции будут учтены при поиске, если они есть в городе.")
+    else:
+        stations, unknown = [], []
+        for name in split_metro_text(message.text):
+            station = metro_index.resolve(name)
+            if station:
+                stations.append(station)
+            else:
+                unknown.append(name)
+        await state.update_data(metro=", ".join(stations) or None)
+        if stations:
+            await message.answer(f"🚇 Станции: {', '.join(stations)}")
+        if unknown:
+            await message.answer(f"⚠️ Не найдены станции: {', '.join(unknown)}")
     await message.answer("📅 Свежесть вакансий (1, 2 или 3 дня):")
     await state.set_state(SearchSettings.freshness)
 
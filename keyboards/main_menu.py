@@ -5,7 +5,7 @@ def get_main_menu():
     return ReplyKeyboardMarkup(
         keyboard=[
             [KeyboardButton(text="/profile"), KeyboardButton(text="/search_settings")],
-            [KeyboardButton(text="/vacancies")]
+            [KeyboardButton(text="/vacancies"), KeyboardButton(text="/digest_time")]
         ],
         resize_keyboard=True,
         one_time_keyboard=False
@@ -1,3 +1,4 @@
+import asyncio
 import os
 import time
 from contextlib import asynccontextmanager
@@ -12,8 +13,33 @@ from apscheduler.triggers.cron import CronTrigger
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request
 
+from db.database import DATABASE_URL, close_pool, create_pool, init_db
+from db.models import upsert_vacancies, user_rows_cache
 from handlers import setup_handlers
-from services.hh_service import send_daily_vacancies
+from services.digest_service import (
+    DIGEST_SLOT_MINUTES,
+    DIGEST_WORKERS,
+    delivery_stats,
+    digest_worker_id,
+    last_digest_report,
+    resume_digest_runs,
+    run_digest_tick,
+    run_digest_worker,
+)
+from services.hh_dictionaries import refresh_areas, schedule_dictionaries_refresh
+from services.hh_service import (
+    close_http_client,
+    create_http_client,
+    hh_metrics,
+    hh_rate_limiter,
+    init_persistent_cache,
+    set_http_client,
+    set_vacancy_sink,
+    vacancies_cache,
+    vacancy_details_cache,
+)
+from services.sent_vacancies import sent_vacancies
+from services.telegram_queue import outbound
 
 load_dotenv()
 
@@ -44,7 +70,23 @@ async def lifespan(app: FastAPI):
     if not token:
         raise RuntimeError("❌ BOT_TOKEN не задан в переменных окружения!")
 
+    # Пул соединений с БД на всё время жизни приложения: без него каждый
+    # запрос к Neon платил бы за новое соединение
+    await create_pool()
+    await init_db()
+
+    # Общий пул соединений к hh.ru на всё время жизни приложения
+    set_http_client(create_http_client())
+    # Кэш ответов hh.ru в Postgres переживает рестарты; прогревается в фоне
+    init_persistent_cache(DATABASE_URL)
+    # Загруженные страницы выдачи и карточки сохраняются в таблицу vacancies
+    set_vacancy_sink(upsert_vacancies)
+    # Справочники hh.ru берутся из снимка на диске, обновляются в фоне
+    schedule_dictionaries_refresh()
+
     bot = Bot(token=token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    # Карточки вакансий и рассылка идут через очередь с лимитами Telegram
+    outbound.start()
     dp = Dispatcher()
     setup_handlers(dp)
 
@@ -54,11 +96,31 @@ async def lifespan(app: FastAPI):
     else:
         raise RuntimeError("❌ WEBHOOK_URL не задан! Для Render он обязателен.")
 
-    # Запускаем планировщик (рассылка в 9:00)
-    scheduler = AsyncIOScheduler()
-    scheduler.add_job(send_daily_vacancies, CronTrigger(hour=9, minute=0), args=[bot])
+    # Запускаем планировщик: рассылка идёт слотами по DIGEST_SLOT_MINUTES минут,
+    # каждый запуск ставит в очередь подготовку будущего слота
+    # и отправляет уже готовые подборки наступивших
+    scheduler = AsyncIOScheduler(timezone="UTC")
+    scheduler.add_job(
+        run_digest_tick,
+        CronTrigger(minute=f"*/{DIGEST_SLOT_MINUTES}", timezone="UTC"),
+        args=[bot],
+        max_instances=2,
+    )
+    # Раз в сутки — удаление старых отправок из user_vacancies и перестройка фильтров
+    scheduler.add_job(sent_vacancies.maintain, CronTrigger(hour=3, minute=30, timezone="UTC"))
+    # Раз в сутки — проверка снимка /areas: устаревший (HH_DICTIONARIES_MAX_AGE)
+    # скачивается заново и без рестарта процесса
+    scheduler.add_job(refresh_areas, CronTrigger(hour=4, minute=0, timezone="UTC"))
     scheduler.start()
-    print("🗓️ Планировщик запущен (ежедневная рассылка в 9:00)")
+    print(f"🗓️ Планировщик запущен (рассылка слотами по {DIGEST_SLOT_MINUTES} мин)")
+    # Фильтры отправленных вакансий восстанавливаются из БД до первой рассылки,
+    # а прогоны, пропущенные за время рестарта, ставятся в очередь
+    resume_task = asyncio.create_task(resume_digest_runs())
+    # Подборки готовят воркеры; их можно добавить процессами digest_worker.py
+    digest_workers = [
+        asyncio.create_task(run_digest_worker(digest_worker_id(index)))
+        for index in range(DIGEST_WORKERS)
+    ]
 
     yield  # ← Приложение работает
 
@@ -66,8 +128,15 @@ async def lifespan(app: FastAPI):
     print("⏹️ Остановка...")
     if scheduler:
         scheduler.shutdown(wait=False)
+    resume_task.cancel()
+    for task in digest_workers:
+        task.cancel()
+    await asyncio.gather(*digest_workers, return_exceptions=True)
+    await outbound.stop()
     if bot:
         await bot.session.close()
+    await close_http_client()
+    await close_pool()
     print("✅ Бот остановлен")
 
 
@@ -80,6 +149,22 @@ async def health():
     return {"status": "✅ Бот работает!", "webhook": os.getenv("WEBHOOK_URL")}
 
 
+@app.get("/stats")
+async def stats():
+    """Метрики кэшей, запросов к hh.ru и последней рассылки для мониторинга"""
+    return {
+        "vacancies_cache": vacancies_cache.stats(),
+        "vacancy_details_cache": vacancy_details_cache.stats(),
+        "hh": hh_metrics,
+        "hh_rate_limiter": hh_rate_limiter.stats(),
+        "telegram": outbound.stats(),
+        "digest": last_digest_report,
+        "digest_delivery": delivery_stats,
+        "user_cache": user_rows_cache.stats(),
+        "sent_vacancies": sent_vacancies.stats(),
+    }
+
+
 @app.post("/webhook")
 async def telegram_webhook(request: Request):
     """Принимает обновления от Telegram"""
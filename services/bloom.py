@@ -0,0 +1,58 @@
+# services/bloom.py
+import hashlib
+import math
+from typing import Tuple
+
+Hashes = Tuple[int, int]
+
+
+def bloom_hashes(key: str) -> Hashes:
+    """
+    Два независимых 64-битных хэша ключа. Их можно посчитать один раз
+    и проверять по многим фильтрам с одинаковыми параметрами.
+    """
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+
+
+class BloomFilter:
+    """
+    Фильтр Блума: «точно нет» или «возможно есть».
+
+    Размер подбирается под capacity элементов с долей ложных
+    срабатываний error_rate; при переполнении доля растёт, но ложных
+    «нет» не бывает. Позиции битов — двойное хэширование h1 + i·h2.
+    """
+
+    __slots__ = ("size", "hash_count", "count", "_bits")
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, hashes: Hashes):
+        h1, h2 = hashes
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, key: str) -> None:
+        self.add_hashes(bloom_hashes(key))
+
+    def add_hashes(self, hashes: Hashes) -> None:
+        for position in self._positions(hashes):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def contains_hashes(self, hashes: Hashes) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(hashes))
+
+    def __contains__(self, key: str) -> bool:
+        return self.contains_hashes(bloom_hashes(key))
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._bits)
@@ -0,0 +1,123 @@
+# services/cache.py
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+def approx_size(value: Any) -> int:
+    """Приблизительный размер объекта в байтах (рекурсивно по контейнерам)"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(approx_size(k) + approx_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(approx_size(item) for item in value)
+    elif hasattr(value, "__slots__"):
+        size += sum(approx_size(getattr(value, name, None)) for name in value.__slots__)
+    return size
+
+
+class TTLCache:
+    """
+    Ограниченный кэш с временем жизни записей и вытеснением LRU.
+
+    Ограничивается и количеством записей, и приблизительным объёмом
+    в байтах (0 — без ограничения по объёму). Счётчики попаданий,
+    промахов и вытеснений доступны через stats().
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        max_entries: int,
+        max_bytes: int = 0,
+        sizeof: Callable[[Any], int] = approx_size,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._clock = clock
+        # key -> (expires_at, size, value); порядок — от давно использованных к недавним
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        expires_at, _, value = entry
+        if expires_at <= self._clock():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        if key in self._entries:
+            self._remove(key)
+        size = self._sizeof(value)
+        # Запись больше всего бюджета не кэшируем вовсе
+        if self.max_bytes and size > self.max_bytes:
+            return
+        expires_at = self._clock() + (self.ttl if ttl is None else ttl)
+        self._entries[key] = (expires_at, size, value)
+        self._bytes += size
+        self._evict()
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        self._remove(key)
+        return entry[2]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and entry[0] > self._clock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def _remove(self, key: Hashable) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def _over_budget(self) -> bool:
+        return len(self._entries) > self.max_entries or bool(self.max_bytes and self._bytes > self.max_bytes)
+
+    def _evict(self) -> None:
+        if not self._over_budget():
+            return
+        # Сначала выбрасываем просроченные записи, затем самые давние по использованию
+        now = self._clock()
+        for key in [k for k, (expires_at, _, _) in self._entries.items() if expires_at <= now]:
+            self._remove(key)
+            self.expirations += 1
+        while self._entries and self._over_budget():
+            key = next(iter(self._entries))
+            self._remove(key)
+            self.evictions += 1
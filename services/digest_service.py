@@ -0,0 +1,522 @@
+# services/digest_service.py
+import asyncio
+import os
+import socket
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from html import escape
+from typing import Any, AsyncIterable, Awaitable, Callable, Dict, List, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from db.models import (
+    claim_digest_jobs,
+    claim_due_digests,
+    complete_digest_job,
+    enqueue_digest_jobs,
+    extend_digest_job_lease,
+    fail_digest_job,
+    finish_digest_run_if_complete,
+    get_unfinished_digest_runs,
+    iter_digest_run_users,
+    save_delivery_statuses,
+    save_prepared_digests,
+    start_digest_run,
+)
+from services.hh_service import build_user_filters, fetch_vacancies, hh_metrics, search_fingerprint
+from services.sent_vacancies import SentVacancies, sent_vacancies
+from services.telegram_queue import BULK, outbound
+from services.vacancy import Vacancy
+
+# Сколько разных поисков загружается одновременно (общий лимит
+# запросов к hh.ru всё равно соблюдает hh_rate_limiter)
+DIGEST_FETCH_CONCURRENCY = int(os.getenv("DIGEST_FETCH_CONCURRENCY", "4"))
+# Сколько подборок ожидают отправки одновременно (темп задаёт очередь Telegram)
+DIGEST_SEND_CONCURRENCY = int(os.getenv("DIGEST_SEND_CONCURRENCY", "50"))
+# Вакансий в подборке одного пользователя
+DIGEST_VACANCIES_PER_USER = int(os.getenv("DIGEST_VACANCIES_PER_USER", "5"))
+# Сколько вакансий загружать на поиск: столько же, сколько /vacancies,
+# чтобы рассылка и ручной поиск делили кэш (это всё равно одна страница)
+DIGEST_FETCH_LIMIT = int(os.getenv("DIGEST_FETCH_LIMIT", "100"))
+# Размер пачки при чтении подписчиков из БД
+DIGEST_STREAM_BATCH = int(os.getenv("DIGEST_STREAM_BATCH", "500"))
+# По сколько пользователей группы проверять на повторы одним запросом
+DIGEST_DEDUP_BATCH = int(os.getenv("DIGEST_DEDUP_BATCH", "500"))
+# Сколько статусов пользователей копить перед записью в digest_run_users:
+# после падения повторно получат подборку не больше стольких пользователей
+DIGEST_CHECKPOINT_BATCH = int(os.getenv("DIGEST_CHECKPOINT_BATCH", "50"))
+
+# Рассылка размазана по слотам: планировщик раз в DIGEST_SLOT_MINUTES
+# минут обрабатывает пользователей своего слота. Кто не выбрал время
+# через /digest_time, получает слот по хэшу внутри окна
+# [DIGEST_WINDOW_START, +DIGEST_WINDOW_MINUTES) по DIGEST_TIMEZONE.
+DIGEST_SLOT_MINUTES = int(os.getenv("DIGEST_SLOT_MINUTES", "5"))
+DIGEST_WINDOW_START = os.getenv("DIGEST_WINDOW_START", "09:00")
+DIGEST_WINDOW_MINUTES = int(os.getenv("DIGEST_WINDOW_MINUTES", "120"))
+DIGEST_TIMEZONE = os.getenv("DIGEST_TIMEZONE", "Europe/Moscow")
+
+# Очередь заданий рассылки (таблица digest_jobs): не больше DIGEST_JOB_USERS
+# пользователей в задании, аренда задания воркером, число попыток,
+# базовая задержка повтора и пауза опроса пустой очереди (секунды)
+DIGEST_JOB_USERS = int(os.getenv("DIGEST_JOB_USERS", "500"))
+DIGEST_JOB_LEASE = float(os.getenv("DIGEST_JOB_LEASE", "300"))
+# Как часто воркер продлевает аренду выполняемого задания
+DIGEST_JOB_HEARTBEAT = float(os.getenv("DIGEST_JOB_HEARTBEAT", str(DIGEST_JOB_LEASE / 3)))
+DIGEST_JOB_MAX_ATTEMPTS = int(os.getenv("DIGEST_JOB_MAX_ATTEMPTS", "3"))
+DIGEST_JOB_RETRY_DELAY = float(os.getenv("DIGEST_JOB_RETRY_DELAY", "30"))
+DIGEST_POLL_INTERVAL = float(os.getenv("DIGEST_POLL_INTERVAL", "5"))
+# Воркеров рассылки в процессе бота; ещё воркеры — отдельные процессы digest_worker.py
+DIGEST_WORKERS = int(os.getenv("DIGEST_WORKERS", "1"))
+# Подборки готовятся за DIGEST_PREPARE_AHEAD минут до своего слота, а в слот
+# только отправляются — пачками по DIGEST_DELIVERY_BATCH из prepared_digests
+DIGEST_PREPARE_AHEAD = int(os.getenv("DIGEST_PREPARE_AHEAD", "30"))
+DIGEST_DELIVERY_BATCH = int(os.getenv("DIGEST_DELIVERY_BATCH", "200"))
+
+# Отчёт о последнем подготовленном прогоне и счётчики доставки (для /stats)
+last_digest_report: Dict[str, Any] = {}
+delivery_stats: Dict[str, int] = {"delivered": 0, "failed": 0}
+
+Deliver = Callable[[int, List[Vacancy]], Awaitable[None]]
+# Итог по пользователю: sent | empty | failed | skipped
+OnDone = Callable[[int, str], Awaitable[None]]
+
+
+@dataclass(slots=True)
+class _DigestGroup:
+    """Пользователи с одинаковым каноническим поиском"""
+
+    filters: Dict[str, Any]
+    user_ids: List[int] = field(default_factory=list)
+
+
+def parse_clock(text: str) -> Optional[int]:
+    """«08:30» → минута дня (510); None, если время не распознано"""
+    hours, sep, minutes = text.strip().partition(":")
+    if not sep or not hours.isdigit() or not minutes.isdigit():
+        return None
+    hours, minutes = int(hours), int(minutes)
+    if hours > 23 or minutes > 59:
+        return None
+    return hours * 60 + minutes
+
+
+def format_clock(minute: int) -> str:
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+def is_valid_timezone(name: str) -> bool:
+    try:
+        ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return False
+    return True
+
+
+def _check_schedule_settings() -> int:
+    """
+    Проверяет настройки слотов при импорте; возвращает начало окна
+    рассылки в минутах. С неверными значениями рассылка молча теряла бы
+    пользователей, поэтому процесс не запускается вовсе.
+    """
+    # Планировщик срабатывает по cron «*/N минут» в пределах часа: если N
+    # не делит 60, запуски расходятся с границами current_slot() и слоты пропускаются
+    if DIGEST_SLOT_MINUTES <= 0 or 60 % DIGEST_SLOT_MINUTES:
+        raise RuntimeError(f"❌ DIGEST_SLOT_MINUTES должен делить 60, задано {DIGEST_SLOT_MINUTES}")
+    window_start = parse_clock(DIGEST_WINDOW_START)
+    if window_start is None:
+        raise RuntimeError(f"❌ DIGEST_WINDOW_START должен быть в формате ЧЧ:ММ, задано {DIGEST_WINDOW_START!r}")
+    if not is_valid_timezone(DIGEST_TIMEZONE):
+        raise RuntimeError(f"❌ Неизвестный часовой пояс DIGEST_TIMEZONE: {DIGEST_TIMEZONE!r}")
+    return window_start
+
+
+DIGEST_WINDOW_START_MINUTE = _check_schedule_settings()
+
+
+def current_slot(now: Optional[datetime] = None) -> int:
+    """Начало текущего слота в минутах UTC от полуночи"""
+    now = now or datetime.now(timezone.utc)
+    minute = now.hour * 60 + now.minute
+    return minute - minute % DIGEST_SLOT_MINUTES
+
+
+def format_digest(vacancies: List[Vacancy]) -> str:
+    lines = ["📬 <b>Новые вакансии для вас</b>"]
+    for number, vac in enumerate(vacancies, 1):
+        salary = f"от {vac.salary_from} ₽" if vac.salary_from else "з/п не указана"
+        lines.append(
+            f"\n{number}. <a href='{escape(vac.alternate_url or '#')}'>{escape(vac.name)}</a>\n"
+            f"🏢 {escape(vac.employer_name)} · 📍 {escape(vac.area_name)} · 💰 {salary}"
+        )
+    lines.append("\nВсе вакансии: /vacancies")
+    return "\n".join(lines)
+
+
+async def run_digest(
+    subscribers: AsyncIterable[Dict[str, Any]],
+    deliver: Deliver,
+    on_done: Optional[OnDone] = None,
+    sent: Optional[SentVacancies] = None,
+) -> Dict[str, Any]:
+    """
+    Рассылка в три стадии:
+    1. подписчики читаются потоком и группируются по отпечатку поиска —
+       тысячи пользователей с одинаковыми фильтрами дают один запрос;
+    2. каждый уникальный поиск загружается один раз, не больше
+       DIGEST_FETCH_CONCURRENCY одновременно;
+    3. результат раздаётся всем пользователям группы через ограниченную
+       очередь, которую разбирают DIGEST_SEND_CONCURRENCY отправителей.
+    Время рассылки растёт с числом разных поисков, а не пользователей.
+    Итог по каждому пользователю передаётся в on_done (для чекпоинтов),
+    а если передан sent — пользователь получает только вакансии,
+    которых ему ещё не отправляли. Отправленными вакансии записывает
+    доставка (save_delivery_statuses), а не run_digest.
+    """
+    started = time.monotonic()
+    hh_requests_before = hh_metrics["requests"]
+    report = {
+        "users": 0,
+        "skipped": 0,
+        "groups": 0,
+        "fetch_failed": 0,
+        "delivered": 0,
+        "empty": 0,
+        "failed": 0,
+    }
+
+    async def done(user_id: int, status: str) -> None:
+        if on_done is not None:
+            await on_done(user_id, status)
+
+    groups: Dict[str, _DigestGroup] = {}
+    async for row in subscribers:
+        report["users"] += 1
+        filters = build_user_filters(row)
+        key = await search_fingerprint(filters)
+        if key is None:
+            # Город не распознан — искать нечего
+            report["skipped"] += 1
+            await done(row["telegram_id"], "skipped")
+            continue
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = _DigestGroup(filters)
+        group.user_ids.append(row["telegram_id"])
+    report["groups"] = len(groups)
+
+    # Ограниченная очередь: если отправка отстаёт, загрузка ждёт
+    queue: "asyncio.Queue[tuple]" = asyncio.Queue(maxsize=DIGEST_SEND_CONCURRENCY * 10)
+    pending_groups = iter(groups.values())
+
+    async def fetcher() -> None:
+        for group in pending_groups:
+            try:
+                vacancies = await fetch_vacancies(group.filters, max_results=DIGEST_FETCH_LIMIT)
+            except Exception as e:
+                print(f"⚠️ Рассылка: ошибка загрузки вакансий: {e}")
+                report["fetch_failed"] += 1
+                for user_id in group.user_ids:
+                    report["failed"] += 1
+                    await done(user_id, "failed")
+                continue
+            # Уже отправленные вакансии отсеиваются пачками пользователей
+            for start in range(0, len(group.user_ids), DIGEST_DEDUP_BATCH):
+                user_ids = group.user_ids[start:start + DIGEST_DEDUP_BATCH]
+                if sent is None:
+                    picks = {user_id: vacancies[:DIGEST_VACANCIES_PER_USER] for user_id in user_ids}
+                else:
+                    picks = await sent.pick_new(user_ids, vacancies, DIGEST_VACANCIES_PER_USER)
+                for user_id in user_ids:
+                    await queue.put((user_id, picks[user_id]))
+
+    async def sender() -> None:
+        while True:
+            user_id, vacancies = await queue.get()
+            try:
+                if not vacancies:
+                    status = "empty"
+                else:
+                    await deliver(user_id, vacancies)
+                    status = "sent"
+            except Exception as e:
+                print(f"⚠️ Рассылка: не удалось отправить пользователю {user_id}: {e}")
+                status = "failed"
+            report["delivered" if status == "sent" else status] += 1
+            try:
+                await done(user_id, status)
+            finally:
+                queue.task_done()
+
+    senders = [asyncio.create_task(sender()) for _ in range(DIGEST_SEND_CONCURRENCY)]
+    try:
+        await asyncio.gather(*(fetcher() for _ in range(DIGEST_FETCH_CONCURRENCY)))
+        await queue.join()
+    finally:
+        for task in senders:
+            task.cancel()
+        await asyncio.gather(*senders, return_exceptions=True)
+
+    report["hh_requests"] = hh_metrics["requests"] - hh_requests_before
+    report["duration_seconds"] = round(time.monotonic() - started, 3)
+    return report
+
+
+class _Checkpoint:
+    """
+    Копит подготовленные подборки и итоги по пользователям прогона
+    и пачками пишет их в БД
+    """
+
+    def __init__(self, run_id: int):
+        self.run_id = run_id
+        self.statuses: Dict[int, str] = {}
+        self.digests: Dict[int, tuple] = {}
+
+    async def prepare(self, user_id: int, vacancies: List[Vacancy]) -> None:
+        self.digests[user_id] = (format_digest(vacancies), [vac.id for vac in vacancies])
+
+    async def record(self, user_id: int, status: str) -> None:
+        # Для подготовки «sent» из run_digest означает: подборка готова
+        self.statuses[user_id] = "prepared" if status == "sent" else status
+        if len(self.statuses) >= DIGEST_CHECKPOINT_BATCH:
+            await self.flush()
+
+    async def flush(self) -> None:
+        if not self.statuses:
+            return
+        statuses, self.statuses = self.statuses, {}
+        digests = {user_id: self.digests.pop(user_id) for user_id in statuses if user_id in self.digests}
+        try:
+            await save_prepared_digests(self.run_id, statuses, digests)
+        except Exception as e:
+            # Не записанные пользователи останутся pending и будут подготовлены снова
+            print(f"⚠️ Рассылка: не удалось сохранить чекпоинт прогона {self.run_id}: {e}")
+
+
+async def _enqueue_run(run_id: int) -> None:
+    """
+    Делит пользователей прогона на задания: одна группа одинаковых
+    поисков, не больше DIGEST_JOB_USERS пользователей в задании.
+    """
+    groups: Dict[str, List[int]] = {}
+    async for row in iter_digest_run_users(run_id, batch_size=DIGEST_STREAM_BATCH):
+        key = await search_fingerprint(build_user_filters(row))
+        # Нераспознанный город — отдельное задание, оно отметит их как skipped
+        groups.setdefault(key or "", []).append(row["telegram_id"])
+    jobs = [
+        (key, user_ids[start:start + DIGEST_JOB_USERS])
+        for key, user_ids in groups.items()
+        for start in range(0, len(user_ids), DIGEST_JOB_USERS)
+    ]
+    await enqueue_digest_jobs(run_id, jobs)
+    # Прогон без пользователей закрывается сразу
+    await _finish_run(run_id)
+
+
+async def _finish_run(run_id: int) -> None:
+    report = await finish_digest_run_if_complete(run_id)
+    if report is None:
+        return
+    last_digest_report.clear()
+    last_digest_report.update(report)
+    if report.get("users"):
+        print(f"📧 Подборки прогона {run_id} подготовлены: {report}")
+
+
+def prepare_target(now: Optional[datetime] = None):
+    """День и слот (UTC), которые пора готовить: через DIGEST_PREPARE_AHEAD минут"""
+    target = (now or datetime.now(timezone.utc)) + timedelta(minutes=DIGEST_PREPARE_AHEAD)
+    return target.date(), current_slot(target)
+
+
+async def prepare_digest_slot(run_date=None, slot: Optional[int] = None) -> None:
+    """
+    Фаза подготовки: ставит в очередь прогон слота, который наступит
+    через DIGEST_PREPARE_AHEAD минут. Воркеры (run_digest_worker, в любом
+    числе процессов) загружают вакансии, отсеивают отправленные
+    и сохраняют готовый текст подборки каждого подписчика слота
+    в prepared_digests. Вызывается планировщиком каждые
+    DIGEST_SLOT_MINUTES минут.
+
+    Прогон слота и список его пользователей сохраняются в БД, статус
+    каждого пользователя отмечается по ходу — после рестарта прогон
+    продолжается с места остановки, а не начинается заново.
+    """
+    if run_date is None or slot is None:
+        run_date, slot = prepare_target()
+    run_id, status = await start_digest_run(
+        run_date,
+        slot,
+        DIGEST_SLOT_MINUTES,
+        DIGEST_WINDOW_START_MINUTE,
+        DIGEST_TIMEZONE,
+        max(1, DIGEST_WINDOW_MINUTES // DIGEST_SLOT_MINUTES),
+    )
+    if status == "new":
+        await _enqueue_run(run_id)
+
+
+async def _keep_lease(job_id: int, worker_id: str) -> None:
+    """Продлевает аренду задания, пока оно выполняется (долгая загрузка с hh.ru)"""
+    while True:
+        await asyncio.sleep(DIGEST_JOB_HEARTBEAT)
+        try:
+            if not await extend_digest_job_lease(job_id, worker_id, DIGEST_JOB_LEASE):
+                print(f"⚠️ Воркер рассылки {worker_id}: задание {job_id} забрал другой воркер")
+                return
+        except Exception as e:
+            print(f"⚠️ Воркер рассылки {worker_id}: не удалось продлить аренду задания {job_id}: {e}")
+
+
+async def process_digest_job(job: Dict[str, Any], worker_id: str) -> Dict[str, Any]:
+    """Готовит подборки ещё не обслуженным пользователям задания"""
+    run_id = job["run_id"]
+    heartbeat = asyncio.create_task(_keep_lease(job["id"], worker_id))
+    # Фильтры должны знать и о подборках других воркеров
+    await sent_vacancies.refresh()
+    checkpoint = _Checkpoint(run_id)
+    subscribers = iter_digest_run_users(run_id, job["user_ids"], batch_size=DIGEST_STREAM_BATCH)
+    try:
+        # Отправленными вакансии становятся только при доставке
+        # (save_delivery_statuses): не доставленная подборка их не «съедает»
+        report = await run_digest(subscribers, checkpoint.prepare, checkpoint.record, sent_vacancies)
+    finally:
+        heartbeat.cancel()
+        await checkpoint.flush()
+    if await complete_digest_job(job["id"], worker_id, report):
+        await _finish_run(run_id)
+    else:
+        print(f"⚠️ Воркер рассылки {worker_id}: задание {job['id']} уже не за ним, результат не записан")
+    return report
+
+
+def digest_worker_id(index: int) -> str:
+    """Имя воркера в digest_jobs.locked_by: хост, процесс, номер"""
+    return f"{socket.gethostname()}:{os.getpid()}:{index}"
+
+
+async def run_digest_worker(worker_id: str) -> None:
+    """
+    Воркер подготовки: забирает задания из digest_jobs и выполняет их.
+    Упавшее задание возвращается в очередь с задержкой. Пока задание
+    выполняется, аренда продлевается; задание упавшего воркера заберёт
+    другой, когда истечёт аренда DIGEST_JOB_LEASE.
+    """
+    while True:
+        try:
+            jobs = await claim_digest_jobs(worker_id, DIGEST_JOB_LEASE, DIGEST_JOB_MAX_ATTEMPTS)
+        except Exception as e:
+            print(f"⚠️ Воркер рассылки {worker_id}: ошибка очереди заданий: {e}")
+            jobs = []
+        if not jobs:
+            await asyncio.sleep(DIGEST_POLL_INTERVAL)
+            continue
+        for job in jobs:
+            try:
+                await process_digest_job(job, worker_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Воркер рассылки {worker_id}: задание {job['id']} не выполнено: {e}")
+                delay = DIGEST_JOB_RETRY_DELAY * 2 ** (job["attempts"] - 1)
+                try:
+                    if await fail_digest_job(job["id"], worker_id, str(e), delay, DIGEST_JOB_MAX_ATTEMPTS):
+                        await _finish_run(job["run_id"])
+                except Exception as db_error:
+                    # Аренда истечёт, и задание заберут снова
+                    print(f"⚠️ Воркер рассылки {worker_id}: не удалось вернуть задание: {db_error}")
+
+
+async def deliver_prepared_digests(bot) -> Dict[str, int]:
+    """
+    Фаза доставки: отправляет готовые подборки, время которых наступило.
+    Ни hh.ru, ни отсева повторов — только чтение prepared_digests
+    и очередь Telegram, поэтому подборка приходит вовремя, даже если
+    hh.ru отвечал медленно. Подборки, подготовленные с опозданием,
+    уходят при следующем запуске.
+    """
+    report = {"delivered": 0, "failed": 0}
+    while True:
+        digests = await claim_due_digests(DIGEST_JOB_LEASE, DIGEST_DELIVERY_BATCH)
+        if not digests:
+            break
+
+        async def send(digest: Dict[str, Any]) -> str:
+            try:
+                # Через общую очередь с низким приоритетом: лимиты Telegram и
+                # повтор после RetryAfter — там, ответы пользователям идут первыми
+                await outbound.send_message(
+                    bot,
+                    digest["telegram_id"],
+                    digest["text"],
+                    priority=BULK,
+                    parse_mode="HTML",
+                    disable_web_page_preview=True,
+                )
+            except Exception as e:
+                print(f"⚠️ Рассылка: не удалось отправить пользователю {digest['telegram_id']}: {e}")
+                return "failed"
+            return "sent"
+
+        statuses = await asyncio.gather(*(send(digest) for digest in digests))
+        await save_delivery_statuses([
+            (digest["run_id"], digest["telegram_id"], status)
+            for digest, status in zip(digests, statuses)
+        ])
+        for status in statuses:
+            report["delivered" if status == "sent" else "failed"] += 1
+
+    for key, value in report.items():
+        delivery_stats[key] += value
+    if any(report.values()):
+        print(f"📧 Подборки доставлены: {report}")
+    return report
+
+
+async def _enqueue_pending_runs() -> None:
+    """
+    Ставит в очередь прогоны, оставшиеся в статусе new: упала постановка
+    (ошибка БД или справочника метро) или процесс перезапустился.
+    enqueue_digest_jobs не создаёт задания дважды, так что повтор безопасен.
+    """
+    for run in await get_unfinished_digest_runs():
+        print(f"📧 Продолжаем прерванную рассылку: прогон {run['id']}, слот {format_clock(run['slot'])} UTC")
+        try:
+            await _enqueue_run(run["id"])
+        except Exception as e:
+            print(f"⚠️ Не удалось поставить в очередь прогон {run['id']}: {e}")
+
+
+async def run_digest_tick(bot) -> None:
+    """
+    Запуск планировщика: подготовка будущего слота, повторная постановка
+    не попавших в очередь прогонов и доставка наступивших
+    """
+    try:
+        await prepare_digest_slot()
+    except Exception as e:
+        print(f"⚠️ Не удалось поставить в очередь подготовку рассылки: {e}")
+    try:
+        await _enqueue_pending_runs()
+    except Exception as e:
+        print(f"⚠️ Не удалось проверить прогоны рассылки: {e}")
+    await deliver_prepared_digests(bot)
+
+
+async def resume_digest_runs() -> None:
+    """
+    При старте: восстанавливает фильтры отправленных вакансий, ставит
+    в очередь прогоны, созданные, но не поставленные до рестарта,
+    и готовит слоты ближайших DIGEST_PREPARE_AHEAD минут — их очередь
+    подошла, пока процесс не работал. Задания, уже стоящие в очереди,
+    воркеры доделают сами.
+    """
+    try:
+        await sent_vacancies.ensure_loaded()
+        await _enqueue_pending_runs()
+        now = datetime.now(timezone.utc)
+        for ahead in range(0, DIGEST_PREPARE_AHEAD, DIGEST_SLOT_MINUTES):
+            moment = now + timedelta(minutes=ahead)
+            await prepare_digest_slot(moment.date(), current_slot(moment))
+    except Exception as e:
+        print(f"⚠️ Не удалось подготовить рассылку после старта: {e}")
@@ -0,0 +1,289 @@
+# services/hh_dictionaries.py
+import asyncio
+import json
+import os
+import time
+from bisect import bisect_left
+from typing import Any, Dict, List, NamedTuple, Optional, Set
+
+# Каталог для снимков справочников hh.ru на диске
+HH_DICTIONARIES_DIR = os.getenv("HH_DICTIONARIES_DIR", ".cache/hh")
+# Через сколько секунд снимок считается устаревшим и перекачивается в фоне
+HH_DICTIONARIES_MAX_AGE = float(os.getenv("HH_DICTIONARIES_MAX_AGE", str(7 * 24 * 60 * 60)))
+# Через сколько секунд повторять загрузку метро, если /metro не ответил
+HH_METRO_RETRY_INTERVAL = float(os.getenv("HH_METRO_RETRY_INTERVAL", "600"))
+# Версия формата снимка: при её смене старые файлы игнорируются
+SNAPSHOT_VERSION = 1
+
+RUSSIA_AREA_ID = 113
+
+# Точный маппинг: как в кнопках → area_id.
+# Используется для клавиатуры городов и как запасной справочник,
+# пока полный снимок /areas ещё не загружен.
+CITY_TO_AREA_ID = {
+    "Москва": 1,
+    "Санкт-Петербург": 2,
+    "Новосибирск": 4,
+    "Екатеринбург": 3,
+    "Казань": 88,
+    "Нижний Новгород": 66,
+    "Челябинск": 104,
+    "Самара": 72,
+    "Омск": 68,
+    "Ростов-на-Дону": 76,
+    "Уфа": 99,
+    "Красноярск": 54,
+    "Воронеж": 26,
+    "Пермь": 90,
+    "Волгоград": 27,
+}
+
+
+class Area(NamedTuple):
+    id: int
+    name: str
+    country_id: int
+    depth: int
+
+
+def normalize_name(name: Optional[str]) -> str:
+    """Нормализует название для поиска: регистр, ё/е, дефисы и пробелы"""
+    text = (name or "").lower().replace("ё", "е").replace("-", " ")
+    return " ".join(text.split())
+
+
+class AreaIndex:
+    """
+    Индекс регионов hh.ru: точный поиск по нормализованному названию
+    через словарь и поиск по началу любого слова названия через
+    отсортированный массив (bisect) — компактнее префиксного дерева
+    при той же сложности O(log n + k).
+    """
+
+    def __init__(self, areas: List[Area]):
+        self.by_id: Dict[int, Area] = {area.id: area for area in areas}
+        self.by_name: Dict[str, List[int]] = {}
+        prefixes = []
+        for area in areas:
+            name = normalize_name(area.name)
+            self.by_name.setdefault(name, []).append(area.id)
+            # «новгород» находит и «Нижний Новгород», и «Великий Новгород»
+            words = name.split(" ")
+            for i in range(len(words)):
+                prefixes.append((" ".join(words[i:]), area.id))
+        for ids in self.by_name.values():
+            ids.sort(key=self._rank)
+        prefixes.sort()
+        self._prefix_keys = [key for key, _ in prefixes]
+        self._prefix_ids = [area_id for _, area_id in prefixes]
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+    def _rank(self, area_id: int):
+        # Сначала Россия, затем более крупные (менее вложенные) регионы
+        area = self.by_id[area_id]
+        return (area.country_id != RUSSIA_AREA_ID, area.depth, area.id)
+
+    @classmethod
+    def from_tree(cls, tree: List[Dict[str, Any]]) -> "AreaIndex":
+        """Строит индекс по дереву из ответа /areas"""
+        areas: List[Area] = []
+        stack = [(node, int(node["id"]), 0) for node in tree]
+        while stack:
+            node, country_id, depth = stack.pop()
+            areas.append(Area(int(node["id"]), node["name"], country_id, depth))
+            stack.extend((child, country_id, depth + 1) for child in node.get("areas") or [])
+        return cls(areas)
+
+    @classmethod
+    def from_mapping(cls, mapping: Dict[str, int]) -> "AreaIndex":
+        return cls([Area(area_id, name, RUSSIA_AREA_ID, 1) for name, area_id in mapping.items()])
+
+    def resolve(self, name: Optional[str]) -> Optional[Area]:
+        ids = self.by_name.get(normalize_name(name))
+        return self.by_id[ids[0]] if ids else None
+
+    def suggest(self, text: Optional[str], limit: int = 10) -> List[Area]:
+        """Регионы, одно из слов которых начинается с text"""
+        prefix = normalize_name(text)
+        if not prefix:
+            return []
+        found: Set[int] = set()
+        i = bisect_left(self._prefix_keys, prefix)
+        while i < len(self._prefix_keys) and self._prefix_keys[i].startswith(prefix):
+            found.add(self._prefix_ids[i])
+            i += 1
+        return [self.by_id[area_id] for area_id in sorted(found, key=self._rank)[:limit]]
+
+
+class MetroIndex:
+    """Станции метро одного города: нормализованное название -> id станций hh.ru"""
+
+    def __init__(self, city: Dict[str, Any]):
+        self.by_name: Dict[str, List[str]] = {}
+        self.names: Dict[str, str] = {}
+        for line in city.get("lines") or []:
+            for station in line.get("stations") or []:
+                name = normalize_name(station["name"])
+                # Пересадочные станции с одним названием есть на разных линиях
+                self.by_name.setdefault(name, []).append(str(station["id"]))
+                self.names.setdefault(name, station["name"])
+
+    def __len__(self) -> int:
+        return len(self.by_name)
+
+    def resolve(self, text: Optional[str]) -> Optional[str]:
+        """Каноническое название станции: точное совпадение или единственное по началу"""
+        name = normalize_name(text)
+        if not name:
+            return None
+        if name in self.by_name:
+            return self.names[name]
+        matches = [key for key in self.by_name if key.startswith(name)]
+        return self.names[matches[0]] if len(matches) == 1 else None
+
+    def station_ids(self, text: Optional[str]) -> List[str]:
+        """id станций для списка названий через запятую (нераспознанные пропускаются)"""
+        ids: Set[str] = set()
+        for part in split_metro_text(text):
+            station = self.resolve(part)
+            if station is not None:
+                ids.update(self.by_name[normalize_name(station)])
+        return sorted(ids)
+
+
+def split_metro_text(text: Optional[str]) -> List[str]:
+    return [part.strip() for part in (text or "").replace(";", ",").split(",") if part.strip()]
+
+
+# Загруженный индекс регионов (None — ещё не загружался)
+_area_index: Optional[AreaIndex] = None
+_refresh_task: Optional["asyncio.Task[None]"] = None
+# Индексы метро по area_id (только успешно загруженные)
+_metro_indexes: Dict[int, MetroIndex] = {}
+# Когда не удалось загрузить метро города: до HH_METRO_RETRY_INTERVAL
+# справочник считается недоступным, потом запрашивается снова.
+# hh.ru отвечает ошибкой и для городов без метро — они тоже попадают сюда
+_metro_failures: Dict[int, float] = {}
+
+
+def _snapshot_path(name: str) -> str:
+    return os.path.join(HH_DICTIONARIES_DIR, f"{name}.json")
+
+
+def _read_snapshot(name: str) -> Optional[Dict[str, Any]]:
+    """Читает снимок справочника с диска, если он есть и нужной версии"""
+    try:
+        with open(_snapshot_path(name), encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        return None
+    return snapshot
+
+
+def _write_snapshot(name: str, data: Any) -> None:
+    # Пишем во временный файл и переименовываем, чтобы не оставить битый снимок
+    os.makedirs(HH_DICTIONARIES_DIR, exist_ok=True)
+    path = _snapshot_path(name)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": SNAPSHOT_VERSION, "fetched_at": time.time(), "data": data}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _is_stale(snapshot: Optional[Dict[str, Any]]) -> bool:
+    return snapshot is None or time.time() - snapshot.get("fetched_at", 0) > HH_DICTIONARIES_MAX_AGE
+
+
+def get_area_index() -> AreaIndex:
+    """
+    Возвращает индекс регионов. При первом обращении читает снимок
+    с диска; если его нет — использует встроенный список городов,
+    пока фоновое обновление не скачает полный справочник.
+    """
+    global _area_index
+    if _area_index is None:
+        snapshot = _read_snapshot("areas")
+        if snapshot is not None:
+            _area_index = AreaIndex.from_tree(snapshot["data"])
+        else:
+            _area_index = AreaIndex.from_mapping(CITY_TO_AREA_ID)
+    return _area_index
+
+
+def resolve_area(city: Optional[str]) -> Optional[Area]:
+    return get_area_index().resolve(city)
+
+
+def suggest_areas(text: Optional[str], limit: int = 10) -> List[Area]:
+    return get_area_index().suggest(text, limit)
+
+
+async def refresh_areas(force: bool = False) -> None:
+    """Скачивает /areas, если снимок отсутствует или устарел"""
+    global _area_index
+    if not force and not _is_stale(_read_snapshot("areas")):
+        return
+    # hh_service сам импортирует этот модуль, поэтому импорт — при вызове
+    from services.hh_service import HH_API_BASE, request_json
+
+    tree = await request_json(f"{HH_API_BASE}/areas")
+    if not tree:
+        print("⚠️ Не удалось загрузить справочник регионов hh.ru")
+        return
+    index = AreaIndex.from_tree(tree)
+    try:
+        _write_snapshot("areas", tree)
+    except OSError as e:
+        print(f"⚠️ Не удалось сохранить снимок регионов: {e}")
+    _area_index = index
+    print(f"🗺️ Справочник регионов hh.ru обновлён: {len(index)} регионов")
+
+
+async def ensure_metro_index(area_id: int) -> Optional[MetroIndex]:
+    """
+    Загружает справочник метро города: из снимка на диске, а если его нет
+    или он устарел — с /metro/{area_id}. Возвращает None, если справочник
+    недоступен: в городе нет метро или hh.ru не ответил (тогда загрузка
+    повторится через HH_METRO_RETRY_INTERVAL).
+    """
+    if area_id in _metro_indexes:
+        return _metro_indexes[area_id]
+    failed_at = _metro_failures.get(area_id)
+    if failed_at is not None and time.monotonic() - failed_at < HH_METRO_RETRY_INTERVAL:
+        return None
+    snapshot_name = f"metro_{area_id}"
+    snapshot = _read_snapshot(snapshot_name)
+    city = snapshot["data"] if snapshot is not None else None
+    if _is_stale(snapshot):
+        from services.hh_service import HH_API_BASE, request_json
+
+        fresh = await request_json(f"{HH_API_BASE}/metro/{area_id}")
+        if fresh:
+            city = fresh
+            try:
+                _write_snapshot(snapshot_name, fresh)
+            except OSError as e:
+                print(f"⚠️ Не удалось сохранить снимок метро: {e}")
+    if not city:
+        _metro_failures[area_id] = time.monotonic()
+        return None
+    _metro_failures.pop(area_id, None)
+    index = _metro_indexes[area_id] = MetroIndex(city)
+    return index
+
+
+def metro_station_ids(area_id: int, text: Optional[str]) -> List[str]:
+    """id станций по тексту пользователя; справочник должен быть уже загружен"""
+    index = _metro_indexes.get(area_id)
+    return index.station_ids(text) if index is not None else []
+
+
+def schedule_dictionaries_refresh() -> None:
+    """Запускает обновление справочников в фоне, не блокируя старт"""
+    global _refresh_task
+    if _refresh_task is None or _refresh_task.done():
+        _refresh_task = asyncio.ensure_future(refresh_areas())
@@ -1,149 +1,795 @@
-from typing import Any, Dict, List
+import asyncio
+import hashlib
+import importlib.util
+import json
+import os
+import random
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
 
 import httpx
 
-HH_API_URL = "https://api.hh.ru/vacancies"  # ← убраны лишние пробелы!
-
-# Точный маппинг: как в кнопках → area_id
-CITY_TO_AREA_ID = {
-    "Москва": 1,
-    "Санкт-Петербург": 2,
-    "Новосибирск": 4,
-    "Екатеринбург": 3,
-    "Казань": 88,
-    "Нижний Новгород": 66,
-    "Челябинск": 104,
-    "Самара": 72,
-    "Омск": 68,
-    "Ростов-на-Дону": 76,
-    "Уфа": 99,
-    "Красноярск": 54,
-    "Воронеж": 26,
-    "Пермь": 90,
-    "Волгоград": 27,
-}
+from services.cache import TTLCache
+from services.hh_dictionaries import (
+    ensure_metro_index,
+    metro_station_ids,
+    resolve_area,
+)
+from services.persistent_cache import create_cache_store
+from services.rate_limiter import TokenBucket
+from services.vacancy import Vacancy
+
+HH_API_BASE = os.getenv("HH_API_BASE", "https://api.hh.ru")
+HH_API_URL = f"{HH_API_BASE}/vacancies"  # ← убраны лишние пробелы!
+HH_USER_AGENT = "Mozilla/5.0 (compatible; HH-Bot/1.0; +http://bot.example.com/bot.html)"
+
+# Параметры пула соединений к hh.ru (переопределяются через переменные окружения)
+HH_MAX_CONNECTIONS = int(os.getenv("HH_MAX_CONNECTIONS", "20"))
+HH_MAX_KEEPALIVE = int(os.getenv("HH_MAX_KEEPALIVE", "10"))
+HH_KEEPALIVE_EXPIRY = float(os.getenv("HH_KEEPALIVE_EXPIRY", "30"))
+HH_TIMEOUT = float(os.getenv("HH_TIMEOUT", "10"))
+HH_CONNECT_TIMEOUT = float(os.getenv("HH_CONNECT_TIMEOUT", "5"))
+
+# Постраничная загрузка: hh.ru отдаёт до 100 вакансий на страницу
+# и не больше 2000 результатов на один поиск
+HH_MAX_DEPTH = 2000
+HH_PER_PAGE = min(int(os.getenv("HH_PER_PAGE", "100")), 100)
+HH_MAX_RESULTS = min(int(os.getenv("HH_MAX_RESULTS", "100")), HH_MAX_DEPTH)
+HH_PAGE_CONCURRENCY = int(os.getenv("HH_PAGE_CONCURRENCY", "5"))
+
+# Кэш результатов поиска: сколько секунд результат считается свежим
+# и отдаётся без запросов, сколько хранится для инкрементальной догрузки,
+# число записей и объём в байтах
+HH_CACHE_TTL = float(os.getenv("HH_CACHE_TTL", "300"))
+HH_RESULT_RETENTION = float(os.getenv("HH_RESULT_RETENTION", str(24 * 60 * 60)))
+# Раз в сколько секунд вместо догрузки запрос выполняется целиком: иначе
+# в результате без period остаются все когда-либо найденные вакансии,
+# в том числе снятые с публикации
+HH_FULL_REFRESH_INTERVAL = float(os.getenv("HH_FULL_REFRESH_INTERVAL", str(6 * 60 * 60)))
+HH_CACHE_MAX_ENTRIES = int(os.getenv("HH_CACHE_MAX_ENTRIES", "500"))
+HH_CACHE_MAX_BYTES = int(os.getenv("HH_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Кэш подробностей вакансий (/vacancies/{id}): описание меняется редко
+HH_DETAILS_TTL = float(os.getenv("HH_DETAILS_TTL", str(24 * 60 * 60)))
+HH_DETAILS_MAX_ENTRIES = int(os.getenv("HH_DETAILS_MAX_ENTRIES", "5000"))
+HH_DETAILS_MAX_BYTES = int(os.getenv("HH_DETAILS_MAX_BYTES", str(64 * 1024 * 1024)))
+HH_DETAILS_CONCURRENCY = int(os.getenv("HH_DETAILS_CONCURRENCY", "5"))
+
+# Второй уровень кэша, переживающий рестарты: postgres | file | off
+# (по умолчанию Postgres, если задан DATABASE_URL) и сколько записей
+# каждого вида подгружать в память при старте
+HH_PERSISTENT_CACHE = os.getenv("HH_PERSISTENT_CACHE")
+HH_PERSISTENT_CACHE_DIR = os.getenv("HH_PERSISTENT_CACHE_DIR", ".cache/hh_responses")
+HH_WARMUP_KEYS = int(os.getenv("HH_WARMUP_KEYS", "200"))
+
+# Ограничение частоты запросов (в секунду, с запасом burst) и повторы на 429/5xx
+HH_RATE_LIMIT = float(os.getenv("HH_RATE_LIMIT", "10"))
+HH_RATE_BURST = float(os.getenv("HH_RATE_BURST", "20"))
+HH_MAX_RETRIES = int(os.getenv("HH_MAX_RETRIES", "3"))
+HH_BACKOFF_BASE = float(os.getenv("HH_BACKOFF_BASE", "0.5"))
+HH_BACKOFF_MAX = float(os.getenv("HH_BACKOFF_MAX", "10"))
+
+
+# Общий keep-alive клиент: создаётся в lifespan приложения (main.py)
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """
+    Создаёт пул соединений к hh.ru. HTTP/2 включается,
+    если установлен пакет h2 (httpx[http2]).
+    """
+    return httpx.AsyncClient(
+        http2=importlib.util.find_spec("h2") is not None,
+        limits=httpx.Limits(
+            max_connections=HH_MAX_CONNECTIONS,
+            max_keepalive_connections=HH_MAX_KEEPALIVE,
+            keepalive_expiry=HH_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(HH_TIMEOUT, connect=HH_CONNECT_TIMEOUT),
+        headers={"User-Agent": HH_USER_AGENT},
+    )
+
+
+def set_http_client(client: Optional[httpx.AsyncClient]) -> None:
+    """Подставляет общий клиент (вызывается из lifespan)"""
+    global _http_client
+    _http_client = client
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Возвращает общий клиент. Вне приложения (скрипты, тесты)
+    клиент создаётся лениво при первом обращении.
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = create_http_client()
+    return _http_client
 
-import asyncio
 
-# Добавляем импорт для кэширования
-from datetime import datetime, timedelta
+async def close_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
 
 # Кэш для хранения результатов запросов
-vacancies_cache = {}
-
-async def fetch_vacancies(filters: Dict[str, Any]) -> List[Dict[str, Any]]:
-    # Создаем ключ для кэша на основе фильтров
-    cache_key = str(sorted(filters.items()))
-    current_time = datetime.now()
-    
-    # Проверяем, есть ли валидный кэш для этих фильтров
-    if cache_key in vacancies_cache:
-        cached_time, cached_result = vacancies_cache[cache_key]
-        # Кэшируем на 5 минут
-        if current_time - cached_time < timedelta(minutes=5):
-            return cached_result
-    
-    city = filters.get("city", "")
-    area_id = CITY_TO_AREA_ID.get(city)
-    if area_id is None:
-        return []
-    
-    only_with_salary = bool(filters.get("salary_from"))
-    
-    all_vacancies = []
-    page = 0
-    # Ограничиваем количество вакансий до 10
-    max_vacancies = 10
-    while len(all_vacancies) < max_vacancies:
-        params = {
-            "text": filters.get("position") or "",
-            "area": area_id,
-            "per_page": 5,
-            "page": page,
-            "only_with_salary": only_with_salary,
-        }
+vacancies_cache = TTLCache(
+    ttl=HH_RESULT_RETENTION,
+    max_entries=HH_CACHE_MAX_ENTRIES,
+    max_bytes=HH_CACHE_MAX_BYTES,
+)
+
+# Подробности вакансий по id
+vacancy_details_cache = TTLCache(
+    ttl=HH_DETAILS_TTL,
+    max_entries=HH_DETAILS_MAX_ENTRIES,
+    max_bytes=HH_DETAILS_MAX_BYTES,
+)
+_details_inflight: Dict[str, "asyncio.Task[Optional[Vacancy]]"] = {}
+
+# Фоновые задачи (предзагрузка), храним ссылки, чтобы их не собрал GC
+_background_tasks: Set["asyncio.Task[Any]"] = set()
+
+# Хранилище второго уровня кэша (подключается в lifespan приложения)
+_persistent_store = None
+# Куда сохранять загруженные с hh.ru вакансии (таблица vacancies)
+_vacancy_sink: Optional[Callable[[List[Vacancy]], Awaitable[None]]] = None
+
+# Загрузки, которые выполняются прямо сейчас: ключ кэша -> _PendingSearch
+_inflight: Dict[str, "_PendingSearch"] = {}
+
+# Счётчики для мониторинга работы с hh.ru
+hh_metrics: Dict[str, int] = {
+    "requests": 0,
+    "retries": 0,
+    "throttled_responses": 0,
+    "failed_requests": 0,
+    "coalesced_requests": 0,
+    "incremental_searches": 0,
+}
+
+# Общий для процесса лимит запросов к hh.ru
+hh_rate_limiter = TokenBucket(rate=HH_RATE_LIMIT, capacity=HH_RATE_BURST)
+
+def _clean_text(value: Any) -> str:
+    """Текстовый фильтр без лишних пробелов"""
+    return " ".join(str(value or "").split())
+
+
+def _normalize_text(value: Any) -> str:
+    """Приводит текстовый фильтр к каноническому виду: без регистра и лишних пробелов"""
+    return _clean_text(value).lower()
+
+
+def build_user_filters(user_filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Фильтры поиска из строки search_filters (для /vacancies и рассылки)"""
+    filters = {
+        "position": "QA",  # жестко задано по умолчанию
+    }
+
+    if user_filters:
+        # Обновляем фильтры из базы данных
+        if user_filters.get("position"):
+            filters["position"] = user_filters["position"]
+        if user_filters.get("city"):
+            filters["city"] = user_filters["city"]
+        if user_filters.get("salary_from"):
+            filters["salary_from"] = user_filters["salary_from"]
+        if user_filters.get("remote") is not None:
+            filters["remote"] = user_filters["remote"]
+        if user_filters.get("metro"):
+            filters["metro"] = user_filters["metro"]
+        if user_filters.get("freshness_days"):
+            filters["freshness_days"] = user_filters["freshness_days"]
+        if user_filters.get("employment"):
+            filters["employment"] = user_filters["employment"]
+        if user_filters.get("experience"):
+            filters["experience"] = user_filters["experience"]
+        if user_filters.get("only_direct_employers") is not None:
+            filters["only_direct_employers"] = user_filters["only_direct_employers"]
+    return filters
+
+
+def build_search_params(filters: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Превращает фильтры пользователя в канонический набор параметров hh.ru
+    (без per_page/page): пустые и выключенные значения опускаются, лишние
+    пробелы в тексте убираются. Регистр текста сохраняется — в hh.ru уходит
+    запрос пользователя; без учёта регистра его сравнивает query_fingerprint.
+    Возвращает None, если город не поддерживается.
+    """
+    area = resolve_area(filters.get("city"))
+    if area is None:
+        return None
 
-        if filters.get("salary_from"):
-            params["salary"] = filters["salary_from"]
-
-        # Остальные фильтры
-        if filters.get("remote"):
-            params["schedule"] = "remote"
-        if filters.get("freshness_days") in (1, 2, 3):
-            params["period"] = filters["freshness_days"]
-        if filters.get("employment"):
-            params["employment"] = filters["employment"]
-        if filters.get("experience"):
-            params["experience"] = filters["experience"]
-        if filters.get("only_direct_employers"):
-            params["employer_type"] = "direct"
-
-        async with httpx.AsyncClient(timeout=10) as client:
-            headers = {"User-Agent": "Mozilla/5.0 (compatible; HH-Bot/1.0; +http://bot.example.com/bot.html)"}
-            try:
-                resp = await client.get(HH_API_URL, params=params, headers=headers)
-                if resp.status_code == 200:
-                    response_data = resp.json()
-                    vacancies = response_data.get("items", [])
-                    
-                    # Если на странице нет вакансий, прерываем цикл
-                    if not vacancies:
-                        break
-                    
-                    # Преобразуем вакансии в нужный формат
-                    for v in vacancies:
-                        if len(all_vacancies) >= max_vacancies:
-                            break
-                        all_vacancies.append({
-                            "id": v["id"],
-                            "name": v["name"],
-                            "employer": {
-                                "name": v["employer"]["name"]
-                            },
-                            "area": {
-                                "name": v["area"]["name"]
-                            },
-                            "salary": v.get("salary"),
-                            "alternate_url": v["alternate_url"]
-                        })
-                    
-                    # Проверяем, есть ли еще страницы
-                    found_pages = response_data.get("pages", 0)
-                    if page + 1 >= found_pages:
-                        break
-                    
+    params: Dict[str, Any] = {
+        "text": _clean_text(filters.get("position")),
+        "area": area.id,
+    }
+
+    salary_from = filters.get("salary_from")
+    if salary_from:
+        params["salary"] = int(salary_from)
+        params["only_with_salary"] = True
+
+    # Остальные фильтры
+    if filters.get("remote"):
+        params["schedule"] = "remote"
+    elif filters.get("metro"):
+        # Станции метро фильтруются на стороне hh.ru
+        station_ids = metro_station_ids(area.id, filters["metro"])
+        if station_ids:
+            params["metro"] = station_ids
+    if filters.get("freshness_days") in (1, 2, 3):
+        params["period"] = int(filters["freshness_days"])
+    employment = _normalize_text(filters.get("employment"))
+    if employment:
+        params["employment"] = employment
+    experience = (filters.get("experience") or "").strip()
+    if experience:
+        params["experience"] = experience
+    if filters.get("only_direct_employers"):
+        params["employer_type"] = "direct"
+    return params
+
+
+async def _ensure_dictionaries(filters: Dict[str, Any]) -> None:
+    """Подгружает справочники, нужные build_search_params (метро города)"""
+    if filters.get("metro") and not filters.get("remote"):
+        area = resolve_area(filters.get("city"))
+        if area is not None:
+            await ensure_metro_index(area.id)
+
+
+def query_fingerprint(params: Dict[str, Any]) -> str:
+    """
+    Стабильный хэш канонических параметров поиска (для кэша и логов):
+    запросы, отличающиеся только регистром текста, дают один отпечаток
+    """
+    if "text" in params:
+        params = {**params, "text": _normalize_text(params["text"])}
+    canonical = json.dumps(params, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+async def search_fingerprint(filters: Dict[str, Any]) -> Optional[str]:
+    """Отпечаток поиска по фильтрам; None, если поиск невозможен (неизвестный город)"""
+    await _ensure_dictionaries(filters)
+    params = build_search_params(filters)
+    return query_fingerprint(params) if params is not None else None
+
+
+def _retry_after(resp: httpx.Response) -> Optional[float]:
+    """Время ожидания из заголовка Retry-After (секунды или HTTP-дата)"""
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def _backoff(attempt: int) -> float:
+    """Экспоненциальная задержка с полным джиттером"""
+    return random.uniform(0, min(HH_BACKOFF_MAX, HH_BACKOFF_BASE * 2 ** attempt))
+
+
+async def request_json(url: str, params: Optional[Dict[str, Any]] = None) -> Optional[Any]:
+    """
+    GET-запрос к hh.ru через общий rate limiter. На 429 и 5xx, а также
+    на сетевых ошибках и оборванном (не разбираемом) JSON повторяет
+    запрос с экспоненциальной задержкой;
+    Retry-After от hh.ru приостанавливает весь трафик процесса.
+    После исчерпания попыток или на прочих ошибках возвращает None.
+    Через него же идут запросы справочников (services/hh_dictionaries.py).
+    """
+    for attempt in range(HH_MAX_RETRIES + 1):
+        await hh_rate_limiter.acquire()
+        hh_metrics["requests"] += 1
+        try:
+            resp = await get_http_client().get(url, params=params)
+        except httpx.HTTPError as e:
+            print(f"⚠️ Ошибка запроса к hh.ru ({url}): {e}")
+            delay = _backoff(attempt)
+        else:
+            if resp.status_code == 200:
+                try:
+                    return resp.json()
+                except ValueError as e:
+                    # Ответ оборвался или пришла не JSON-страница — как при 5xx
+                    print(f"⚠️ hh.ru вернул некорректный JSON ({url}), попытка {attempt + 1}: {e}")
+                    delay = _backoff(attempt)
+            elif resp.status_code != 429 and resp.status_code < 500:
+                print(f"⚠️ hh.ru вернул {resp.status_code} ({url})")
+                hh_metrics["failed_requests"] += 1
+                return None
+            else:
+                print(f"⚠️ hh.ru вернул {resp.status_code} ({url}), попытка {attempt + 1}")
+                retry_after = _retry_after(resp)
+                if resp.status_code == 429:
+                    hh_metrics["throttled_responses"] += 1
+                if retry_after is not None:
+                    hh_rate_limiter.pause(retry_after)
+                    delay = retry_after
                 else:
-                    # Продолжаем, даже если одна из страниц вернула ошибку
-                    break
-            except httpx.HTTPStatusError:
-                # Продолжаем, даже если одна из страниц вернула ошибку
-                break
-            except httpx.RequestError:
-                # Продолжаем, даже если одна из страниц вернула ошибку
-                break
-            except Exception:
-                # Продолжаем, даже если одна из страниц вернула ошибку
-                break
-
-        # Опционально: задержка, чтобы не получить блокировку
-        await asyncio.sleep(0.5)
-        
-        page += 1
+                    delay = _backoff(attempt)
+        if attempt < HH_MAX_RETRIES:
+            hh_metrics["retries"] += 1
+            await asyncio.sleep(delay)
+    hh_metrics["failed_requests"] += 1
+    return None
+
+
+async def _fetch_page(params: Dict[str, Any], page: int) -> Optional[Dict[str, Any]]:
+    """Загружает одну страницу выдачи. При любой ошибке возвращает None."""
+    return await request_json(HH_API_URL, {**params, "page": page})
+
+
+PUBLISHED_AT_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
+
+
+def _parse_published(value: Optional[str]) -> Optional[datetime]:
+    """Разбирает published_at из ответа hh.ru (2024-05-01T10:00:00+0300)"""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, PUBLISHED_AT_FORMAT)
+    except ValueError:
+        return None
+
+
+def _format_published(value: datetime) -> str:
+    return value.strftime(PUBLISHED_AT_FORMAT)
+
+
+def _newest_published(vacancies: List[Vacancy]) -> Optional[datetime]:
+    dates = [d for d in (_parse_published(v.published_at) for v in vacancies) if d is not None]
+    return max(dates) if dates else None
+
+
+def _drop_outdated(vacancies: List[Vacancy], period_days: Optional[int]) -> List[Vacancy]:
+    """Убирает вакансии, вышедшие за окно «свежести» запроса"""
+    if not period_days:
+        return vacancies
+    cutoff = datetime.now(timezone.utc) - timedelta(days=period_days)
+    result = []
+    for vacancy in vacancies:
+        published = _parse_published(vacancy.published_at)
+        if published is None or published >= cutoff:
+            result.append(vacancy)
+    return result
+
+
+@dataclass(slots=True)
+class _SearchResult:
+    """
+    Результат поиска в кэше: вакансии и отметка публикации самой новой
+    из них (watermark) — с неё начинается следующая догрузка;
+    crawled_at — когда запрос последний раз выполнялся целиком.
+    """
+
+    vacancies: List[Vacancy]
+    watermark: Optional[datetime]
+    fetched_at: float = field(default_factory=time.monotonic)
+    crawled_at: float = field(default_factory=time.time)
+
+    def is_fresh(self) -> bool:
+        return time.monotonic() - self.fetched_at < HH_CACHE_TTL
+
+    def can_increment(self) -> bool:
+        return self.watermark is not None and time.time() - self.crawled_at < HH_FULL_REFRESH_INTERVAL
+
+    def to_dict(self) -> Dict[str, Any]:
+        # Монотонное время не переживает рестарт, сохраняем настенное
+        return {
+            "vacancies": [v.to_dict() for v in self.vacancies],
+            "watermark": _format_published(self.watermark) if self.watermark else None,
+            "fetched_at": time.time() - (time.monotonic() - self.fetched_at),
+            "crawled_at": self.crawled_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "_SearchResult":
+        return cls(
+            vacancies=[Vacancy.from_dict(v) for v in data["vacancies"]],
+            watermark=_parse_published(data.get("watermark")),
+            fetched_at=time.monotonic() - (time.time() - data["fetched_at"]),
+            # Записи без crawled_at сохранены до его появления: обновим целиком
+            crawled_at=data.get("crawled_at", 0.0),
+        )
+
+
+class _PendingSearch:
+    """
+    Выполняющаяся загрузка одного запроса: страницы вакансий по мере
+    поступления и задача, которая их загружает. К ней могут подключиться
+    несколько потребителей, в том числе после начала загрузки.
+    """
+
+    def __init__(self):
+        self.batches: List[List[Vacancy]] = []
+        self.task: Optional["asyncio.Task[List[Vacancy]]"] = None
+        self._updated = asyncio.Event()
+
+    def add_batch(self, batch: List[Vacancy]) -> None:
+        self.batches.append(batch)
+        self.notify()
+
+    def notify(self) -> None:
+        self._updated.set()
+        self._updated = asyncio.Event()
+
+    async def stream(self) -> AsyncIterator[List[Vacancy]]:
+        index = 0
+        while True:
+            updated = self._updated
+            while index < len(self.batches):
+                yield self.batches[index]
+                index += 1
+            if self.task.done():
+                if index == len(self.batches):
+                    # Пробрасываем ошибку загрузки, если она была
+                    self.task.result()
+                    return
+                continue
+            await updated.wait()
+
+
+def _forget_search(cache_key: str, search: "_PendingSearch") -> None:
+    """
+    Убирает завершённую загрузку из _inflight. Под тем же ключом уже может
+    стоять новая загрузка (старая завершилась, но не успела себя убрать) —
+    её не трогаем.
+    """
+    if _inflight.get(cache_key) is search:
+        del _inflight[cache_key]
+
+
+async def iter_vacancies(filters: Dict[str, Any], max_results: Optional[int] = None) -> AsyncIterator[List[Vacancy]]:
+    """
+    Отдаёт вакансии пачками — по странице hh.ru, как только она загружена,
+    в порядке выдачи. Результат из кэша отдаётся одной пачкой.
+    Одинаковые запросы, пришедшие одновременно, объединяются в одну
+    загрузку; прерванный потребитель не останавливает её для остальных.
+    """
+    limit = min(max_results or HH_MAX_RESULTS, HH_MAX_DEPTH)
+
+    await _ensure_dictionaries(filters)
+    params = build_search_params(filters)
+    if params is None:
+        return
+
+    # Ключ кэша — отпечаток канонического запроса, а не сырые фильтры
+    fingerprint = query_fingerprint(params)
+    cache_key = f"{fingerprint}:{limit}"
+
+    # Свежий результат отдаём из кэша; устаревший используем как основу
+    # для инкрементальной догрузки новых вакансий
+    previous = vacancies_cache.get(cache_key)
+    if previous is None:
+        previous = await _restore_search_result(cache_key)
+    if previous is not None and previous.is_fresh():
+        if previous.vacancies:
+            yield previous.vacancies
+        return
+
+    search = _inflight.get(cache_key)
+    # Завершённая загрузка может ещё не успеть убрать себя из _inflight
+    if search is not None and not search.task.done():
+        hh_metrics["coalesced_requests"] += 1
+    else:
+        search = _PendingSearch()
+        search.task = asyncio.ensure_future(_load_vacancies(params, limit, cache_key, search, previous))
+        _inflight[cache_key] = search
+        search.task.add_done_callback(lambda _: _forget_search(cache_key, search))
+        search.task.add_done_callback(lambda _: search.notify())
+
+    async for batch in search.stream():
+        yield batch
+
+
+async def fetch_vacancies(filters: Dict[str, Any], max_results: Optional[int] = None) -> List[Vacancy]:
+    """Загружает вакансии целиком (собирает все пачки iter_vacancies)"""
+    all_vacancies = []
+    async for batch in iter_vacancies(filters, max_results):
+        all_vacancies.extend(batch)
+    return all_vacancies
+
+
+async def _load_vacancies(
+    search_params: Dict[str, Any],
+    limit: int,
+    cache_key: str,
+    search: _PendingSearch,
+    previous: Optional["_SearchResult"] = None,
+) -> List[Vacancy]:
+    """
+    Загружает вакансии по запросу и сохраняет результат в кэш.
+    Если для запроса уже есть результат с отметкой публикации,
+    с hh.ru запрашиваются только вакансии, опубликованные после неё;
+    раз в HH_FULL_REFRESH_INTERVAL запрос выполняется целиком.
+    """
+    if previous is not None and previous.can_increment():
+        return await _load_increment(search_params, limit, cache_key, search, previous)
+
+    print(f"🔎 Загрузка вакансий hh.ru, запрос {cache_key}")
+    vacancies = await _crawl(search_params, limit, search.add_batch)
+    if vacancies is None:
+        # Не кэшируем ошибку, чтобы следующий запрос попробовал снова
+        return []
 
     # Сохраняем результат в кэш
-    vacancies_cache[cache_key] = (current_time, all_vacancies)
-    
+    _store_search_result(cache_key, _SearchResult(vacancies, _newest_published(vacancies)))
+    return vacancies
+
+
+async def _load_increment(
+    search_params: Dict[str, Any],
+    limit: int,
+    cache_key: str,
+    search: _PendingSearch,
+    previous: "_SearchResult",
+) -> List[Vacancy]:
+    """
+    Догружает вакансии, опубликованные после отметки previous.watermark,
+    и вливает их в сохранённый результат. Новые идут первыми, вакансии
+    старше окна «свежести» (period) отбрасываются.
+    """
+    # hh.ru не принимает period вместе с date_from
+    params = {key: value for key, value in search_params.items() if key != "period"}
+    params["date_from"] = _format_published(previous.watermark)
+    params["order_by"] = "publication_time"
+    print(f"🔎 Догрузка вакансий hh.ru с {params['date_from']}, запрос {cache_key}")
+
+    fresh = await _crawl(params, limit)
+    if fresh is None:
+        # hh.ru недоступен — отдаём то, что уже есть, не продлевая свежесть
+        if previous.vacancies:
+            search.add_batch(previous.vacancies)
+        return previous.vacancies
+
+    hh_metrics["incremental_searches"] += 1
+    # date_from включает границу, поэтому часть вакансий может повториться
+    fresh_ids = {v.id for v in fresh}
+    merged = fresh + [v for v in previous.vacancies if v.id not in fresh_ids]
+    merged = _drop_outdated(merged, search_params.get("period"))[:limit]
+
+    newest = _newest_published(fresh)
+    watermark = max(previous.watermark, newest) if newest else previous.watermark
+    _store_search_result(cache_key, _SearchResult(merged, watermark, crawled_at=previous.crawled_at))
+    if merged:
+        search.add_batch(merged)
+    return merged
+
+
+async def _crawl(
+    search_params: Dict[str, Any],
+    limit: int,
+    on_batch: Optional[Callable[[List[Vacancy]], None]] = None,
+) -> Optional[List[Vacancy]]:
+    """
+    Загружает вакансии: сначала страницу 0 (из неё узнаём pages/found),
+    затем остальные страницы параллельно, но не больше HH_PAGE_CONCURRENCY
+    запросов одновременно. Страницы передаются в on_batch по порядку.
+    Возвращает None, если не удалось загрузить даже первую страницу.
+    """
+    per_page = min(HH_PER_PAGE, limit)
+    params = {**search_params, "per_page": per_page}
+
+    first_page = await _fetch_page(params, 0)
+    if first_page is None:
+        return None
+
+    # hh.ru отдаёт не больше HH_MAX_DEPTH результатов на один поиск
+    total_pages = min(
+        first_page.get("pages", 0),
+        -(-limit // per_page),
+        HH_MAX_DEPTH // per_page,
+    )
+
+    semaphore = asyncio.Semaphore(HH_PAGE_CONCURRENCY)
+
+    async def fetch_with_limit(page: int) -> Optional[Dict[str, Any]]:
+        async with semaphore:
+            return await _fetch_page(params, page)
+
+    all_vacancies: List[Vacancy] = []
+
+    def add_page(page_data: Optional[Dict[str, Any]]) -> None:
+        # Пропускаем страницы, которые вернули ошибку
+        if page_data is None or len(all_vacancies) >= limit:
+            return
+        batch = [Vacancy.from_hh(v) for v in page_data.get("items", [])][:limit - len(all_vacancies)]
+        if batch:
+            _ingest(batch)
+            all_vacancies.extend(batch)
+            if on_batch is not None:
+                on_batch(batch)
+
+    add_page(first_page)
+    other_pages = [asyncio.ensure_future(fetch_with_limit(page)) for page in range(1, total_pages)]
+    try:
+        # Страницы грузятся параллельно, а отдаются строго по порядку
+        for page_task in other_pages:
+            add_page(await page_task)
+    finally:
+        for page_task in other_pages:
+            page_task.cancel()
+
     return all_vacancies
 
-async def send_daily_vacancies(bot):
+
+async def fetch_vacancy_details(vacancy_ids: Iterable[str]) -> Dict[str, Vacancy]:
+    """
+    Загружает полные карточки вакансий (с описанием) пачкой: из кэша,
+    а недостающие — параллельно, не больше HH_DETAILS_CONCURRENCY запросов
+    одновременно. Вакансии, которые не удалось загрузить, в ответ не попадают.
+    """
+    result: Dict[str, Vacancy] = {}
+    missing = []
+    for vacancy_id in dict.fromkeys(str(v) for v in vacancy_ids):
+        cached = vacancy_details_cache.get(vacancy_id)
+        if cached is not None:
+            result[vacancy_id] = cached
+        else:
+            missing.append(vacancy_id)
+
+    # Что не нашлось в памяти, ищем во втором уровне кэша
+    if missing:
+        restored = await _restore_many("details", missing)
+        for vacancy_id, (data, ttl) in restored.items():
+            vacancy = Vacancy.from_dict(data)
+            vacancy_details_cache.set(vacancy_id, vacancy, ttl=ttl)
+            result[vacancy_id] = vacancy
+        missing = [vacancy_id for vacancy_id in missing if vacancy_id not in restored]
+
+    semaphore = asyncio.Semaphore(HH_DETAILS_CONCURRENCY)
+
+    async def load(vacancy_id: str) -> Optional[Vacancy]:
+        task = _details_inflight.get(vacancy_id)
+        if task is None:
+            task = asyncio.ensure_future(_load_vacancy_details(vacancy_id, semaphore))
+            _details_inflight[vacancy_id] = task
+            task.add_done_callback(lambda _: _details_inflight.pop(vacancy_id, None))
+        return await asyncio.shield(task)
+
+    for vacancy_id, vacancy in zip(missing, await asyncio.gather(*(load(v) for v in missing))):
+        if vacancy is not None:
+            result[vacancy_id] = vacancy
+    return result
+
+
+async def _load_vacancy_details(vacancy_id: str, semaphore: asyncio.Semaphore) -> Optional[Vacancy]:
+    async with semaphore:
+        data = await request_json(f"{HH_API_URL}/{vacancy_id}")
+    if data is None:
+        return None
+    vacancy = Vacancy.from_hh(data)
+    vacancy_details_cache.set(vacancy_id, vacancy)
+    _persist("details", {vacancy_id: vacancy.to_dict()}, HH_DETAILS_TTL)
+    _ingest([vacancy])
+    return vacancy
+
+
+def prefetch_vacancy_details(vacancy_ids: Iterable[str]) -> None:
+    """Прогревает кэш подробностей в фоне (например, для видимой страницы)"""
+    ids = [str(v) for v in vacancy_ids if str(v) not in vacancy_details_cache]
+    if not ids:
+        return
+    _start_background(fetch_vacancy_details(ids))
+
+
+def set_persistent_store(store) -> None:
+    global _persistent_store
+    _persistent_store = store
+
+
+def init_persistent_cache(database_url: Optional[str]) -> None:
+    """
+    Подключает второй уровень кэша и в фоне подгружает в память
+    последние сохранённые записи, чтобы после деплоя не идти в hh.ru холодным.
+    """
+    set_persistent_store(create_cache_store(HH_PERSISTENT_CACHE, database_url, HH_PERSISTENT_CACHE_DIR))
+    if _persistent_store is not None:
+        _start_background(_warm_up_caches())
+
+
+async def _warm_up_caches() -> None:
+    try:
+        await _persistent_store.purge_expired()
+        searches = await _persistent_store.load_hot("search", HH_WARMUP_KEYS)
+        details = await _persistent_store.load_hot("details", HH_WARMUP_KEYS)
+    except Exception as e:
+        print(f"⚠️ Не удалось прогреть кэш hh.ru: {e}")
+        return
+    # Сначала самые давние, чтобы самые свежие оказались последними в LRU.
+    # Запись живёт в памяти столько, сколько ей осталось в хранилище
+    searches = [entry for entry in searches if entry[2] > 0]
+    details = [entry for entry in details if entry[2] > 0]
+    for cache_key, data, ttl in reversed(searches):
+        vacancies_cache.set(cache_key, _SearchResult.from_dict(data), ttl=ttl)
+    for vacancy_id, data, ttl in reversed(details):
+        vacancy_details_cache.set(vacancy_id, Vacancy.from_dict(data), ttl=ttl)
+    print(f"🔥 Кэш hh.ru прогрет: {len(searches)} поисков, {len(details)} вакансий")
+
+
+async def _restore_many(namespace: str, keys: List[str]) -> Dict[str, Tuple[Any, float]]:
     """
-    Функция для ежедневной рассылки вакансий пользователям
+    Читает записи из второго уровня кэша вместе с оставшимся временем
+    жизни; ошибки хранилища не ломают поиск
     """
-    # Заглушка для функции рассылки
-    # В реальной реализации здесь будет логика получения пользователей и отправки им вакансий
-    print("📧 Daily vacancies sending process started")
-    # Примерная реализация:
-    # 1. Получить всех пользователей, подписанных на рассылку
-    # 2. Для каждого пользователя получить подходящие вакансии
-    # 3. Отправить вакансии через бота
-    pass
\ No newline at end of file
+    if _persistent_store is None:
+        return {}
+    try:
+        return await _persistent_store.get_many(namespace, keys)
+    except Exception as e:
+        print(f"⚠️ Ошибка чтения кэша hh.ru ({namespace}): {e}")
+        return {}
+
+
+async def _restore_search_result(cache_key: str) -> Optional[_SearchResult]:
+    entry = (await _restore_many("search", [cache_key])).get(cache_key)
+    if entry is None:
+        return None
+    data, ttl = entry
+    result = _SearchResult.from_dict(data)
+    vacancies_cache.set(cache_key, result, ttl=ttl)
+    return result
+
+
+def _store_search_result(cache_key: str, result: _SearchResult) -> None:
+    vacancies_cache.set(cache_key, result)
+    _persist("search", {cache_key: result.to_dict()}, HH_RESULT_RETENTION)
+
+
+def _persist(namespace: str, items: Dict[str, Any], ttl: float) -> None:
+    """Записывает во второй уровень кэша в фоне, не задерживая ответ"""
+    if _persistent_store is None:
+        return
+
+    async def write() -> None:
+        try:
+            await _persistent_store.set_many(namespace, items, ttl)
+        except Exception as e:
+            print(f"⚠️ Ошибка записи кэша hh.ru ({namespace}): {e}")
+
+    _start_background(write())
+
+
+def set_vacancy_sink(sink: Optional[Callable[[List[Vacancy]], Awaitable[None]]]) -> None:
+    """Подключает сохранение вакансий, загруженных с hh.ru (например, db.models.upsert_vacancies)"""
+    global _vacancy_sink
+    _vacancy_sink = sink
+
+
+def _ingest(vacancies: List[Vacancy]) -> None:
+    """Сохраняет пачку вакансий в фоне, не задерживая ответ"""
+    if _vacancy_sink is None:
+        return
+    sink = _vacancy_sink
+
+    async def write() -> None:
+        try:
+            await sink(vacancies)
+        except Exception as e:
+            print(f"⚠️ Ошибка сохранения вакансий: {e}")
+
+    _start_background(write())
+
+
+def _start_background(coro) -> None:
+    task = asyncio.ensure_future(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
@@ -1,17 +1,27 @@
 # services/llm_service.py
+import hashlib
 import httpx
 from typing import Dict, Any
 
-async def generate_resume(vacancy: Dict[str, Any], user: Dict[str, Any], settings: Dict[str, Any]) -> str:
+from db.models import get_generated_document, save_generated_document
+from services.vacancy import Vacancy
+
+MAX_DESCRIPTION_CHARS = 3000
+DEFAULT_MODEL = "gpt-3.5-turbo"
+
+async def generate_resume(vacancy: Vacancy, user: Dict[str, Any], settings: Dict[str, Any], regenerate: bool = False) -> str:
     prompt = f"""
 Роль: эксперт по трудоустройству.
 Задача: создать профессиональное резюме на русском языке для кандидата под вакансию.
 
 Вакансия:
-- Название: {vacancy['title']}
-- Компания: {vacancy['company']}
-- Город: {vacancy['city']}
-- Зарплата: {vacancy.get('salary_from', 'не указана')} – {vacancy.get('salary_to', 'не указана')}
+- Название: {vacancy.name}
+- Компания: {vacancy.employer_name}
+- Город: {vacancy.area_name}
+- Зарплата: {vacancy.salary_from or 'не указана'} – {vacancy.salary_to or 'не указана'}
+- Требуемый опыт: {vacancy.experience or 'не указан'}
+- Занятость: {vacancy.employment or 'не указана'}
+- Описание: {_description(vacancy)}
 
 Профиль кандидата:
 - ФИО: {user.get('full_name', '—')}
@@ -25,14 +35,15 @@ async def generate_resume(vacancy: Dict[str, Any], user: Dict[str, Any], setting
 - Используй структуру: Контакты, Цель, Опыт работы, Навыки, Образование.
 - Адаптируй под вакансию.
 """
-    return await _call_llm(prompt, settings)
+    return await _generate("resume", vacancy, user, prompt, settings, regenerate)
 
-async def generate_cover_letter(vacancy: Dict[str, Any], user: Dict[str, Any], settings: Dict[str, Any]) -> str:
+async def generate_cover_letter(vacancy: Vacancy, user: Dict[str, Any], settings: Dict[str, Any], regenerate: bool = False) -> str:
     prompt = f"""
 Роль: соискатель высокой квалификации.
 Задача: написать сопроводительное письмо на русском для вакансии.
 
-Вакансия: {vacancy['title']} в компании {vacancy['company']} ({vacancy['city']}).
+Вакансия: {vacancy.name} в компании {vacancy.employer_name} ({vacancy.area_name}).
+Описание вакансии: {_description(vacancy)}
 
 Профиль:
 - Имя: {user.get('full_name', '—')}
@@ -44,29 +55,67 @@ async def generate_cover_letter(vacancy: Dict[str, Any], user: Dict[str, Any], s
 - Не пиши «Уважаемая HR-команда» — начни сразу с сути.
 - Только текст письма, без подписи и приветствия.
 """
-    return await _call_llm(prompt, settings)
+    return await _generate("cover_letter", vacancy, user, prompt, settings, regenerate)
 
-async def _call_llm(prompt: str, settings: Dict[str, Any]) -> str:
-    base_url = settings.get("base_url") or "https://api.openai.com/v1"
-    api_key = settings.get("api_key")
-    model = settings.get("model") or "gpt-3.5-turbo"
+def _description(vacancy: Vacancy) -> str:
+    # Описание уже очищено от HTML; обрезаем, чтобы не раздувать промпт
+    if not vacancy.description:
+        return "не указано"
+    return vacancy.description[:MAX_DESCRIPTION_CHARS]
 
-    if not api_key:
-        return "❗ Сначала задайте LLM API-ключ через /llm_settings"
+async def _generate(
+    kind: str,
+    vacancy: Vacancy,
+    user: Dict[str, Any],
+    prompt: str,
+    settings: Dict[str, Any],
+    regenerate: bool = False,
+) -> str:
+    """
+    Документ по тем же данным (модель и промпт) генерируется один раз:
+    повторный запрос берёт его из generated_documents, а не из LLM.
+    С regenerate=True сохранённый документ не читается: LLM пишет новый,
+    и он заменяет прежний.
+    """
+    model = settings.get("model") or DEFAULT_MODEL
+    telegram_id = user.get("telegram_id")
+    input_hash = hashlib.sha256(f"{model}\n{prompt}".encode("utf-8")).hexdigest()
+    if not regenerate:
+        try:
+            saved = await get_generated_document(telegram_id, vacancy.id, kind, input_hash)
+        except Exception as e:
+            print(f"⚠️ Ошибка чтения сгенерированных документов: {e}")
+            saved = None
+        if saved is not None:
+            return saved
 
+    if not settings.get("api_key"):
+        return "❗ Сначала задайте LLM API-ключ через /llm_settings"
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            resp = await client.post(
-                f"{base_url.rstrip('/')}/chat/completions",
-                headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
-                json={
-                    "model": model,
-                    "messages": [{"role": "user", "content": prompt}],
-                    "temperature": 0.7,
-                    "max_tokens": 1000
-                }
-            )
-            resp.raise_for_status()
-            return resp.json()["choices"][0]["message"]["content"].strip()
+        content = await _call_llm(prompt, settings)
     except Exception as e:
-        return f"❌ Ошибка LLM: {str(e)}"
\ No newline at end of file
+        return f"❌ Ошибка LLM: {str(e)}"
+    try:
+        await save_generated_document(telegram_id, vacancy.id, kind, input_hash, model, content)
+    except Exception as e:
+        print(f"⚠️ Не удалось сохранить сгенерированный документ: {e}")
+    return content
+
+async def _call_llm(prompt: str, settings: Dict[str, Any]) -> str:
+    base_url = settings.get("base_url") or "https://api.openai.com/v1"
+    api_key = settings.get("api_key")
+    model = settings.get("model") or DEFAULT_MODEL
+
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        resp = await client.post(
+            f"{base_url.rstrip('/')}/chat/completions",
+            headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
+            json={
+                "model": model,
+                "messages": [{"role": "user", "content": prompt}],
+                "temperature": 0.7,
+                "max_tokens": 1000
+            }
+        )
+        resp.raise_for_status()
+        return resp.json()["choices"][0]["message"]["content"].strip()
\ No newline at end of file
@@ -0,0 +1,160 @@
+# services/persistent_cache.py
+import asyncio
+import hashlib
+import json
+import os
+import time
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+def _pack(value: Any) -> bytes:
+    return zlib.compress(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def _unpack(payload: bytes) -> Any:
+    return json.loads(zlib.decompress(payload).decode("utf-8"))
+
+
+def _acquire():
+    # Импорт при первом обращении: пакет db требует DATABASE_URL,
+    # а без Postgres (файловый кэш, бенчмарк, тесты) он не нужен
+    from db.database import acquire
+
+    return acquire()
+
+
+class PostgresCacheStore:
+    """
+    Второй уровень кэша в Postgres (таблица hh_cache, см. db/database.py).
+    Значения — JSON, сжатый zlib; просроченные записи не отдаются
+    и удаляются методом purge_expired(). Записи отдаются вместе с
+    оставшимся временем жизни в секундах, чтобы кэш в памяти не продлевал
+    его. Соединения берутся из общего пула приложения.
+    """
+
+    async def get_many(self, namespace: str, keys: Iterable[str]) -> Dict[str, Tuple[Any, float]]:
+        async with _acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT key, payload, EXTRACT(EPOCH FROM expires_at - now()) AS ttl FROM hh_cache
+                WHERE namespace = $1 AND key = ANY($2::text[]) AND expires_at > now()
+            """, namespace, list(keys))
+        return {row["key"]: (_unpack(row["payload"]), float(row["ttl"])) for row in rows}
+
+    async def set_many(self, namespace: str, items: Dict[str, Any], ttl: float) -> None:
+        if not items:
+            return
+        async with _acquire() as conn:
+            await conn.execute("""
+                INSERT INTO hh_cache (namespace, key, payload, stored_at, expires_at)
+                SELECT $1, k, p, now(), now() + make_interval(secs => $4)
+                FROM unnest($2::text[], $3::bytea[]) AS t(k, p)
+                ON CONFLICT (namespace, key) DO UPDATE SET
+                    payload = EXCLUDED.payload,
+                    stored_at = EXCLUDED.stored_at,
+                    expires_at = EXCLUDED.expires_at
+            """, namespace, list(items), [_pack(v) for v in items.values()], ttl)
+
+    async def load_hot(self, namespace: str, limit: int) -> List[Tuple[str, Any, float]]:
+        """Последние записанные живые записи — для прогрева памяти при старте"""
+        async with _acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT key, payload, EXTRACT(EPOCH FROM expires_at - now()) AS ttl FROM hh_cache
+                WHERE namespace = $1 AND expires_at > now()
+                ORDER BY stored_at DESC
+                LIMIT $2
+            """, namespace, limit)
+        return [(row["key"], _unpack(row["payload"]), float(row["ttl"])) for row in rows]
+
+    async def purge_expired(self) -> None:
+        async with _acquire() as conn:
+            await conn.execute("DELETE FROM hh_cache WHERE expires_at <= now()")
+
+
+class FileCacheStore:
+    """
+    Локальный вариант второго уровня кэша для разработки: по файлу
+    на запись в каталоге namespace, содержимое сжато zlib.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, namespace: str, key: str) -> str:
+        name = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, namespace, f"{name}.bin")
+
+    def _read(self, path: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(path, "rb") as f:
+                record = _unpack(f.read())
+        except (OSError, ValueError, zlib.error):
+            return None
+        return record if record["expires_at"] > time.time() else None
+
+    def _get_many(self, namespace: str, keys: Iterable[str]) -> Dict[str, Tuple[Any, float]]:
+        result = {}
+        for key in keys:
+            record = self._read(self._path(namespace, key))
+            if record is not None:
+                result[key] = (record["value"], record["expires_at"] - time.time())
+        return result
+
+    def _set_many(self, namespace: str, items: Dict[str, Any], ttl: float) -> None:
+        os.makedirs(os.path.join(self.directory, namespace), exist_ok=True)
+        expires_at = time.time() + ttl
+        for key, value in items.items():
+            path = self._path(namespace, key)
+            with open(f"{path}.tmp", "wb") as f:
+                f.write(_pack({"key": key, "expires_at": expires_at, "value": value}))
+            os.replace(f"{path}.tmp", path)
+
+    def _load_hot(self, namespace: str, limit: int) -> List[Tuple[str, Any, float]]:
+        directory = os.path.join(self.directory, namespace)
+        try:
+            entries = [entry for entry in os.scandir(directory) if entry.name.endswith(".bin")]
+        except OSError:
+            return []
+        entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+        result = []
+        for entry in entries[:limit]:
+            record = self._read(entry.path)
+            if record is not None:
+                result.append((record["key"], record["value"], record["expires_at"] - time.time()))
+        return result
+
+    def _purge_expired(self) -> None:
+        try:
+            namespaces = [entry.path for entry in os.scandir(self.directory) if entry.is_dir()]
+        except OSError:
+            return
+        for directory in namespaces:
+            for entry in os.scandir(directory):
+                if entry.name.endswith(".bin") and self._read(entry.path) is None:
+                    os.remove(entry.path)
+
+    # Файловые операции выполняются в отдельном потоке, чтобы не блокировать цикл событий
+    async def get_many(self, namespace: str, keys: Iterable[str]) -> Dict[str, Tuple[Any, float]]:
+        return await asyncio.to_thread(self._get_many, namespace, list(keys))
+
+    async def set_many(self, namespace: str, items: Dict[str, Any], ttl: float) -> None:
+        await asyncio.to_thread(self._set_many, namespace, items, ttl)
+
+    async def load_hot(self, namespace: str, limit: int) -> List[Tuple[str, Any, float]]:
+        return await asyncio.to_thread(self._load_hot, namespace, limit)
+
+    async def purge_expired(self) -> None:
+        await asyncio.to_thread(self._purge_expired)
+
+
+def create_cache_store(backend: Optional[str], database_url: Optional[str], directory: str):
+    """
+    Выбирает хранилище второго уровня: "postgres", "file" или "off".
+    По умолчанию — Postgres, если задан DATABASE_URL, иначе кэш только в памяти.
+    """
+    backend = (backend or ("postgres" if database_url else "off")).lower()
+    if backend == "postgres" and database_url:
+        return PostgresCacheStore()
+    if backend == "file":
+        return FileCacheStore(directory)
+    return None
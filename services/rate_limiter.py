@@ -0,0 +1,82 @@
+# services/rate_limiter.py
+import asyncio
+import time
+from typing import Callable, Dict
+
+
+class TokenBucket:
+    """
+    Асинхронный token bucket: rate токенов в секунду, запас до capacity.
+
+    reserve() сразу списывает токен (баланс может уйти в минус) и
+    возвращает, сколько нужно подождать, — так очередь ожидающих
+    обслуживается честно, без гонок между корутинами.
+    pause() блокирует выдачу токенов, например по Retry-After; на время
+    паузы запас не пополняется, и после неё ожидающие идут со скоростью
+    rate, а не все разом.
+    """
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+        self._blocked_until = 0.0
+        self.acquired = 0
+        self.waits = 0
+        self.total_wait = 0.0
+
+    def _refill(self) -> float:
+        now = self._clock()
+        # Во время паузы _updated указывает на её конец — токены не копятся
+        if now > self._updated:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+        return now
+
+    def _delay(self, now: float, debt: float) -> float:
+        return max(0.0, self._blocked_until - now) + max(0.0, debt) / self.rate
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        """Списывает токены и возвращает время ожидания в секундах"""
+        now = self._refill()
+        self._tokens -= tokens
+        delay = self._delay(now, -self._tokens)
+        self.acquired += 1
+        if delay > 0:
+            self.waits += 1
+            self.total_wait += delay
+        return delay
+
+    def wait_time(self, tokens: float = 1.0) -> float:
+        """Сколько ждать, пока токены появятся; ничего не списывает"""
+        now = self._refill()
+        return self._delay(now, tokens - self._tokens)
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        delay = self.reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds: float) -> None:
+        """Приостанавливает выдачу токенов на заданное время"""
+        self._refill()
+        self._blocked_until = max(self._blocked_until, self._clock() + seconds)
+        # Запас сгорает, пополнение начнётся только после паузы
+        self._tokens = min(self._tokens, 0.0)
+        self._updated = max(self._updated, self._blocked_until)
+
+    def is_idle(self) -> bool:
+        """Запас полон и пауз нет — состояние можно выбросить без потерь"""
+        now = self._refill()
+        return self._tokens >= self.capacity and self._blocked_until <= now
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "rate": self.rate,
+            "capacity": self.capacity,
+            "acquired": self.acquired,
+            "waits": self.waits,
+            "total_wait_seconds": round(self.total_wait, 3),
+        }
@@ -0,0 +1,173 @@
+# services/sent_vacancies.py
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from db.models import find_sent_vacancies, iter_sent_vacancies, purge_sent_vacancies
+from services.bloom import BloomFilter, bloom_hashes
+from services.vacancy import Vacancy
+
+# Сколько дней помнить отправленные вакансии
+DEDUP_RETENTION_DAYS = int(os.getenv("DEDUP_RETENTION_DAYS", "30"))
+# Размер фильтра одного пользователя: 5 вакансий в день × 30 дней с запасом.
+# При переполнении растёт только число точных проверок в БД
+DEDUP_BLOOM_CAPACITY = int(os.getenv("DEDUP_BLOOM_CAPACITY", "256"))
+DEDUP_BLOOM_ERROR = float(os.getenv("DEDUP_BLOOM_ERROR", "0.01"))
+# Записи других воркеров могут стать видимы с опозданием (транзакция
+# началась раньше), поэтому подгрузка новых записей берёт их с запасом
+DEDUP_REFRESH_OVERLAP = timedelta(seconds=int(os.getenv("DEDUP_REFRESH_OVERLAP", "120")))
+# Раз в сколько часов фильтры строятся заново: из них уходят отправки
+# старше DEDUP_RETENTION_DAYS (в том числе у воркеров рассылки в других процессах)
+DEDUP_REBUILD_INTERVAL = float(os.getenv("DEDUP_REBUILD_INTERVAL_HOURS", "24")) * 3600
+
+Pairs = Set[Tuple[int, str]]
+
+
+class SentVacancies:
+    """
+    Какие вакансии уже отправлялись пользователям.
+
+    Источник истины — таблица user_vacancies; перед ней у каждого
+    пользователя фильтр Блума в памяти (восстанавливается из таблицы
+    при старте). Вакансия, которой нет в фильтре, точно новая; в БД
+    проверяются только срабатывания фильтра, и одним запросом на пачку.
+    Пишет в таблицу доставка (save_delivery_statuses), фильтры узнают
+    об этом при refresh().
+    """
+
+    def __init__(
+        self,
+        lookup: Callable[[List[int], List[str]], Awaitable[Pairs]] = find_sent_vacancies,
+        load: Callable[..., Any] = iter_sent_vacancies,
+        purge: Callable[[int], Awaitable[int]] = purge_sent_vacancies,
+    ):
+        self._lookup = lookup
+        self._load = load
+        self._purge = purge
+        self._filters: Dict[int, BloomFilter] = {}
+        self._loaded = False
+        # Время самой свежей загруженной записи
+        self._watermark = None
+        # Когда фильтры были построены (time.monotonic)
+        self._built_at = 0.0
+        self._load_lock = asyncio.Lock()
+        self.exact_checks = 0
+        self.false_positives = 0
+
+    def _add(self, user_id: int, vacancy_id: str, filters: Optional[Dict[int, BloomFilter]] = None) -> None:
+        filters = self._filters if filters is None else filters
+        bloom = filters.get(user_id)
+        if bloom is None:
+            bloom = filters[user_id] = BloomFilter(DEDUP_BLOOM_CAPACITY, DEDUP_BLOOM_ERROR)
+        if vacancy_id not in bloom:
+            bloom.add(vacancy_id)
+
+    async def _load_since(self, since, filters: Optional[Dict[int, BloomFilter]] = None) -> int:
+        loaded = 0
+        async for user_id, vacancy_id, sent_at in self._load(DEDUP_RETENTION_DAYS, since=since):
+            self._add(user_id, vacancy_id, filters)
+            if self._watermark is None or sent_at > self._watermark:
+                self._watermark = sent_at
+            loaded += 1
+        return loaded
+
+    async def ensure_loaded(self) -> None:
+        """Восстанавливает фильтры из user_vacancies (один раз за процесс)"""
+        async with self._load_lock:
+            if self._loaded:
+                return
+            await self._load_since(None)
+            self._loaded = True
+            self._built_at = time.monotonic()
+            print(f"🧮 Фильтры отправленных вакансий восстановлены: {len(self._filters)} пользователей")
+
+    async def refresh(self) -> None:
+        """
+        Догружает записи, сделанные после последней загрузки, — в том числе
+        другими воркерами рассылки, чтобы их фильтры тоже знали об отправках
+        """
+        if not self._loaded:
+            await self.ensure_loaded()
+            return
+        if time.monotonic() - self._built_at >= DEDUP_REBUILD_INTERVAL:
+            await self.rebuild()
+            return
+        async with self._load_lock:
+            since = self._watermark - DEDUP_REFRESH_OVERLAP if self._watermark is not None else None
+            await self._load_since(since)
+
+    async def pick_new(
+        self,
+        user_ids: Iterable[int],
+        vacancies: List[Vacancy],
+        limit: int,
+    ) -> Dict[int, List[Vacancy]]:
+        """Для каждого пользователя — первые limit вакансий, которых он ещё не получал"""
+        hashes = [bloom_hashes(vac.id) for vac in vacancies]
+        user_ids = list(user_ids)
+        seen: Pairs = set()
+        hit_users: List[int] = []
+        hit_ids: List[str] = []
+        for user_id in user_ids:
+            bloom = self._filters.get(user_id)
+            if bloom is None:
+                continue
+            for vac, vac_hashes in zip(vacancies, hashes):
+                if bloom.contains_hashes(vac_hashes):
+                    hit_users.append(user_id)
+                    hit_ids.append(vac.id)
+
+        if hit_users:
+            found = await self._lookup(hit_users, hit_ids)
+            self.exact_checks += len(hit_users)
+            self.false_positives += len(hit_users) - len(found)
+            seen |= found
+
+        return {
+            user_id: [vac for vac in vacancies if (user_id, vac.id) not in seen][:limit]
+            for user_id in user_ids
+        }
+
+    async def rebuild(self) -> None:
+        """
+        Строит фильтры заново из user_vacancies. Фильтр Блума не умеет
+        удалять, поэтому без перестройки устаревшие отправки копятся в нём,
+        растёт доля ложных срабатываний, а с ней — число проверок в БД.
+        """
+        async with self._load_lock:
+            started = datetime.now(timezone.utc)
+            filters: Dict[int, BloomFilter] = {}
+            self._watermark = None
+            await self._load_since(None, filters)
+            self._filters = filters
+            self._loaded = True
+            self._built_at = time.monotonic()
+            # Записи, сделанные, пока шла загрузка
+            await self._load_since(started - DEDUP_REFRESH_OVERLAP)
+        print(f"🧮 Фильтры отправленных вакансий перестроены: {len(self._filters)} пользователей")
+
+    async def maintain(self) -> None:
+        """
+        Обслуживание (раз в сутки): удаляет отправки старше
+        DEDUP_RETENTION_DAYS и перестраивает фильтры без них
+        """
+        try:
+            removed = await self._purge(DEDUP_RETENTION_DAYS)
+            print(f"🧹 Удалено старых отправленных вакансий: {removed}")
+            await self.rebuild()
+        except Exception as e:
+            print(f"⚠️ Не удалось обслужить фильтры отправленных вакансий: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "users": len(self._filters),
+            "entries": sum(len(bloom) for bloom in self._filters.values()),
+            "bytes": sum(bloom.nbytes for bloom in self._filters.values()),
+            "exact_checks": self.exact_checks,
+            "false_positives": self.false_positives,
+        }
+
+
+sent_vacancies = SentVacancies()
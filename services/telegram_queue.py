@@ -0,0 +1,217 @@
+# services/telegram_queue.py
+import asyncio
+import itertools
+import os
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from aiogram.exceptions import TelegramRetryAfter
+
+from services.rate_limiter import TokenBucket
+
+# Лимиты Telegram: ~30 сообщений в секунду на бота и ~1 в секунду в один чат
+# (короткие всплески в чат допустимы — страница из нескольких карточек)
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+TELEGRAM_GLOBAL_BURST = float(os.getenv("TELEGRAM_GLOBAL_BURST", "30"))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+TELEGRAM_CHAT_BURST = float(os.getenv("TELEGRAM_CHAT_BURST", "10"))
+# Сколько сообщений отправляется одновременно
+TELEGRAM_SEND_WORKERS = int(os.getenv("TELEGRAM_SEND_WORKERS", "8"))
+# Сколько раз повторять сообщение после TelegramRetryAfter
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "3"))
+
+# Приоритеты: ответы пользователю идут раньше рассылки
+INTERACTIVE = 0
+BULK = 1
+LANE_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+
+class _Job:
+    __slots__ = ("priority", "send", "future", "retries", "reserved")
+
+    def __init__(self, priority: int, send: Callable[[], Awaitable[Any]], future: "asyncio.Future[Any]"):
+        self.priority = priority
+        self.send = send
+        self.future = future
+        self.retries = 0
+        # Токен чата уже списан (ожидаем своей очереди по времени)
+        self.reserved = False
+
+
+class _Chat:
+    __slots__ = ("bucket", "jobs", "scheduled")
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self.jobs: Deque[_Job] = deque()
+        # Чат стоит в очереди готовых или обслуживается воркером
+        self.scheduled = False
+
+
+class OutboundQueue:
+    """
+    Очередь исходящих сообщений Telegram.
+
+    У каждого чата своя FIFO-очередь и свой token bucket; в общую
+    очередь с приоритетом попадает чат, а не сообщение, и один чат
+    обслуживает не больше одного воркера — порядок сообщений в чате
+    сохраняется, а медленный чат не занимает воркеры. Чат, которому ещё
+    рано, возвращается в очередь по таймеру, не блокируя воркер; токен
+    общего bucket списывается только за сообщение, которое уходит сейчас.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = TELEGRAM_GLOBAL_RATE,
+        global_burst: float = TELEGRAM_GLOBAL_BURST,
+        chat_rate: float = TELEGRAM_CHAT_RATE,
+        chat_burst: float = TELEGRAM_CHAT_BURST,
+        workers: int = TELEGRAM_SEND_WORKERS,
+    ):
+        self.limiter = TokenBucket(rate=global_rate, capacity=global_burst)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.workers = workers
+        self._chats: Dict[int, _Chat] = {}
+        self._sweep_at = 1024
+        self._ready: Optional["asyncio.PriorityQueue[tuple]"] = None
+        self._order = itertools.count()
+        self._tasks: List["asyncio.Task[None]"] = []
+        self.pending = {lane: 0 for lane in LANE_NAMES}
+        self.max_pending = {lane: 0 for lane in LANE_NAMES}
+        self.sent = 0
+        self.retries = 0
+        self.failed = 0
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._tasks and self._tasks[0].get_loop() is loop:
+            return
+        # Первый запуск или новый цикл событий (скрипты, тесты)
+        self._chats.clear()
+        self.pending = {lane: 0 for lane in LANE_NAMES}
+        self._ready = asyncio.PriorityQueue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for chat in self._chats.values():
+            for job in chat.jobs:
+                if not job.future.done():
+                    job.future.cancel()
+        self._chats.clear()
+        self.pending = {lane: 0 for lane in LANE_NAMES}
+
+    def submit(self, chat_id: int, send: Callable[[], Awaitable[Any]], priority: int = INTERACTIVE) -> "asyncio.Future[Any]":
+        """Ставит отправку в очередь; future завершится результатом send()"""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _Chat(TokenBucket(rate=self.chat_rate, capacity=self.chat_burst))
+            if len(self._chats) >= self._sweep_at:
+                self._sweep()
+        chat.jobs.append(_Job(priority, send, future))
+        self.pending[priority] += 1
+        self.max_pending[priority] = max(self.max_pending[priority], self.pending[priority])
+        if not chat.scheduled:
+            chat.scheduled = True
+            self._schedule(chat_id, chat)
+        return future
+
+    async def send_message(self, bot, chat_id: int, text: str, priority: int = INTERACTIVE, **kwargs):
+        return await self.submit(chat_id, lambda: bot.send_message(chat_id, text, **kwargs), priority)
+
+    async def answer(self, message, text: str, priority: int = INTERACTIVE, **kwargs):
+        return await self.submit(message.chat.id, lambda: message.answer(text, **kwargs), priority)
+
+    def _schedule(self, chat_id: int, chat: _Chat) -> None:
+        # Приоритет чата — приоритет его первого сообщения
+        self._ready.put_nowait((chat.jobs[0].priority, next(self._order), chat_id))
+
+    def _sweep(self) -> None:
+        """Забывает простаивающие чаты, чтобы словарь не рос бесконечно"""
+        for chat_id in [cid for cid, chat in self._chats.items() if not chat.jobs and chat.bucket.is_idle()]:
+            del self._chats[chat_id]
+        self._sweep_at = max(1024, 2 * len(self._chats))
+
+    def _release(self, chat_id: int, chat: _Chat) -> None:
+        if chat.jobs:
+            self._schedule(chat_id, chat)
+        else:
+            chat.scheduled = False
+
+    def _finish(self, chat: _Chat, job: _Job) -> None:
+        chat.jobs.popleft()
+        self.pending[job.priority] -= 1
+
+    def _fail(self, chat: _Chat, job: _Job, error: Exception) -> None:
+        self.failed += 1
+        self._finish(chat, job)
+        if not job.future.done():
+            job.future.set_exception(error)
+
+    async def _worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            # Чат выбирается, когда общий лимит уже позволяет отправку: пока
+            # воркер ждёт, в очередь может прийти ответ пользователю, и он
+            # уйдёт раньше рассылки. Сам токен здесь не списывается
+            delay = self.limiter.wait_time()
+            while delay > 0:
+                await asyncio.sleep(delay)
+                delay = self.limiter.wait_time()
+            _, _, chat_id = await self._ready.get()
+            chat = self._chats[chat_id]
+            job = chat.jobs[0]
+
+            if not job.reserved:
+                job.reserved = True
+                delay = chat.bucket.reserve()
+                if delay > 0:
+                    # В этот чат пока рано — вернём его в очередь позже
+                    loop.call_later(delay, self._schedule, chat_id, chat)
+                    continue
+
+            # Другие воркеры могли успеть забрать свободные токены
+            await self.limiter.acquire()
+            try:
+                result = await job.send()
+            except TelegramRetryAfter as e:
+                self.retries += 1
+                job.retries += 1
+                if job.retries <= TELEGRAM_MAX_RETRIES:
+                    # Flood wait действует на весь бот: ждёт и этот чат,
+                    # и общий лимит
+                    chat.bucket.pause(e.retry_after)
+                    self.limiter.pause(e.retry_after)
+                    job.reserved = False
+                    self._schedule(chat_id, chat)
+                    continue
+                self._fail(chat, job, e)
+            except Exception as e:
+                self._fail(chat, job, e)
+            else:
+                self.sent += 1
+                self._finish(chat, job)
+                if not job.future.done():
+                    job.future.set_result(result)
+            self._release(chat_id, chat)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": {LANE_NAMES[lane]: count for lane, count in self.pending.items()},
+            "max_pending": {LANE_NAMES[lane]: count for lane, count in self.max_pending.items()},
+            "chats": len(self._chats),
+            "sent": self.sent,
+            "retries": self.retries,
+            "failed": self.failed,
+            "rate_limiter": self.limiter.stats(),
+        }
+
+
+# Общая очередь приложения
+outbound = OutboundQueue()
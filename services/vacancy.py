@@ -0,0 +1,89 @@
+# services/vacancy.py
+from dataclasses import asdict, dataclass
+from html.parser import HTMLParser
+from typing import Any, Dict, List, Optional
+
+# Теги, после которых в тексте нужен перенос строки
+_BLOCK_TAGS = {"p", "br", "div", "ul", "ol", "li", "h1", "h2", "h3", "h4", "h5", "h6", "tr"}
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.parts: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "li":
+            self.parts.append("\n• ")
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        self.parts.append(data)
+
+
+def html_to_text(html: Optional[str]) -> str:
+    """Превращает HTML-описание вакансии hh.ru в обычный текст"""
+    if not html:
+        return ""
+    extractor = _TextExtractor()
+    extractor.feed(html)
+    extractor.close()
+    lines = (" ".join(line.split()) for line in "".join(extractor.parts).splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+@dataclass(frozen=True, slots=True)
+class Vacancy:
+    """
+    Компактная неизменяемая вакансия. Создаётся один раз при разборе
+    ответа hh.ru и дальше используется хендлерами, LLM-сервисом и БД.
+    """
+
+    id: str
+    name: str
+    employer_name: str
+    area_name: str
+    alternate_url: str
+    salary_from: Optional[int] = None
+    salary_to: Optional[int] = None
+    salary_currency: Optional[str] = None
+    published_at: Optional[str] = None
+    description: str = ""
+    experience: str = ""
+    employment: str = ""
+
+    @classmethod
+    def from_hh(cls, item: Dict[str, Any]) -> "Vacancy":
+        """
+        Разбирает вакансию из ответа hh.ru (поиск или /vacancies/{id}).
+        HTML описания сразу превращается в текст, чтобы не делать это
+        при каждой генерации.
+        """
+        salary = item.get("salary") or {}
+        return cls(
+            id=str(item["id"]),
+            name=item.get("name") or "Без названия",
+            employer_name=(item.get("employer") or {}).get("name") or "Не указано",
+            area_name=(item.get("area") or {}).get("name") or "Не указан",
+            alternate_url=item.get("alternate_url") or "",
+            salary_from=salary.get("from"),
+            salary_to=salary.get("to"),
+            salary_currency=salary.get("currency"),
+            published_at=item.get("published_at"),
+            description=html_to_text(item.get("description")),
+            experience=(item.get("experience") or {}).get("name") or "",
+            employment=(item.get("employment") or {}).get("name") or "",
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Плоский словарь для сериализации (кэш, БД)"""
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Vacancy":
+        return cls(**data)
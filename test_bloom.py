@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+Тестирование фильтра Блума для отправленных вакансий
+"""
+from services.bloom import BloomFilter
+
+
+def test_no_false_negatives():
+    bloom = BloomFilter(capacity=256, error_rate=0.01)
+    keys = [str(100000 + i) for i in range(256)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+    assert len(bloom) == 256
+    print("✅ Добавленные ключи всегда находятся")
+
+
+def test_false_positive_rate():
+    bloom = BloomFilter(capacity=256, error_rate=0.01)
+    for i in range(256):
+        bloom.add(str(i))
+    false_positives = sum(str(i) in bloom for i in range(10_000, 30_000))
+    # Ожидается ~1%, допускаем разброс
+    assert false_positives / 20_000 < 0.03
+    print(f"✅ Доля ложных срабатываний: {false_positives / 20_000:.2%}")
+
+
+if __name__ == "__main__":
+    test_no_false_negatives()
+    test_false_positive_rate()
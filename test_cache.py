@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Тестирование кэша с TTL и вытеснением LRU
+"""
+import asyncio
+import json
+from contextlib import asynccontextmanager
+
+from db import models
+from services.cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_expiration():
+    clock = FakeClock()
+    cache = TTLCache(ttl=10, max_entries=10, clock=clock)
+    cache.set("a", [1, 2, 3])
+    assert cache.get("a") == [1, 2, 3]
+
+    clock.now = 11
+    assert cache.get("a") is None
+    assert len(cache) == 0
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1 and stats["expirations"] == 1
+    print("✅ Просроченные записи удаляются")
+
+
+def test_lru_eviction():
+    cache = TTLCache(ttl=60, max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")  # "b" становится самой давней
+    cache.set("c", 3)
+    assert "a" in cache and "c" in cache
+    assert "b" not in cache
+    assert cache.stats()["evictions"] == 1
+    print("✅ Вытесняется давно неиспользуемая запись")
+
+
+def test_byte_budget():
+    cache = TTLCache(ttl=60, max_entries=100, max_bytes=1000, sizeof=len)
+    cache.set("a", "x" * 600)
+    cache.set("b", "x" * 600)
+    assert "a" not in cache and "b" in cache
+    assert cache.stats()["bytes"] == 600
+
+    # Запись больше всего бюджета не сохраняется
+    cache.set("c", "x" * 2000)
+    assert "c" not in cache
+    print("✅ Бюджет по объёму соблюдается")
+
+
+def test_user_rows_cached_until_write():
+    """Профиль читается из БД один раз, запись сбрасывает кэш"""
+    rows = {7: {"telegram_id": 7, "full_name": "Иван"}}
+    queries = []
+
+    class FakeConnection:
+        async def fetchrow(self, query, telegram_id):
+            queries.append(query)
+            return rows.get(telegram_id) if "FROM users" in query else None
+
+        async def execute(self, query, *args):
+            rows[args[0]] = {"telegram_id": args[0], "full_name": args[1]}
+
+    @asynccontextmanager
+    async def acquire():
+        yield FakeConnection()
+
+    async def run():
+        first = await models.get_user(7)
+        first["full_name"] = "изменено вызывающим кодом"
+        assert (await models.get_user(7))["full_name"] == "Иван"
+        assert await models.get_llm_settings(7) is None
+        assert await models.get_llm_settings(7) is None
+        await models.create_or_update_user({"telegram_id": 7, "full_name": "Пётр"})
+        return await models.get_user(7)
+
+    original = models.acquire
+    models.acquire = acquire
+    models.user_rows_cache.clear()
+    try:
+        updated = asyncio.run(run())
+    finally:
+        models.acquire = original
+        models.user_rows_cache.clear()
+
+    assert updated["full_name"] == "Пётр"
+    # users: до и после записи; llm_settings: отсутствие строки тоже кэшируется
+    assert len(queries) == 3
+    print("✅ Строки пользователя кэшируются и сбрасываются при записи")
+
+
+def test_user_contexts_single_query():
+    """Контексты многих пользователей — один запрос, после него строки в кэше"""
+    queries = []
+
+    class FakeConnection:
+        async def fetch(self, query, telegram_ids):
+            queries.append(list(telegram_ids))
+            return [
+                {
+                    "telegram_id": telegram_id,
+                    "user": json.dumps({"telegram_id": telegram_id}),
+                    "filters": json.dumps({"telegram_id": telegram_id, "city": "Москва"}),
+                    "llm_settings": None,
+                }
+                for telegram_id in telegram_ids
+            ]
+
+    @asynccontextmanager
+    async def acquire():
+        yield FakeConnection()
+
+    async def run():
+        contexts = await models.get_user_contexts([1, 2, 2, 3])
+        context = await models.get_user_context(2)
+        filters = await models.get_search_filters(3)
+        return contexts, context, filters
+
+    original = models.acquire
+    models.acquire = acquire
+    models.user_rows_cache.clear()
+    try:
+        contexts, context, filters = asyncio.run(run())
+    finally:
+        models.acquire = original
+        models.user_rows_cache.clear()
+
+    assert queries == [[1, 2, 3]]
+    assert sorted(contexts) == [1, 2, 3]
+    assert context == {"user": {"telegram_id": 2}, "filters": {"telegram_id": 2, "city": "Москва"}, "llm_settings": None}
+    assert filters["city"] == "Москва"
+    print("✅ Контекст пользователей загружается одним запросом")
+
+
+if __name__ == "__main__":
+    test_ttl_expiration()
+    test_lru_eviction()
+    test_byte_budget()
+    test_user_rows_cached_until_write()
+    test_user_contexts_single_query()
@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
-from services.hh_service import CITY_TO_AREA_ID
+from services.hh_dictionaries import resolve_area
 
 
 def test_city_validation():
@@ -32,15 +32,15 @@ def test_city_validation():
     
     print("Проверка поддерживаемых городов:")
     for city in supported_cities:
-        is_supported = city in CITY_TO_AREA_ID
-        status = "Поддерживается" if is_supported else "Не поддерживается"
+        area = resolve_area(city)
+        status = "Поддерживается" if area else "Не поддерживается"
         print(f"Город '{city}': {status}")
-        if is_supported:
-            print(f"  - ID области: {CITY_TO_AREA_ID[city]}")
+        if area:
+            print(f"  - ID области: {area.id}")
     
     print("\nПроверка неподдерживаемых городов:")
     for city in unsupported_cities:
-        is_supported = city in CITY_TO_AREA_ID
+        is_supported = resolve_area(city) is not None
         status = "Поддерживается" if is_supported else "Не поддерживается"
         print(f"Город '{city}': {status}")
 
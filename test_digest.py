@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+"""
+Тестирование ежедневной рассылки без БД, Telegram и живого hh.ru
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from fake_hh_server import FakeHH
+from services import digest_service, hh_service
+from services.sent_vacancies import SentVacancies
+
+
+async def subscribers(rows):
+    for row in rows:
+        yield row
+
+
+def test_digest_fetches_each_search_once():
+    """Пользователи с одинаковым поиском обслуживаются одним запросом к hh.ru"""
+    positions = ["Python", " python ", "Go", "QA"]
+    rows = [
+        {"telegram_id": i, "position": positions[i % len(positions)], "city": "Москва"}
+        for i in range(40)
+    ]
+    rows.append({"telegram_id": 1000, "position": "Python", "city": "Токио"})
+    delivered = {}
+    statuses = {}
+
+    async def deliver(user_id, vacancies):
+        if user_id == 7:
+            raise RuntimeError("бот заблокирован")
+        delivered[user_id] = vacancies
+
+    async def on_done(user_id, status):
+        statuses[user_id] = status
+
+    async def run():
+        fake = FakeHH(found=30)
+        hh_service.vacancies_cache.clear()
+        hh_service.set_http_client(fake.client())
+        try:
+            return await digest_service.run_digest(subscribers(rows), deliver, on_done), fake
+        finally:
+            await hh_service.close_http_client()
+
+    report, fake = asyncio.run(run())
+    assert report["users"] == 41
+    assert report["skipped"] == 1
+    assert report["groups"] == 3
+    assert report["delivered"] == 39 and report["failed"] == 1
+    assert report["hh_requests"] == fake.requests == 3
+    assert sorted(delivered) == [i for i in range(40) if i != 7]
+    # Итог по каждому пользователю уходит в чекпоинт
+    assert statuses[7] == "failed" and statuses[1000] == "skipped"
+    assert sum(status == "sent" for status in statuses.values()) == 39
+    assert all(len(v) == digest_service.DIGEST_VACANCIES_PER_USER for v in delivered.values())
+    assert "<b>Новые вакансии для вас</b>" in digest_service.format_digest(delivered[0])
+    print(f"✅ Рассылка: {report['users']} пользователей, {fake.requests} запроса к hh.ru")
+
+
+def test_delivery_slots():
+    """Время пользователя разбирается, а текущий момент относится к своему слоту"""
+    assert digest_service.parse_clock("08:30") == 510
+    assert digest_service.parse_clock(" 0:05 ") == 5
+    assert digest_service.parse_clock("24:00") is None
+    assert digest_service.parse_clock("утром") is None
+    assert digest_service.format_clock(510) == "08:30"
+    now = datetime(2024, 1, 1, 6, 7, 42, tzinfo=timezone.utc)
+    slot = digest_service.current_slot(now)
+    assert slot % digest_service.DIGEST_SLOT_MINUTES == 0
+    assert slot <= 6 * 60 + 7 < slot + digest_service.DIGEST_SLOT_MINUTES
+    assert digest_service.is_valid_timezone("Asia/Novosibirsk")
+    assert not digest_service.is_valid_timezone("Марс/Олимп")
+    # Готовится слот, который наступит через DIGEST_PREPARE_AHEAD минут
+    late = datetime(2024, 1, 1, 23, 50, tzinfo=timezone.utc)
+    run_date, prepare_slot = digest_service.prepare_target(late)
+    ahead = late + timedelta(minutes=digest_service.DIGEST_PREPARE_AHEAD)
+    assert run_date == ahead.date() and prepare_slot == digest_service.current_slot(ahead)
+    print("✅ Слоты рассылки вычисляются корректно")
+
+
+def test_schedule_settings_checked():
+    """Неверный шаг слотов или начало окна не проходят проверку"""
+    saved = {name: getattr(digest_service, name) for name in ("DIGEST_SLOT_MINUTES", "DIGEST_WINDOW_START")}
+    try:
+        assert digest_service._check_schedule_settings() == digest_service.parse_clock(saved["DIGEST_WINDOW_START"])
+        for name, value in (("DIGEST_SLOT_MINUTES", 7), ("DIGEST_SLOT_MINUTES", 0), ("DIGEST_WINDOW_START", "9am")):
+            for key, original in saved.items():
+                setattr(digest_service, key, original)
+            setattr(digest_service, name, value)
+            try:
+                digest_service._check_schedule_settings()
+            except RuntimeError:
+                continue
+            raise AssertionError(f"{name}={value!r} не отклонён")
+    finally:
+        for name, value in saved.items():
+            setattr(digest_service, name, value)
+    print("✅ Настройки слотов рассылки проверяются")
+
+
+def test_digest_skips_already_sent():
+    """Второй прогон отправляет только новые вакансии, проверяя в БД лишь срабатывания фильтра"""
+    table = set()
+    lookups = []
+
+    async def lookup(user_ids, vacancy_ids):
+        lookups.append(len(user_ids))
+        return {pair for pair in zip(user_ids, vacancy_ids) if pair in table}
+
+    async def load(retention_days, since=None):
+        for user_id, vacancy_id in sorted(table):
+            yield user_id, vacancy_id, datetime.now(timezone.utc)
+
+    rows = [{"telegram_id": i, "position": "Python", "city": "Москва"} for i in range(3)]
+    delivered = []
+
+    async def deliver(user_id, vacancies):
+        # Как save_delivery_statuses: доставленное записывается в user_vacancies
+        delivered.append((user_id, [v.id for v in vacancies]))
+        table.update((user_id, v.id) for v in vacancies)
+
+    async def run():
+        hh_service.vacancies_cache.clear()
+        hh_service.set_http_client(FakeHH(found=30).client())
+        try:
+            await digest_service.run_digest(subscribers(rows), deliver, sent=SentVacancies(lookup, load))
+            # «Рестарт»: фильтры восстанавливаются из таблицы
+            sent = SentVacancies(lookup, load)
+            await sent.ensure_loaded()
+            await digest_service.run_digest(subscribers(rows), deliver, sent=sent)
+        finally:
+            await hh_service.close_http_client()
+
+    asyncio.run(run())
+    per_user = digest_service.DIGEST_VACANCIES_PER_USER
+    first, second = delivered[:3], delivered[3:]
+    assert all(ids == [str(i) for i in range(per_user)] for _, ids in first)
+    assert all(ids == [str(i) for i in range(per_user, 2 * per_user)] for _, ids in second)
+    assert len(table) == 2 * 3 * per_user
+    # Первый прогон — без запросов к БД, второй — один запрос на группу
+    assert len(lookups) == 1
+    print("✅ Повторно вакансии не отправляются")
+
+
+def test_run_split_into_jobs():
+    """Прогон делится на задания по группам поиска, не больше DIGEST_JOB_USERS пользователей в каждом"""
+    positions = ["Python", "python", "Go"]
+    rows = [{"telegram_id": i, "position": positions[i % 3], "city": "Москва"} for i in range(15)]
+    rows.append({"telegram_id": 99, "position": "Python", "city": "Токио"})
+    queued = []
+
+    async def iter_run_users(run_id, user_ids=None, batch_size=500):
+        for row in rows:
+            yield row
+
+    async def enqueue(run_id, jobs):
+        queued.extend(jobs)
+
+    async def finish(run_id):
+        return None
+
+    patched = {
+        "iter_digest_run_users": iter_run_users,
+        "enqueue_digest_jobs": enqueue,
+        "finish_digest_run_if_complete": finish,
+        "DIGEST_JOB_USERS": 4,
+    }
+    saved = {name: getattr(digest_service, name) for name in patched}
+
+    async def run():
+        hh_service.set_http_client(FakeHH().client())
+        try:
+            await digest_service._enqueue_run(1)
+        finally:
+            await hh_service.close_http_client()
+
+    for name, value in patched.items():
+        setattr(digest_service, name, value)
+    try:
+        asyncio.run(run())
+    finally:
+        for name, value in saved.items():
+            setattr(digest_service, name, value)
+
+    sizes = sorted(len(user_ids) for _, user_ids in queued)
+    # Python: 10 пользователей → 4+4+2, Go: 5 → 4+1, нераспознанный город — 1
+    assert sizes == [1, 1, 2, 4, 4, 4]
+    assert sorted(user_id for _, user_ids in queued for user_id in user_ids) == sorted(r["telegram_id"] for r in rows)
+    assert len({key for key, _ in queued}) == 3
+    print(f"✅ Прогон разделён на {len(queued)} заданий")
+
+
+def test_prepared_digests_saved_with_statuses():
+    """Подготовка сохраняет текст подборки вместе со статусом пользователя"""
+    rows = [{"telegram_id": i, "position": "Python", "city": "Москва"} for i in range(3)]
+    rows.append({"telegram_id": 99, "position": "Python", "city": "Токио"})
+    saved_statuses = {}
+    saved_digests = {}
+
+    async def save(run_id, statuses, digests):
+        # Подборка пишется в той же пачке, что и статус prepared
+        assert all(statuses[user_id] == "prepared" for user_id in digests)
+        saved_statuses.update(statuses)
+        saved_digests.update(digests)
+
+    async def run():
+        hh_service.vacancies_cache.clear()
+        hh_service.set_http_client(FakeHH(found=30).client())
+        checkpoint = digest_service._Checkpoint(1)
+        try:
+            await digest_service.run_digest(subscribers(rows), checkpoint.prepare, checkpoint.record)
+            await checkpoint.flush()
+        finally:
+            await hh_service.close_http_client()
+
+    original = digest_service.save_prepared_digests
+    digest_service.save_prepared_digests = save
+    try:
+        asyncio.run(run())
+    finally:
+        digest_service.save_prepared_digests = original
+
+    assert saved_statuses == {0: "prepared", 1: "prepared", 2: "prepared", 99: "skipped"}
+    text, vacancy_ids = saved_digests[0]
+    assert "<b>Новые вакансии для вас</b>" in text
+    assert len(vacancy_ids) == digest_service.DIGEST_VACANCIES_PER_USER
+    print(f"✅ Подготовлено подборок: {len(saved_digests)}")
+
+
+def test_failed_delivery_keeps_vacancies_available():
+    """Подготовка не записывает отправку, а доставка отмечает, кому подборка не ушла"""
+    rows = [{"telegram_id": i, "position": "Python", "city": "Москва"} for i in range(3)]
+    prepared = {}
+    deliveries = []
+
+    async def lookup(user_ids, vacancy_ids):
+        return set()
+
+    async def load(retention_days, since=None):
+        return
+        yield
+
+    async def save_prepared(run_id, statuses, digests):
+        prepared.update(digests)
+
+    claimed = []
+
+    async def claim_due(lease_seconds, limit):
+        if claimed:
+            return []
+        claimed.append(True)
+        return [{"run_id": 1, "telegram_id": user_id, "text": text} for user_id, (text, _) in prepared.items()]
+
+    async def save_delivery(items):
+        deliveries.extend(items)
+
+    class FakeBot:
+        async def send_message(self, chat_id, text, **kwargs):
+            if chat_id == 1:
+                raise RuntimeError("бот заблокирован")
+
+    patched = {
+        "save_prepared_digests": save_prepared,
+        "claim_due_digests": claim_due,
+        "save_delivery_statuses": save_delivery,
+    }
+    saved = {name: getattr(digest_service, name) for name in patched}
+
+    async def run():
+        hh_service.vacancies_cache.clear()
+        hh_service.set_http_client(FakeHH(found=30).client())
+        checkpoint = digest_service._Checkpoint(1)
+        sent = SentVacancies(lookup, load)
+        try:
+            await digest_service.run_digest(subscribers(rows), checkpoint.prepare, checkpoint.record, sent)
+            await checkpoint.flush()
+            report = await digest_service.deliver_prepared_digests(FakeBot())
+        finally:
+            await digest_service.outbound.stop()
+            await hh_service.close_http_client()
+        return report
+
+    for name, value in patched.items():
+        setattr(digest_service, name, value)
+    try:
+        report = asyncio.run(run())
+    finally:
+        for name, value in saved.items():
+            setattr(digest_service, name, value)
+
+    # Отправку записывает только доставка (в той же транзакции, что и статус)
+    assert sorted(deliveries) == [(1, 0, "sent"), (1, 1, "failed"), (1, 2, "sent")]
+    assert report == {"delivered": 2, "failed": 1}
+    print("✅ Недоставленная подборка не считается отправленной")
+
+
+def test_sent_vacancies_maintain():
+    """Обслуживание удаляет старые отправки и убирает их из фильтров"""
+    now = datetime.now(timezone.utc)
+    table = {(1, "old"): now - timedelta(days=60), (1, "fresh"): now}
+
+    async def lookup(user_ids, vacancy_ids):
+        return {pair for pair in zip(user_ids, vacancy_ids) if pair in table}
+
+    async def load(retention_days, since=None):
+        border = datetime.now(timezone.utc) - timedelta(days=retention_days)
+        for (user_id, vacancy_id), sent_at in sorted(table.items()):
+            if sent_at >= border and (since is None or sent_at > since):
+                yield user_id, vacancy_id, sent_at
+
+    async def purge(retention_days):
+        border = datetime.now(timezone.utc) - timedelta(days=retention_days)
+        old = [pair for pair, sent_at in table.items() if sent_at < border]
+        for pair in old:
+            del table[pair]
+        return len(old)
+
+    async def run():
+        sent = SentVacancies(lookup, load, purge)
+        await sent.ensure_loaded()
+        # До очистки фильтр ещё помнит «old» (загружен в прошлые сутки)
+        sent._add(1, "old")
+        await sent.maintain()
+        return sent._filters[1]
+
+    bloom = asyncio.run(run())
+    assert set(table) == {(1, "fresh")}
+    assert "fresh" in bloom
+    assert "old" not in bloom
+    print("✅ Фильтры перестраиваются без устаревших отправок")
+
+
+def test_job_lease_renewed_and_owned():
+    """Долгое задание продлевает аренду, а результат чужого задания не записывается"""
+    extended = []
+    completed = []
+    finished = []
+
+    class Sent:
+        async def refresh(self):
+            pass
+
+    async def run_digest(subscribers, deliver, record, sent):
+        await asyncio.sleep(0.05)
+        return {"users": 0}
+
+    async def extend(job_id, worker_id, lease_seconds):
+        extended.append((job_id, worker_id))
+        return True
+
+    async def complete(job_id, worker_id, report):
+        completed.append((job_id, worker_id))
+        # Аренду успел перехватить другой воркер
+        return False
+
+    async def finish(run_id):
+        finished.append(run_id)
+
+    patched = {
+        "sent_vacancies": Sent(),
+        "run_digest": run_digest,
+        "extend_digest_job_lease": extend,
+        "complete_digest_job": complete,
+        "finish_digest_run_if_complete": finish,
+        "DIGEST_JOB_HEARTBEAT": 0.01,
+    }
+    saved = {name: getattr(digest_service, name) for name in patched}
+    for name, value in patched.items():
+        setattr(digest_service, name, value)
+    try:
+        asyncio.run(digest_service.process_digest_job({"id": 7, "run_id": 1, "user_ids": []}, "w1"))
+    finally:
+        for name, value in saved.items():
+            setattr(digest_service, name, value)
+
+    assert len(extended) >= 2 and set(extended) == {(7, "w1")}
+    assert completed == [(7, "w1")]
+    assert finished == []
+    print("✅ Аренда задания продлевается, чужое задание не завершается")
+
+
+def test_tick_requeues_new_runs():
+    """Прогон, не попавший в очередь, ставится снова на следующем запуске планировщика"""
+    enqueued = []
+    attempts = []
+
+    async def prepare_slot():
+        raise RuntimeError("metro недоступен")
+
+    async def unfinished_runs():
+        return [{"id": 5, "run_date": None, "slot": 540}]
+
+    async def enqueue_run(run_id):
+        attempts.append(run_id)
+        if len(attempts) == 1:
+            raise RuntimeError("БД недоступна")
+        enqueued.append(run_id)
+
+    async def deliver(bot):
+        return {"delivered": 0, "failed": 0}
+
+    patched = {
+        "prepare_digest_slot": prepare_slot,
+        "get_unfinished_digest_runs": unfinished_runs,
+        "_enqueue_run": enqueue_run,
+        "deliver_prepared_digests": deliver,
+    }
+    saved = {name: getattr(digest_service, name) for name in patched}
+    for name, value in patched.items():
+        setattr(digest_service, name, value)
+    try:
+        asyncio.run(digest_service.run_digest_tick(None))
+        asyncio.run(digest_service.run_digest_tick(None))
+    finally:
+        for name, value in saved.items():
+            setattr(digest_service, name, value)
+
+    assert attempts == [5, 5]
+    assert enqueued == [5]
+    print("✅ Прогоны в статусе new ставятся в очередь на каждом запуске")
+
+
+if __name__ == "__main__":
+    test_digest_fetches_each_search_once()
+    test_delivery_slots()
+    test_schedule_settings_checked()
+    test_digest_skips_already_sent()
+    test_run_split_into_jobs()
+    test_prepared_digests_saved_with_statuses()
+    test_failed_delivery_keeps_vacancies_available()
+    test_sent_vacancies_maintain()
+    test_job_lease_renewed_and_owned()
+    test_tick_requeues_new_runs()
@@ -17,6 +17,6 @@ async def test():
     vacancies = await fetch_vacancies(filters)
     print(f"Найдено: {len(vacancies)} вакансий")
     for v in vacancies[:2]:
-        print(v["title"], v["company"], v["url"])
+        print(v.name, v.employer_name, v.alternate_url)
 
 asyncio.run(test())
\ No newline at end of file
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Тестирование индекса регионов hh.ru без обращения к живому API
+"""
+import asyncio
+import tempfile
+
+import httpx
+
+from services import hh_dictionaries, hh_service
+from services.hh_dictionaries import AreaIndex, MetroIndex
+
+# Фрагмент дерева /areas
+AREAS_TREE = [
+    {"id": "113", "name": "Россия", "areas": [
+        {"id": "1", "name": "Москва", "areas": []},
+        {"id": "2019", "name": "Московская область", "areas": [
+            {"id": "2034", "name": "Королёв", "areas": []},
+        ]},
+        {"id": "1641", "name": "Нижегородская область", "areas": [
+            {"id": "66", "name": "Нижний Новгород", "areas": []},
+        ]},
+        {"id": "1844", "name": "Новгородская область", "areas": [
+            {"id": "67", "name": "Великий Новгород", "areas": []},
+        ]},
+        {"id": "1530", "name": "Ростовская область", "areas": [
+            {"id": "76", "name": "Ростов-на-Дону", "areas": []},
+        ]},
+    ]},
+    {"id": "16", "name": "Беларусь", "areas": [
+        {"id": "1002", "name": "Минск", "areas": []},
+    ]},
+]
+
+
+def test_resolve_exact():
+    index = AreaIndex.from_tree(AREAS_TREE)
+    assert index.resolve("Москва").id == 1
+    assert index.resolve("  москва ").id == 1
+    assert index.resolve("ростов на дону").id == 76
+    assert index.resolve("Королев").id == 2034
+    assert index.resolve("Минск").id == 1002
+    assert index.resolve("Токио") is None
+    print("✅ Города находятся по нормализованному названию")
+
+
+def test_suggest_by_prefix():
+    index = AreaIndex.from_tree(AREAS_TREE)
+    assert [a.id for a in index.suggest("моск")] == [1, 2019]
+    # Поиск по началу любого слова названия
+    assert {a.id for a in index.suggest("новгород")} == {66, 67, 1844}
+    assert index.suggest("") == []
+    print("✅ Подсказки по началу названия работают")
+
+
+# Фрагмент ответа /metro/1
+MOSCOW_METRO = {"id": "1", "name": "Москва", "lines": [
+    {"id": "1", "name": "Сокольническая", "stations": [
+        {"id": "1.1", "name": "Охотный ряд"},
+        {"id": "1.2", "name": "Библиотека имени Ленина"},
+    ]},
+    {"id": "3", "name": "Арбатско-Покровская", "stations": [
+        {"id": "3.1", "name": "Арбатская"},
+    ]},
+    {"id": "4", "name": "Филёвская", "stations": [
+        {"id": "4.1", "name": "Арбатская"},
+    ]},
+]}
+
+
+def test_metro_stations():
+    index = MetroIndex(MOSCOW_METRO)
+    assert index.resolve("охотный РЯД") == "Охотный ряд"
+    assert index.resolve("Библиотека") == "Библиотека имени Ленина"
+    assert index.resolve("Неизвестная") is None
+    # Одноимённые станции на разных линиях дают все id
+    assert index.station_ids("Арбатская, Охотный ряд; Неизвестная") == ["1.1", "3.1", "4.1"]
+    print("✅ Станции метро распознаются")
+
+
+def test_metro_in_search_params():
+    hh_dictionaries._metro_indexes[1] = MetroIndex(MOSCOW_METRO)
+    try:
+        office = hh_service.build_search_params({"city": "Москва", "metro": "Охотный ряд"})
+        assert office["metro"] == ["1.1"]
+        remote = hh_service.build_search_params({"city": "Москва", "metro": "Охотный ряд", "remote": True})
+        assert "metro" not in remote
+    finally:
+        hh_dictionaries._metro_indexes.pop(1, None)
+    print("✅ Станции метро передаются в запрос hh.ru")
+
+
+def test_metro_failure_not_cached_forever():
+    """Ошибка /metro не делает город «без метро» до рестарта: загрузка повторяется"""
+    statuses = [503]
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        status = statuses.pop(0)
+        return httpx.Response(status, json=MOSCOW_METRO if status == 200 else {})
+
+    async def run():
+        hh_service.set_http_client(httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+        try:
+            first = await hh_dictionaries.ensure_metro_index(1)
+            # Сразу после ошибки hh.ru не дёргаем
+            again = await hh_dictionaries.ensure_metro_index(1)
+            hh_dictionaries.HH_METRO_RETRY_INTERVAL = 0
+            statuses.append(200)
+            return first, again, await hh_dictionaries.ensure_metro_index(1)
+        finally:
+            await hh_service.close_http_client()
+
+    saved = (hh_dictionaries.HH_DICTIONARIES_DIR, hh_dictionaries.HH_METRO_RETRY_INTERVAL, hh_service.HH_MAX_RETRIES)
+    with tempfile.TemporaryDirectory() as directory:
+        hh_dictionaries.HH_DICTIONARIES_DIR = directory
+        hh_service.HH_MAX_RETRIES = 0
+        try:
+            first, again, retried = asyncio.run(run())
+        finally:
+            hh_dictionaries.HH_DICTIONARIES_DIR, hh_dictionaries.HH_METRO_RETRY_INTERVAL, hh_service.HH_MAX_RETRIES = saved
+            hh_dictionaries._metro_indexes.pop(1, None)
+            hh_dictionaries._metro_failures.pop(1, None)
+
+    assert first is None and again is None
+    assert retried is not None and retried.resolve("Охотный ряд") == "Охотный ряд"
+    print("✅ Справочник метро загружается повторно после ошибки")
+
+
+if __name__ == "__main__":
+    test_resolve_exact()
+    test_suggest_by_prefix()
+    test_metro_stations()
+    test_metro_in_search_params()
+    test_metro_failure_not_cached_forever()
@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""
+Тестирование постраничной загрузки вакансий без обращения к живому hh.ru
+"""
+import asyncio
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+from bench_hh_fetch import run_benchmark
+from fake_hh_server import FakeHH
+from services import hh_service
+from services.persistent_cache import FileCacheStore
+
+FOUND = 250
+
+
+def make_item(index):
+    return {
+        "id": str(index),
+        "name": f"Вакансия {index}",
+        "employer": {"name": "Компания"},
+        "area": {"name": "Москва"},
+        "salary": None,
+        "alternate_url": f"https://hh.ru/vacancy/{index}",
+    }
+
+
+def make_client(requests_log, delay=0.0):
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(delay)
+        page = int(request.url.params["page"])
+        per_page = int(request.url.params["per_page"])
+        requests_log.append(page)
+        start = page * per_page
+        items = [make_item(i) for i in range(start, min(start + per_page, FOUND))]
+        pages = -(-FOUND // per_page)
+        return httpx.Response(200, json={"items": items, "found": FOUND, "pages": pages, "page": page})
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+def run_fetch(filters, max_results=None):
+    requests_log = []
+
+    async def run():
+        hh_service.vacancies_cache.clear()
+        hh_service.set_http_client(make_client(requests_log))
+        try:
+            return await hh_service.fetch_vacancies(filters, max_results=max_results)
+        finally:
+            await hh_service.close_http_client()
+
+    return asyncio.run(run()), requests_log
+
+
+def test_fetch_all_pages():
+    """Все страницы загружаются, порядок вакансий сохраняется"""
+    vacancies, requests_log = run_fetch({"position": "Python", "city": "Москва"}, max_results=1000)
+    assert len(vacancies) == FOUND
+    assert [v.id for v in vacancies] == [str(i) for i in range(FOUND)]
+    assert sorted(requests_log) == [0, 1, 2]
+    print(f"✅ Загружено {len(vacancies)} вакансий за {len(requests_log)} запроса")
+
+
+def test_fetch_respects_limit():
+    """Лимит результатов ограничивает и количество страниц"""
+    vacancies, requests_log = run_fetch({"position": "Python", "city": "Москва"}, max_results=150)
+    assert len(vacancies) == 150
+    assert sorted(requests_log) == [0, 1]
+    print("✅ Лимит результатов соблюдается")
+
+
+def test_unknown_city():
+    """Для неизвестного города запросы к hh.ru не выполняются"""
+    vacancies, requests_log = run_fetch({"position": "Python", "city": "Токио"})
+    assert vacancies == []
+    assert requests_log == []
+    print("✅ Неизвестный город не приводит к запросам")
+
+
+def test_concurrent_requests_coalesced():
+    """Одновременные одинаковые запросы выполняют одну загрузку"""
+    requests_log = []
+    filters = {"position": "Python", "city": "Москва"}
+
+    async def run():
+        hh_service.vacancies_cache.clear()
+        hh_service.set_http_client(make_client(requests_log, delay=0.05))
+        try:
+            return await asyncio.gather(*(hh_service.fetch_vacancies(filters) for _ in range(5)))
+        finally:
+            await hh_service.close_http_client()
+
+    results = asyncio.run(run())
+    assert all(len(result) == len(results[0]) for result in results)
+    assert requests_log == [0]
+    assert not hh_service._inflight
+    print("✅ Одновременные запросы объединены в один")
+
+
+def test_equivalent_filters_share_fingerprint():
+    """Семантически одинаковые фильтры дают один и тот же запрос"""
+    base = hh_service.build_search_params({"position": "Python", "city": "Москва"})
+    equivalent = hh_service.build_search_params({
+        "position": "  python ",
+        "city": "Москва",
+        "remote": False,
+        "salary_from": 0,
+        "only_direct_employers": None,
+        "per_page": 5,
+    })
+    assert base == {**equivalent, "text": "Python"}
+    assert hh_service.query_fingerprint(base) == hh_service.query_fingerprint(equivalent)
+    # В hh.ru уходит текст пользователя, а не его нормализованная форма
+    assert equivalent["text"] == "python"
+    assert hh_service.build_search_params({"position": " C++  Developer ", "city": "Москва"})["text"] == "C++ Developer"
+
+    different = hh_service.build_search_params({"position": "Python", "city": "Москва", "remote": True})
+    assert hh_service.query_fingerprint(base) != hh_service.query_fingerprint(different)
+    print("✅ Эквивалентные фильтры имеют одинаковый отпечаток")
+
+
+def test_retry_on_throttling():
+    """На 429 запрос повторяется с учётом Retry-After"""
+    attempts = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        attempts.append(request)
+        if len(attempts) == 1:
+            return httpx.Response(429, headers={"Retry-After": "0"})
+        return httpx.Response(200, json={"items": [make_item(1)], "found": 1, "pages": 1, "page": 0})
+
+    async def run():
+        hh_service.vacancies_cache.clear()
+        hh_service.set_http_client(httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+        try:
+            return await hh_service.fetch_vacancies({"position": "Go", "city": "Москва"})
+        finally:
+            await hh_service.close_http_client()
+
+    throttled_before = hh_service.hh_metrics["throttled_responses"]
+    vacancies = asyncio.run(run())
+    assert len(vacancies) == 1
+    assert len(attempts) == 2
+    assert hh_service.hh_metrics["throttled_responses"] == throttled_before + 1
+    print("✅ Запрос повторён после 429")
+
+
+def test_retry_on_truncated_json():
+    """Оборванный ответ 200 повторяется, как 5xx, а не роняет поиск"""
+    attempts = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        attempts.append(request)
+        if len(attempts) == 1:
+            return httpx.Response(200, content=b'{"items": [{"id": "1", "na')
+        return httpx.Response(200, json={"items": [make_item(1)], "found": 1, "pages": 1, "page": 0})
+
+    async def run():
+        hh_service.vacancies_cache.clear()
+        hh_service.set_http_client(httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+        try:
+            return await hh_service.fetch_vacancies({"position": "Rust", "city": "Москва"})
+        finally:
+            await hh_service.close_http_client()
+
+    backoff_base = hh_service.HH_BACKOFF_BASE
+    hh_service.HH_BACKOFF_BASE = 0
+    try:
+        vacancies = asyncio.run(run())
+    finally:
+        hh_service.HH_BACKOFF_BASE = backoff_base
+    assert [v.id for v in vacancies] == ["1"]
+    assert len(attempts) == 2
+    print("✅ Запрос с оборванным JSON повторяется")
+
+def test_iter_vacancies_streams_pages():
+    """Потоковый API отдаёт страницы по порядку, а прерывание не останавливает загрузку"""
+    requests_log = []
+    filters = {"position": "Python", "city": "Москва"}
+
+    async def run():
+        hh_service.vacancies_cache.clear()
+        hh_service.set_http_client(make_client(requests_log, delay=0.01))
+        try:
+            batches = [batch async for batch in hh_service.iter_vacancies(filters, max_results=1000)]
+
+            # Потребитель, прервавшийся после первой пачки
+            hh_service.vacancies_cache.clear()
+            async for _ in hh_service.iter_vacancies(filters, max_results=500):
+                break
+            # Загрузка продолжается без потребителя (её темп задаёт общий rate limiter)
+            await asyncio.gather(*(search.task for search in list(hh_service._inflight.values())))
+            return batches
+        finally:
+            await hh_service.close_http_client()
+
+    batches = asyncio.run(run())
+    assert [len(batch) for batch in batches] == [100, 100, 50]
+    assert [v.id for batch in batches for v in batch] == [str(i) for i in range(FOUND)]
+    params = hh_service.build_search_params(filters)
+    assert f"{hh_service.query_fingerprint(params)}:500" in hh_service.vacancies_cache
+    print("✅ Страницы отдаются потоком по порядку")
+
+
+def test_finished_search_keeps_newer_inflight():
+    """Завершившаяся загрузка не убирает из _inflight более новую под тем же ключом"""
+    old, new = hh_service._PendingSearch(), hh_service._PendingSearch()
+    hh_service._inflight["key"] = new
+    try:
+        hh_service._forget_search("key", old)
+        assert hh_service._inflight["key"] is new
+        hh_service._forget_search("key", new)
+        assert "key" not in hh_service._inflight
+    finally:
+        hh_service._inflight.pop("key", None)
+    print("✅ Новая загрузка остаётся в _inflight")
+
+def test_vacancy_details_batch_and_cache():
+    """Подробности грузятся пачкой один раз, описание очищается от HTML"""
+    requested = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        vacancy_id = request.url.path.rsplit("/", 1)[-1]
+        requested.append(vacancy_id)
+        if vacancy_id == "404":
+            return httpx.Response(404)
+        item = make_item(vacancy_id)
+        item["description"] = "<p>Задачи:</p><ul><li>писать <b>код</b></li><li>тесты</li></ul>"
+        item["experience"] = {"id": "between1And3", "name": "От 1 года до 3 лет"}
+        return httpx.Response(200, json=item)
+
+    async def run():
+        hh_service.vacancy_details_cache.clear()
+        hh_service.set_http_client(httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+        try:
+            first = await hh_service.fetch_vacancy_details(["1", "2", "404", "1"])
+            second = await hh_service.fetch_vacancy_details(["2"])
+            return first, second
+        finally:
+            await hh_service.close_http_client()
+
+    first, second = asyncio.run(run())
+    assert sorted(first) == ["1", "2"]
+    assert first["1"].description == "Задачи:\n• писать код\n• тесты"
+    assert first["1"].experience == "От 1 года до 3 лет"
+    assert second["2"] is first["2"]
+    assert sorted(requested) == ["1", "2", "404"]
+    print("✅ Подробности вакансий загружаются пачкой и кэшируются")
+
+
+def test_incremental_search_uses_watermark():
+    """Повторный поиск запрашивает только вакансии новее сохранённой отметки"""
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    published = lambda hours: (now - timedelta(hours=hours)).strftime("%Y-%m-%dT%H:%M:%S%z")
+    requests_params = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        params = dict(request.url.params)
+        requests_params.append(params)
+        if "date_from" in params:
+            items = [dict(make_item(100), published_at=published(0)), dict(make_item(2), published_at=published(5))]
+        else:
+            items = [dict(make_item(1), published_at=published(10)), dict(make_item(2), published_at=published(5))]
+        return httpx.Response(200, json={"items": items, "found": len(items), "pages": 1, "page": 0})
+
+    filters = {"position": "Python", "city": "Москва", "freshness_days": 1}
+
+    async def run():
+        hh_service.vacancies_cache.clear()
+        hh_service.set_http_client(httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+        try:
+            first = await hh_service.fetch_vacancies(filters)
+            # Делаем результат устаревшим, чтобы следующий вызов пошёл в hh.ru
+            for key in list(hh_service.vacancies_cache._entries):
+                hh_service.vacancies_cache.get(key).fetched_at -= hh_service.HH_CACHE_TTL
+            second = await hh_service.fetch_vacancies(filters)
+            return first, second
+        finally:
+            await hh_service.close_http_client()
+
+    first, second = asyncio.run(run())
+    assert [v.id for v in first] == ["1", "2"]
+    assert [v.id for v in second] == ["100", "2", "1"]
+    incremental = requests_params[1]
+    assert incremental["date_from"] == published(5)
+    assert "period" not in incremental
+    print("✅ Повторный поиск догружает только новые вакансии")
+
+
+def test_full_refresh_after_interval():
+    """Без period догрузка не копит вакансии бесконечно: раз в интервал запрос идёт целиком"""
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    published = (now - timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M:%S%z")
+    requests_params = []
+    # Вакансии 1 и 2 сняты с публикации к третьему запросу
+    listed = [[1, 2], [3], [3]]
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        params = dict(request.url.params)
+        requests_params.append(params)
+        items = [dict(make_item(index), published_at=published) for index in listed[len(requests_params) - 1]]
+        return httpx.Response(200, json={"items": items, "found": len(items), "pages": 1, "page": 0})
+
+    filters = {"position": "Python", "city": "Москва"}
+
+    def expire(full_refresh: bool):
+        for key in list(hh_service.vacancies_cache._entries):
+            result = hh_service.vacancies_cache.get(key)
+            result.fetched_at -= hh_service.HH_CACHE_TTL
+            if full_refresh:
+                result.crawled_at -= hh_service.HH_FULL_REFRESH_INTERVAL
+
+    async def run():
+        hh_service.vacancies_cache.clear()
+        hh_service.set_http_client(httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+        try:
+            await hh_service.fetch_vacancies(filters)
+            expire(full_refresh=False)
+            merged = await hh_service.fetch_vacancies(filters)
+            expire(full_refresh=True)
+            refreshed = await hh_service.fetch_vacancies(filters)
+            return merged, refreshed
+        finally:
+            await hh_service.close_http_client()
+
+    merged, refreshed = asyncio.run(run())
+    assert "date_from" in requests_params[1]
+    assert sorted(v.id for v in merged) == ["1", "2", "3"]
+    assert "date_from" not in requests_params[2]
+    assert [v.id for v in refreshed] == ["3"]
+    print("✅ Результат поиска периодически обновляется целиком")
+
+
+def test_persistent_cache_survives_restart():
+    """Результат поиска восстанавливается из второго уровня кэша после «рестарта»"""
+    requests_log = []
+    filters = {"position": "Python", "city": "Москва"}
+
+    async def run(directory):
+        hh_service.vacancies_cache.clear()
+        hh_service.set_persistent_store(FileCacheStore(directory))
+        hh_service.set_http_client(make_client(requests_log))
+        try:
+            first = await hh_service.fetch_vacancies(filters)
+            await asyncio.gather(*hh_service._background_tasks)
+            # Память процесса очищена, хранилище осталось
+            hh_service.vacancies_cache.clear()
+            second = await hh_service.fetch_vacancies(filters)
+            return first, second
+        finally:
+            hh_service.set_persistent_store(None)
+            await hh_service.close_http_client()
+
+    with tempfile.TemporaryDirectory() as directory:
+        first, second = asyncio.run(run(directory))
+    assert second == first
+    assert requests_log == [0]
+    print("✅ Кэш поиска переживает рестарт")
+
+
+def test_warm_up_keeps_remaining_ttl():
+    """Прогрев кладёт запись в память на оставшийся, а не на полный срок"""
+    result = hh_service._SearchResult([], None)
+
+    async def run(directory):
+        store = FileCacheStore(directory)
+        await store.set_many("search", {"short": result.to_dict()}, ttl=60)
+        await store.set_many("search", {"long": result.to_dict()}, ttl=hh_service.HH_RESULT_RETENTION)
+        hh_service.vacancies_cache.clear()
+        hh_service.set_persistent_store(store)
+        try:
+            await hh_service._warm_up_caches()
+        finally:
+            hh_service.set_persistent_store(None)
+        now = time.monotonic()
+        return {key: entry[0] - now for key, entry in hh_service.vacancies_cache._entries.items()}
+
+    with tempfile.TemporaryDirectory() as directory:
+        remaining = asyncio.run(run(directory))
+    hh_service.vacancies_cache.clear()
+    assert 0 < remaining["short"] <= 60
+    assert hh_service.HH_RESULT_RETENTION - 60 < remaining["long"] <= hh_service.HH_RESULT_RETENTION
+    print("✅ Прогретые записи не живут дольше, чем в хранилище")
+
+
+def test_fetched_pages_ingested_in_batches():
+    """Каждая загруженная с hh.ru страница уходит на сохранение одной пачкой, кэш — нет"""
+    requests_log = []
+    batches = []
+    filters = {"position": "Python", "city": "Москва"}
+
+    async def sink(vacancies):
+        batches.append([v.id for v in vacancies])
+
+    async def run():
+        hh_service.vacancies_cache.clear()
+        hh_service.set_vacancy_sink(sink)
+        hh_service.set_http_client(make_client(requests_log))
+        try:
+            await hh_service.fetch_vacancies(filters, max_results=1000)
+            await hh_service.fetch_vacancies(filters, max_results=1000)
+            await asyncio.gather(*hh_service._background_tasks)
+        finally:
+            hh_service.set_vacancy_sink(None)
+            await hh_service.close_http_client()
+
+    asyncio.run(run())
+    assert [len(batch) for batch in batches] == [100, 100, 50]
+    assert sorted(v for batch in batches for v in batch) == sorted(str(i) for i in range(FOUND))
+    print(f"✅ Сохранено {len(batches)} страниц вакансий")
+
+
+def test_benchmark_against_fake_hh():
+    """Бенчмарк проходит против локальной замены hh.ru с ответами 429"""
+    fake = FakeHH(found=250, throttle_rate=0.3, retry_after=0, seed=1)
+    report = asyncio.run(run_benchmark(fake, users=4, requests=2, queries=2, max_results=250))
+    assert report["searches"] == 8
+    assert report["failures"] == 0
+    assert report["hh_metrics"]["throttled_responses"] == fake.statuses[429] > 0
+    assert report["p50_ms"] <= report["p95_ms"] <= report["p99_ms"]
+    print(f"✅ Бенчмарк: {report['throughput_rps']} поисков/с, p95 {report['p95_ms']} мс")
+
+
+if __name__ == "__main__":
+    test_fetch_all_pages()
+    test_fetch_respects_limit()
+    test_unknown_city()
+    test_concurrent_requests_coalesced()
+    test_equivalent_filters_share_fingerprint()
+    test_retry_on_throttling()
+    test_retry_on_truncated_json()
+    test_iter_vacancies_streams_pages()
+    test_finished_search_keeps_newer_inflight()
+    test_vacancy_details_batch_and_cache()
+    test_incremental_search_uses_watermark()
+    test_full_refresh_after_interval()
+    test_persistent_cache_survives_restart()
+    test_warm_up_keeps_remaining_ttl()
+    test_fetched_pages_ingested_in_batches()
+    test_benchmark_against_fake_hh()
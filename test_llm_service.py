@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Тестирование генерации документов LLM без БД и живого API
+"""
+import asyncio
+
+from services import llm_service
+from services.vacancy import Vacancy
+
+
+def test_regenerate_bypasses_saved_document():
+    """Сохранённый документ отдаётся повторно, а regenerate пишет новый и заменяет его"""
+    documents = {}
+    calls = []
+
+    async def get_document(telegram_id, vacancy_id, kind, input_hash):
+        return documents.get((telegram_id, vacancy_id, kind, input_hash))
+
+    async def save_document(telegram_id, vacancy_id, kind, input_hash, model, content):
+        documents[(telegram_id, vacancy_id, kind, input_hash)] = content
+
+    async def call_llm(prompt, settings):
+        calls.append(prompt)
+        return f"версия {len(calls)}"
+
+    vacancy = Vacancy(
+        id="1", name="Python-разработчик", employer_name="Компания", area_name="Москва",
+        alternate_url="https://hh.ru/vacancy/1",
+    )
+    user = {"telegram_id": 42, "full_name": "Иван", "skills": "Python"}
+    settings = {"api_key": "key", "model": "test"}
+
+    async def run():
+        first = await llm_service.generate_resume(vacancy, user, settings)
+        cached = await llm_service.generate_resume(vacancy, user, settings)
+        fresh = await llm_service.generate_resume(vacancy, user, settings, regenerate=True)
+        after = await llm_service.generate_resume(vacancy, user, settings)
+        return first, cached, fresh, after
+
+    saved = {
+        name: getattr(llm_service, name)
+        for name in ("get_generated_document", "save_generated_document", "_call_llm")
+    }
+    llm_service.get_generated_document = get_document
+    llm_service.save_generated_document = save_document
+    llm_service._call_llm = call_llm
+    try:
+        first, cached, fresh, after = asyncio.run(run())
+    finally:
+        for name, value in saved.items():
+            setattr(llm_service, name, value)
+
+    assert (first, cached) == ("версия 1", "версия 1")
+    assert fresh == "версия 2"
+    assert after == "версия 2"
+    assert len(calls) == 2
+    print("✅ Документ можно сгенерировать заново в обход сохранённого")
+
+
+if __name__ == "__main__":
+    test_regenerate_bypasses_saved_document()
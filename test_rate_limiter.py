@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Тестирование token bucket для запросов к hh.ru
+"""
+from services.rate_limiter import TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_burst_then_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=3, clock=clock)
+    # Запас burst выдаётся без ожидания
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    # Дальше — по 0.5 секунды на токен, ожидающие выстраиваются в очередь
+    assert bucket.reserve() == 0.5
+    assert bucket.reserve() == 1.0
+
+    clock.now = 10
+    assert bucket.reserve() == 0.0
+    assert bucket.stats()["waits"] == 2
+    print("✅ Burst и скорость соблюдаются")
+
+
+def test_pause():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=100, capacity=10, clock=clock)
+    bucket.pause(5)
+    # Первый токен появляется через 1/rate после конца паузы
+    assert abs(bucket.reserve() - 5.01) < 1e-9
+    clock.now = 6
+    assert bucket.reserve() == 0.0
+    print("✅ Пауза по Retry-After блокирует выдачу токенов")
+
+
+def test_no_burst_after_pause():
+    """После паузы ожидающие идут с интервалом 1/rate, а не разом"""
+    clock = FakeClock()
+    bucket = TokenBucket(rate=10, capacity=20, clock=clock)
+    bucket.pause(5)
+    delays = [bucket.reserve() for _ in range(100)]
+    assert delays[0] >= 5.0
+    gaps = [b - a for a, b in zip(delays, delays[1:])]
+    assert all(abs(gap - 0.1) < 1e-9 for gap in gaps)
+
+    # Пауза посреди работы тоже сжигает накопленный запас
+    clock.now = 100
+    assert bucket.reserve() == 0.0
+    bucket.pause(1)
+    assert abs(bucket.reserve() - 1.1) < 1e-9
+    assert abs(bucket.wait_time() - 1.2) < 1e-9
+    print("✅ После паузы нет залпа запросов")
+
+
+if __name__ == "__main__":
+    test_burst_then_rate()
+    test_pause()
+    test_no_burst_after_pause()
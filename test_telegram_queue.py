@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Тестирование очереди исходящих сообщений Telegram
+"""
+import asyncio
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from services.telegram_queue import BULK, INTERACTIVE, OutboundQueue
+
+
+def test_chat_order_and_pacing():
+    """Сообщения одного чата уходят по порядку и не чаще лимита чата"""
+    sent = []
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        queue = OutboundQueue(global_rate=1000, global_burst=1000, chat_rate=20, chat_burst=1, workers=4)
+
+        async def send(text):
+            sent.append((text, loop.time()))
+
+        await asyncio.gather(*(queue.submit(1, lambda i=i: send(i)) for i in range(4)))
+        await queue.stop()
+        return queue.stats()
+
+    stats = asyncio.run(run())
+    assert [text for text, _ in sent] == [0, 1, 2, 3]
+    gaps = [b - a for (_, a), (_, b) in zip(sent, sent[1:])]
+    assert all(gap >= 0.04 for gap in gaps)
+    assert stats["sent"] == 4
+    # Ожидание лимита чата не расходует токены общего bucket
+    assert stats["rate_limiter"]["acquired"] == 4
+    assert stats["pending"] == {"interactive": 0, "bulk": 0}
+    print("✅ Порядок и темп сообщений в чате соблюдаются")
+
+
+def test_interactive_ahead_of_bulk():
+    """Ответ пользователю обгоняет уже стоящую в очереди рассылку"""
+    sent = []
+
+    async def run():
+        queue = OutboundQueue(global_rate=200, global_burst=1, workers=2)
+
+        async def send(label):
+            sent.append(label)
+
+        bulk = [queue.submit(chat_id, lambda c=chat_id: send(f"bulk {c}"), BULK) for chat_id in range(100, 130)]
+        await asyncio.sleep(0.02)
+        await queue.submit(1, lambda: send("reply"), INTERACTIVE)
+        await asyncio.gather(*bulk)
+        await queue.stop()
+
+    asyncio.run(run())
+    assert len(sent) == 31
+    assert sent.index("reply") < 10
+    print("✅ Интерактивные ответы идут раньше рассылки")
+
+
+def test_retry_after():
+    """После TelegramRetryAfter сообщение повторяется, а не теряется"""
+    attempts = []
+
+    async def run():
+        queue = OutboundQueue(global_rate=1000, global_burst=1000)
+
+        async def send():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise TelegramRetryAfter(method=SendMessage(chat_id=1, text="x"), message="Flood", retry_after=0)
+            return "ok"
+
+        result = await queue.submit(1, send)
+        await queue.stop()
+        return result, queue.stats()
+
+    result, stats = asyncio.run(run())
+    assert result == "ok"
+    assert len(attempts) == 2
+    assert stats["retries"] == 1 and stats["failed"] == 0
+    print("✅ Сообщение отправлено повторно после RetryAfter")
+
+
+def test_retry_after_pauses_all_chats():
+    """Flood wait приостанавливает отправку во все чаты, а не только в один"""
+    sent = []
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        queue = OutboundQueue(global_rate=1000, global_burst=1000, workers=1)
+        started = loop.time()
+
+        async def send(chat_id):
+            if chat_id == 1 and not sent:
+                sent.append((chat_id, None))
+                raise TelegramRetryAfter(method=SendMessage(chat_id=1, text="x"), message="Flood", retry_after=1)
+            sent.append((chat_id, loop.time() - started))
+
+        await asyncio.gather(queue.submit(1, lambda: send(1)), queue.submit(2, lambda: send(2)))
+        await queue.stop()
+
+    asyncio.run(run())
+    assert all(elapsed >= 0.9 for _, elapsed in sent[1:])
+    assert sorted(chat_id for chat_id, _ in sent[1:]) == [1, 2]
+    print("✅ После RetryAfter ждут все чаты")
+
+
+if __name__ == "__main__":
+    test_chat_order_and_pacing()
+    test_interactive_ahead_of_bulk()
+    test_retry_after()
+    test_retry_after_pauses_all_chats()
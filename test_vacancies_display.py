@@ -3,9 +3,11 @@
 Тестирование отображения вакансий в виде компактных карточек
 """
 from handlers.vacancies import format_vacancy
+from services.vacancy import Vacancy
 
-# Тестовые данные вакансии
-test_vacancy = {
+# Тестовые данные вакансии в формате ответа hh.ru
+test_vacancy = Vacancy.from_hh({
+    "id": "123",
     "name": "Python-разработчик",
     "employer": {
         "name": "IT Company"
@@ -19,7 +21,7 @@ test_vacancy = {
         "currency": "RUR"
     },
     "alternate_url": "https://example.com/vacancy/123"
-}
+})
 
 def test_vacancy_formatting():
     """Тестируем форматирование вакансии"""
@@ -38,7 +40,8 @@ def test_vacancy_formatting():
     print("✅ Все иконки присутствуют в карточке вакансии")
     
     # Тест с разными вариантами зарплаты
-    vacancy_no_salary = {
+    vacancy_no_salary = Vacancy.from_hh({
+        "id": "124",
         "name": "Стажер-разработчик",
         "employer": {
             "name": "Маленькая компания"
@@ -48,13 +51,14 @@ def test_vacancy_formatting():
         },
         "salary": None,
         "alternate_url": "https://example.com/vacancy/124"
-    }
+    })
     
     result2 = format_vacancy(vacancy_no_salary, 0, 0)
     print("Вакансия без зарплаты:")
     print(result2)
     
-    vacancy_with_min_salary = {
+    vacancy_with_min_salary = Vacancy.from_hh({
+        "id": "125",
         "name": "Junior Python-разработчик",
         "employer": {
             "name": "Стартап"
@@ -68,7 +72,7 @@ def test_vacancy_formatting():
             "currency": "RUR"
         },
         "alternate_url": "https://example.com/vacancy/125"
-    }
+    })
     
     result3 = format_vacancy(vacancy_with_min_salary, 0, 0)
     print("Вакансия с минимальной зарплатой:")